@@ -0,0 +1,92 @@
+"""
+Authenticate and rate limit 10k requests of a cached user
+with fastapi-limiter's RateLimiter + Auth.get_current_user (one round trip each;
+only when fastapi-limiter is installed)
+and with RateLimitedUser (one Lua script). Uses the Redis from the settings, or fakeredis when it is down,
+in which case the timings leave out the network and only the round trip counts are meaningful.
+
+    python -m benchmarks.bench_auth_rate_limit [count]
+"""
+import asyncio
+import pickle
+import sys
+import time
+
+import fakeredis
+import redis
+import redis.asyncio as aioredis
+from starlette.requests import Request
+from starlette.responses import Response
+
+from main import app
+from src.config.config import config
+from src.entity.models import User
+from src.services.auth import auth_service, RateLimitedUser
+from src.services.rate_limit import limiter
+
+try:
+    from fastapi_limiter import FastAPILimiter
+    from fastapi_limiter.depends import RateLimiter
+except ImportError:  # the app does not depend on it any more, pip install fastapi-limiter to compare
+    FastAPILimiter = None
+
+
+class RoundTrips:
+    """Counts the commands sent by a client."""
+    def __init__(self, client):
+        self.count = 0
+        execute_command = client.execute_command
+
+        async def counted(*args, **kwargs):
+            self.count += 1
+            return await execute_command(*args, **kwargs)
+        client.execute_command = counted
+
+
+def client():
+    options = dict(host=config.REDIS_DOMAIN, port=config.REDIS_PORT, password=config.REDIS_PASSWORD)
+    try:
+        redis.Redis(**options).ping()
+        return aioredis.Redis(**options), "redis"
+    except redis.RedisError:
+        return fakeredis.aioredis.FakeRedis(), "fakeredis"
+
+
+async def main(count: int):
+    async_client, backend = client()
+    user = User(id=1, username="bench", email="bench@mail.com", password="x", confirmed=True, avatar="")
+    token = await auth_service.create_access_token(data={"sub": user.email})
+    await async_client.set(user.email, pickle.dumps(user))
+    request = Request({"type": "http", "app": app, "method": "GET", "path": "/api/contacts/",
+                       "client": ("127.0.0.1", 5000), "headers": []})
+    config.RATE_LIMIT_TIERS["user"] = f"{count * 2}/60"
+
+    limiter.redis = async_client
+    async_trips = RoundTrips(async_client)
+    if FastAPILimiter is None:
+        print("fastapi-limiter: skipped, it is not installed")
+    else:
+        await FastAPILimiter.init(async_client)
+        rate_limiter = RateLimiter(times=count * 2, seconds=60)
+        start = time.perf_counter()
+        for _ in range(count):
+            await rate_limiter(request, Response())
+            await auth_service.get_current_user(token, db=None)
+        elapsed = time.perf_counter() - start
+        trips = async_trips.count / count
+        print(f"{backend} RateLimiter + get_current_user: {elapsed / count * 1e6:8.1f} us/request, "
+              f"{trips:.1f} round trips")
+
+    dependency = RateLimitedUser("contacts:list")
+    await dependency.resolve(token, db=None)
+    async_trips.count = 0
+    start = time.perf_counter()
+    for _ in range(count):
+        await dependency.resolve(token, db=None)
+    elapsed = time.perf_counter() - start
+    print(f"{backend} RateLimitedUser:                 {elapsed / count * 1e6:8.1f} us/request, "
+          f"{async_trips.count / count:.1f} round trips")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000))
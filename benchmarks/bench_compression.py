@@ -0,0 +1,59 @@
+"""
+Size of a page of contacts gzipped (and brotli-compressed when brotli is installed), the time to compress it
+and the longest event loop stall while a batch of pages is compressed inline and on worker threads.
+
+    python -m benchmarks.bench_compression [page size] [concurrent requests]
+"""
+import asyncio
+import sys
+import time
+
+import anyio.to_thread
+
+from benchmarks.bench_contact_list import make_contacts
+from src.routres.contacts import render_contacts
+from src.services import compression
+
+
+async def heartbeat(stop: asyncio.Event) -> float:
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        worst = max(worst, time.perf_counter() - start - 0.001)
+    return worst
+
+
+async def stall(body: bytes, requests: int, threaded: bool) -> float:
+    async def one():
+        if threaded:
+            await anyio.to_thread.run_sync(compression.compress, body, "gzip")
+        else:
+            compression.compress(body, "gzip")
+        await asyncio.sleep(0)
+
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(heartbeat(stop))
+    await asyncio.sleep(0.01)
+    await asyncio.gather(*(one() for _ in range(requests)))
+    stop.set()
+    return await monitor
+
+
+async def main(size: int, requests: int):
+    body = render_contacts(make_contacts(size))
+    print(f"{'identity':>9}: {len(body):8d} bytes")
+    for encoding in ("gzip", "br") if compression.brotli is not None else ("gzip",):
+        start = time.perf_counter()
+        compressed = compression.compress(body, encoding)
+        elapsed = time.perf_counter() - start
+        print(f"{encoding:>9}: {len(compressed):8d} bytes in {elapsed * 1000:6.2f} ms")
+    for name, threaded in (("inline", False), ("thread", True)):
+        worst = await stall(body, requests, threaded)
+        print(f"{name:>9}: longest event loop stall {worst * 1000:6.2f} ms over {requests} pages")
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    asyncio.run(main(size, requests))
@@ -0,0 +1,67 @@
+"""
+CPU time to turn a page of Contact rows into a response body with FastAPI's response_model path
+(validate through list[ContactResponse] with EmailStr, dump to dicts, json.dumps) and with render_contacts,
+the prebuilt TypeAdapter and orjson the contact routes use.
+
+    python -m benchmarks.bench_contact_list [page size] [requests]
+"""
+import asyncio
+import sys
+import time
+from datetime import date, datetime
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import EmailStr
+
+from src.entity.models import Contact, User
+from src.routres.contacts import render_contacts
+from src.schemas.contact import ContactResponse
+
+
+class EmailContactResponse(ContactResponse):
+    """ContactResponse as it was, re-validating the stored email of every contact."""
+    email: EmailStr
+
+
+def make_contacts(count: int) -> list[Contact]:
+    user = User(id=1, username="user", email="user@mail.com", password="x", avatar="avatar", confirmed=True)
+    now = datetime.now()
+    return [Contact(id=i, name=f"name_{i}", surname=f"surname_{i}", phone_number="+380501111111",
+                    email=f"contact{i}@mail.com", birthday=date(1990, 1, 1 + i % 28), notes="note",
+                    created_at=now, updated_at=now, user=user)
+            for i in range(count)]
+
+
+async def response_model_path(field, contacts: list[Contact]) -> bytes:
+    content = await serialize_response(field=field, response_content=contacts, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def adapter_path(field, contacts: list[Contact]) -> bytes:
+    return render_contacts(contacts)
+
+
+async def run(path, field, contacts: list[Contact], requests: int) -> float:
+    await path(field, contacts)
+    start = time.process_time()
+    for _ in range(requests):
+        await path(field, contacts)
+    return (time.process_time() - start) / requests
+
+
+async def main(size: int, requests: int):
+    contacts = make_contacts(size)
+    for name, path, schema in (("response_model + EmailStr", response_model_path, EmailContactResponse),
+                               ("response_model", response_model_path, ContactResponse),
+                               ("render_contacts", adapter_path, ContactResponse)):
+        field = create_response_field(name="response", type_=list[schema])
+        cpu = await run(path, field, contacts, requests)
+        print(f"{name:>26}: {cpu * 1000:7.2f} ms CPU per request of {size} contacts")
+
+
+if __name__ == "__main__":
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    requests = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    asyncio.run(main(size, requests))
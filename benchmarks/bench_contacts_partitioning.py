@@ -0,0 +1,143 @@
+"""
+Fill the hash-partitioned contacts table and measure the per-user queries on it.
+
+Rows are generated on the server with generate_series in chunks of --chunk rows,
+one transaction per chunk, so a 100M-row fill streams at disk speed and can be
+resumed: already loaded rows are counted and skipped. Postgres only.
+
+    python -m benchmarks.bench_contacts_partitioning fill --rows 100000000 --users 1000000
+    python -m benchmarks.bench_contacts_partitioning bench --queries 2000
+    python -m benchmarks.bench_contacts_partitioning maintenance
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from src.database.db import sessionmanager
+from src.repository import contacts as repository_contacts
+from src.entity.models import User
+from src.services.auth import auth_service
+
+
+FILL_USERS = text("""
+    INSERT INTO users (id, username, email, password, avatar, confirmed, created_at, updated_at)
+    SELECT g, 'user_' || g, 'user_' || g || '@bench.local', :password, 'https://www.gravatar.com/avatar/', true,
+           now(), now()
+    FROM generate_series(:start, :stop) AS g
+    ON CONFLICT (id) DO NOTHING
+""")
+
+FILL_CONTACTS = text("""
+    INSERT INTO contacts (name, surname, phone_number, email, birthday, notes, created_at, updated_at, user_id)
+    SELECT 'name_' || (random() * 1000)::int,
+           'surname_' || (random() * 5000)::int,
+           '+380' || lpad((random() * 999999999)::bigint::text, 9, '0'),
+           'contact_' || g || '@bench.local',
+           date '1950-01-01' + (random() * 20000)::int,
+           '',
+           now(), now(),
+           1 + (g % :users)
+    FROM generate_series(:start, :stop) AS g
+""")
+
+
+async def fill(rows: int, users: int, chunk: int):
+    password = auth_service.get_password_hash("bench1")
+    async with sessionmanager.session() as db:
+        for start in range(1, users + 1, chunk):
+            await db.execute(FILL_USERS, {"password": password, "start": start, "stop": min(start + chunk - 1, users)})
+            await db.commit()
+        await db.execute(text("SELECT setval('users_id_seq', (SELECT max(id) FROM users))"))
+        await db.commit()
+        loaded = (await db.execute(text("SELECT count(*) FROM contacts WHERE email LIKE 'contact_%@bench.local'"))).scalar()
+    print(f"{users} users, {loaded} contacts already loaded")
+    started = time.perf_counter()
+    for start in range(loaded + 1, rows + 1, chunk):
+        stop = min(start + chunk - 1, rows)
+        async with sessionmanager.session() as db:
+            await db.execute(FILL_CONTACTS, {"users": users, "start": start, "stop": stop})
+            await db.commit()
+        rate = (stop - loaded) / (time.perf_counter() - started)
+        print(f"{stop}/{rows} contacts, {rate:,.0f} rows/s")
+    await maintenance(analyze=True)
+
+
+async def explain(db, stmt, params: dict) -> dict:
+    sql = str(stmt.params(**params).compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    plan = (await db.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}"))).scalar()
+    plan = plan if isinstance(plan, list) else json.loads(plan)
+    scanned = set()
+
+    def walk(node):
+        if "contacts_p" in node.get("Relation Name", ""):
+            scanned.add(node["Relation Name"])
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan[0]["Plan"])
+    return {"partitions_scanned": sorted(scanned), "execution_ms": plan[0]["Execution Time"]}
+
+
+async def bench(queries: int):
+    async with sessionmanager.session() as db:
+        max_user = (await db.execute(text("SELECT max(user_id) FROM contacts"))).scalar()
+        user = User(id=random.randint(1, max_user))
+        print("get_contacts plan:", await explain(db, repository_contacts._get_contacts_stmt,
+                                                  {"user_id": user.id, "offset": 0, "limit": 50}))
+        timings = {"get_contacts": [], "get_contact": [], "search_contact_by_name": []}
+        for _ in range(queries):
+            user = User(id=random.randint(1, max_user))
+            start = time.perf_counter()
+            contacts = await repository_contacts.get_contacts(50, 0, db, user)
+            timings["get_contacts"].append(time.perf_counter() - start)
+            if not contacts:
+                continue
+            start = time.perf_counter()
+            await repository_contacts.get_contact(contacts[0].id, db, user)
+            timings["get_contact"].append(time.perf_counter() - start)
+            start = time.perf_counter()
+            await repository_contacts.search_contact_by_name(contacts[0].name, db, user)
+            timings["search_contact_by_name"].append(time.perf_counter() - start)
+            db.expunge_all()
+    for name, values in timings.items():
+        q = statistics.quantiles([v * 1000 for v in values], n=100)
+        print(f"{name:>24}: p50 {q[49]:.2f} ms  p95 {q[94]:.2f} ms  p99 {q[98]:.2f} ms  ({len(values)} calls)")
+
+
+async def maintenance(analyze: bool = False):
+    async with sessionmanager._engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        if analyze:
+            await conn.execute(text("VACUUM (ANALYZE) contacts"))
+        rows = await conn.execute(text("""
+            SELECT relname, n_live_tup, n_dead_tup, pg_size_pretty(pg_total_relation_size(relid)),
+                   last_autovacuum, last_autoanalyze
+            FROM pg_stat_user_tables WHERE relname LIKE 'contacts_p%' ORDER BY relname
+        """))
+        for row in rows:
+            print(*row, sep="  ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    fill_parser = commands.add_parser("fill")
+    fill_parser.add_argument("--rows", type=int, default=100_000_000)
+    fill_parser.add_argument("--users", type=int, default=1_000_000)
+    fill_parser.add_argument("--chunk", type=int, default=1_000_000)
+    bench_parser = commands.add_parser("bench")
+    bench_parser.add_argument("--queries", type=int, default=2000)
+    commands.add_parser("maintenance")
+    args = parser.parse_args()
+    if args.command == "fill":
+        asyncio.run(fill(args.rows, args.users, args.chunk))
+    elif args.command == "bench":
+        asyncio.run(bench(args.queries))
+    else:
+        asyncio.run(maintenance())
@@ -0,0 +1,36 @@
+"""
+Render 10k verification emails with the shared precompiled environment
+and with the per-call environment fastapi-mail builds from ``TEMPLATE_FOLDER``.
+
+    python -m benchmarks.bench_email_render [count]
+"""
+import sys
+import time
+
+from src.services.auth import auth_service
+from src.services.email import mail_config, render_verify_email
+
+
+HOST = "http://127.0.0.1:8000/"
+
+
+def render_fastapi_mail(email: str, username: str, host: str) -> str:
+    token = auth_service.create_email_token({"sub": email})
+    template = mail_config().template_engine().get_template("verify_email.html")
+    return template.render(host=host, username=username, token=token,
+                           confirm_url=f"{host}api/auth/confirmed_email/",
+                           static_url=f"{host}static/")
+
+
+def run(render, count: int) -> float:
+    start = time.perf_counter()
+    for i in range(count):
+        render(f"user{i}@mail.com", f"user_{i}", HOST)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    for name, render in (("fastapi-mail", render_fastapi_mail), ("precompiled", render_verify_email)):
+        elapsed = run(render, count)
+        print(f"{name:>13}: {count} emails in {elapsed:.3f}s ({elapsed / count * 1e6:.1f} us/email)")
@@ -0,0 +1,45 @@
+"""
+Per-request cost of MetricsMiddleware: an ASGI request to a trivial app with and without the middleware.
+
+    python -m benchmarks.bench_metrics [requests]
+"""
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+
+from src.services.metrics import MetricsMiddleware
+
+
+async def app(scope, receive, send):
+    scope["route"] = SimpleNamespace(path="/api/contacts/")
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"[]"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def run(asgi, requests: int) -> float:
+    scope = {"type": "http", "method": "GET", "path": "/api/contacts/"}
+    start = time.perf_counter()
+    for _ in range(requests):
+        await asgi(dict(scope), receive, send)
+    return (time.perf_counter() - start) / requests
+
+
+async def main(requests: int):
+    bare = await run(app, requests)
+    metered = await run(MetricsMiddleware(app), requests)
+    print(f"without metrics: {bare * 1e6:6.2f} us per request")
+    print(f"   with metrics: {metered * 1e6:6.2f} us per request (+{(metered - bare) * 1e6:.2f} us)")
+
+
+if __name__ == "__main__":
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    asyncio.run(main(requests))
@@ -0,0 +1,71 @@
+"""
+Per-call CPU time of the hot repository queries on in-memory SQLite, compared
+with building the same statement with select(...).filter_by(...) on every call.
+
+    python -m benchmarks.bench_repository_queries [calls] [contacts]
+"""
+import asyncio
+import sys
+import time
+from datetime import date
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from src.entity.models import Base, Contact, User
+from src.repository import contacts as repository_contacts
+from src.repository import users as repository_users
+
+
+async def adhoc_get_contact(contact_id, db, user):
+    result = await db.execute(select(Contact).filter_by(id=contact_id, user=user))
+    return result.scalar_one_or_none()
+
+
+async def adhoc_get_user_by_email(email, db):
+    result = await db.execute(select(User).filter_by(email=email))
+    return result.scalar_one_or_none()
+
+
+async def adhoc_get_contacts(limit, offset, db, user):
+    result = await db.execute(select(Contact).filter_by(user=user).offset(offset).limit(limit))
+    return result.scalars().all()
+
+
+async def measure(name: str, call, calls: int):
+    await call()
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(calls):
+        await call()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    print(f"{name:>32}: {cpu / calls * 1e6:8.1f} us CPU/call {wall / calls * 1e6:8.1f} us wall/call")
+
+
+async def main(calls: int, contacts: int):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_maker() as db:
+        user = User(username="bench", email="bench@mail.com", password="secret", confirmed=True)
+        db.add(user)
+        db.add_all(Contact(name=f"name_{i}", surname=f"surname_{i}", phone_number="+380500000000",
+                           email=f"contact_{i}@mail.com", birthday=date(1990, 1 + i % 12, 1 + i % 28),
+                           notes="", user=user) for i in range(contacts))
+        await db.commit()
+        contact_id = 1
+        for label, get_contact, get_user, get_contacts in (
+                ("filter_by per call", adhoc_get_contact, adhoc_get_user_by_email, adhoc_get_contacts),
+                ("cached statement", repository_contacts.get_contact, repository_users.get_user_by_email,
+                 repository_contacts.get_contacts)):
+            print(label)
+            await measure("get_contact", lambda: get_contact(contact_id, db, user), calls)
+            await measure("get_user_by_email", lambda: get_user(user.email, db), calls)
+            await measure("get_contacts(limit=10)", lambda: get_contacts(10, 0, db, user), calls)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    contacts = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    asyncio.run(main(calls, contacts))
@@ -0,0 +1,78 @@
+"""
+Requests per second of the production server (gunicorn.conf.py) with 1 worker and with N workers.
+Each run starts gunicorn on a free port, keeps `concurrency` requests in flight for `seconds`
+and stops it. The contacts endpoints need the database and Redis of .env and an access token;
+rate limiting is switched off for the runs.
+
+    python -m benchmarks.bench_server [workers] [seconds] [concurrency] [token]
+"""
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers: int, port: int, env: dict | None = None) -> subprocess.Popen:
+    env = {**os.environ, "SERVER_WORKERS": str(workers), "SERVER_HOST": "127.0.0.1", "SERVER_PORT": str(port),
+           "RATE_LIMIT_ENABLED": "false", "LOG_LEVEL": "WARNING", **(env or {})}
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "main:app", "--log-level", "warning"],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/livez").status_code == 200:
+                return server
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("server did not start")
+
+
+async def load(url: str, headers: dict, seconds: float, concurrency: int) -> tuple[int, int]:
+    done = errors = 0
+    deadline = time.monotonic() + seconds
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(headers=headers, limits=limits) as client:
+        async def worker():
+            nonlocal done, errors
+            while time.monotonic() < deadline:
+                response = await client.get(url)
+                done += 1
+                errors += response.status_code >= 400
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return done, errors
+
+
+def main(workers: int, seconds: float, concurrency: int, token: str | None):
+    paths = ["/livez"] + (["/api/contacts/?limit=100", "/api/contacts/birthday?n=7"] if token else [])
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    for count in sorted({1, workers}):
+        port = free_port()
+        server = start_server(count, port)
+        try:
+            for path in paths:
+                done, errors = asyncio.run(load(f"http://127.0.0.1:{port}{path}", headers, seconds, concurrency))
+                print(f"{count:2d} worker(s) {path:28} {done / seconds:8.0f} req/s  {errors} errors")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    token = sys.argv[4] if len(sys.argv) > 4 else None
+    main(workers, seconds, concurrency, token)
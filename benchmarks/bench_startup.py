@@ -0,0 +1,50 @@
+"""
+Time a cold import of the application and one lifespan start/stop, the work a worker does before
+it can serve its first request, and list its slowest direct imports.
+
+    python -m benchmarks.bench_startup [runs]
+"""
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def cold_import() -> float:
+    code = "import time; start = time.perf_counter(); import main; print(time.perf_counter() - start)"
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(count: int = 10) -> list[tuple[int, str]]:
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            capture_output=True, text=True, check=True)
+    imports = []
+    for line in result.stderr.splitlines()[1:]:
+        _, cumulative, name = line.split("|")
+        # direct imports of main are indented one level below it
+        if name.startswith("   ") and not name.startswith("    "):
+            imports.append((int(cumulative), name.strip()))
+    return sorted(imports, reverse=True)[:count]
+
+
+async def lifespan() -> float:
+    from main import app
+
+    start = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        pass
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    os.environ.setdefault("PYTHONPATH", os.getcwd())
+    imports = [cold_import() for _ in range(runs)]
+    print(f"import main: median {statistics.median(imports) * 1000:.1f} ms over {runs} runs")
+    print(f"lifespan start/stop: {asyncio.run(lifespan()) * 1000:.1f} ms")
+    print("slowest imports of main (cumulative):")
+    for cumulative, name in slowest_imports():
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
@@ -0,0 +1,44 @@
+"""
+Cost of a traced call: an async function called bare, traced with tracing disabled and traced with tracing enabled
+into the in-memory exporter.
+
+    python -m benchmarks.bench_tracing [calls]
+"""
+import asyncio
+import sys
+import time
+from types import SimpleNamespace
+
+from src.services.tracing import InMemoryExporter, traced, tracer
+
+
+async def get_contact(contact_id: int, db, user):
+    return contact_id
+
+
+traced_get_contact = traced(attributes=("contact_id", "user.id"))(get_contact)
+
+
+async def run(func, calls: int) -> float:
+    user = SimpleNamespace(id=1)
+    start = time.perf_counter()
+    for _ in range(calls):
+        await func(1, None, user)
+    return (time.perf_counter() - start) / calls
+
+
+async def main(calls: int):
+    tracer.exporter = InMemoryExporter()
+    bare = await run(get_contact, calls)
+    tracer.disable()
+    disabled = await run(traced_get_contact, calls)
+    tracer.enable()
+    enabled = await run(traced_get_contact, calls)
+    print(f"       bare: {bare * 1e9:8.0f} ns per call")
+    print(f"tracing off: {disabled * 1e9:8.0f} ns per call (+{(disabled - bare) * 1e9:.0f} ns)")
+    print(f" tracing on: {enabled * 1e9:8.0f} ns per call (+{(enabled - bare) * 1e9:.0f} ns)")
+
+
+if __name__ == "__main__":
+    calls = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    asyncio.run(main(calls))
@@ -0,0 +1,24 @@
+import os
+
+import pytest
+
+
+# the bench_*.py scripts are run with python -m, only the test_*.py suites are collected
+collect_ignore_glob = ["bench_*.py", "loadtest.py"]
+
+BASELINES = os.path.join(os.path.dirname(__file__), "baselines")
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("dataset", "size of the data the hot paths are benchmarked on")
+    group.addoption("--dataset-users", type=int, default=10,
+                    help="users in the database besides the benchmarked one (default: %(default)s)")
+    group.addoption("--dataset-contacts", type=int, default=1000,
+                    help="contacts of every user (default: %(default)s)")
+
+
+@pytest.hookimpl(tryfirst=True)
+def pytest_configure(config):
+    # saved runs go next to the suite instead of ./.benchmarks, so baselines are found from any directory
+    if config.getoption("benchmark_storage", None) == "file://./.benchmarks":
+        config.option.benchmark_storage = f"file://{BASELINES}"
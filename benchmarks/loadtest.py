@@ -0,0 +1,326 @@
+"""
+Load test with the traffic mix of the contact book: login, token refresh, /users/me, contacts CRUD,
+search and birthday queries. Every virtual user logs in once and then picks requests by weight
+until the time is up. Reports throughput and p50/p95/p99 latency per endpoint.
+
+By default the application runs in this process on SQLite (loadtest.db) with an in-memory Redis stand-in,
+so no service is needed. --serve N starts gunicorn with N workers on the database and Redis of .env,
+--url targets a server that is already running. Users and their contacts are seeded into DB_URL first,
+so with --url the server must use the same database.
+
+The 1/20s rate limits would answer most requests with 429: --rate-limit off (default) switches limiting off,
+--rate-limit 100/1 gives every tier that quota. With --url the server keeps its own settings,
+start it with RATE_LIMIT_ENABLED=false to compare releases.
+
+    python -m benchmarks.loadtest --users 20 --seconds 30
+    python -m benchmarks.loadtest --serve 4 --seconds 60 --json release.json
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000 --compare release.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+import httpx
+
+
+PASSWORD = "loadtest-password"
+NAMES = ["Olena", "Taras", "Iryna", "Andrii", "Sofiia", "Dmytro", "Mariia", "Bohdan", "Oksana", "Yurii"]
+SURNAMES = ["Shevchenko", "Kovalenko", "Bondarenko", "Tkachenko", "Kravchenko", "Oliinyk", "Melnyk", "Lysenko"]
+
+# endpoint label: weight in the mix
+MIX = {"POST /api/auth/login": 2,
+       "GET /api/auth/refresh_token": 2,
+       "GET /api/users/me": 10,
+       "GET /api/contacts/": 20,
+       "GET /api/contacts/{contact_id}": 15,
+       "POST /api/contacts/": 5,
+       "PUT /api/contacts/{contact_id}": 5,
+       "DELETE /api/contacts/{contact_id}": 3,
+       "GET /api/contacts/name": 8,
+       "GET /api/contacts/surname": 5,
+       "GET /api/contacts/email": 5,
+       "GET /api/contacts/birthday": 8}
+
+
+def user_email(i: int) -> str:
+    return f"loadtest{i}@example.com"
+
+
+def fake_contact(rng: random.Random) -> dict:
+    name, surname = rng.choice(NAMES), rng.choice(SURNAMES)
+    return {"name": name, "surname": surname,
+            "phone_number": f"+38050{rng.randrange(10 ** 7):07d}",
+            "email": f"{name.lower()}.{surname.lower()}{rng.randrange(10 ** 6)}@example.com",
+            "birthday": (date(1970, 1, 1) + timedelta(days=rng.randrange(365 * 40))).isoformat(),
+            "notes": "seeded by the load test"}
+
+
+async def seed(users: int, contacts: int) -> None:
+    """
+    The seed function creates the confirmed load test users and their contacts, skipping the users that exist.
+        SQLite databases get their tables created, Postgres is expected to be migrated.
+    """
+    from sqlalchemy import select
+
+    from src.database.db import sessionmanager
+    from src.entity.models import Base, Contact, User
+    from src.services.auth import auth_service
+
+    if sessionmanager._engine.url.get_backend_name() == "sqlite":
+        async with sessionmanager._engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+    rng = random.Random(0)
+    password = auth_service.get_password_hash(PASSWORD)
+    async with sessionmanager.session() as session:
+        existing = set(await session.scalars(select(User.email).where(User.email.like("loadtest%@example.com"))))
+        for i in range(users):
+            if user_email(i) in existing:
+                continue
+            user = User(username=f"loadtest{i}", email=user_email(i), password=password,
+                        avatar="https://www.gravatar.com/avatar/", confirmed=True)
+            session.add(user)
+            await session.flush()
+            for _ in range(contacts):
+                data = fake_contact(rng)
+                data["birthday"] = date.fromisoformat(data["birthday"])
+                session.add(Contact(**data, user_id=user.id))
+        await session.commit()
+
+
+class Stats:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    def record(self, endpoint: str, latency: float, ok: bool) -> None:
+        self.latencies[endpoint].append(latency)
+        if not ok:
+            self.errors[endpoint] += 1
+
+    @staticmethod
+    def percentile(values: list[float], p: float) -> float:
+        return values[max(0, math.ceil(p * len(values)) - 1)]
+
+    def report(self, seconds: float) -> dict[str, dict]:
+        report = {}
+        for endpoint in sorted(self.latencies, key=lambda e: -len(self.latencies[e])):
+            values = sorted(self.latencies[endpoint])
+            report[endpoint] = {"requests": len(values), "errors": self.errors[endpoint],
+                                "rps": round(len(values) / seconds, 2),
+                                **{f"p{p}_ms": round(self.percentile(values, p / 100) * 1000, 3)
+                                   for p in (50, 95, 99)}}
+        values = sorted(v for latencies in self.latencies.values() for v in latencies)
+        if values:
+            report["total"] = {"requests": len(values), "errors": sum(self.errors.values()),
+                               "rps": round(len(values) / seconds, 2),
+                               **{f"p{p}_ms": round(self.percentile(values, p / 100) * 1000, 3)
+                                  for p in (50, 95, 99)}}
+        return report
+
+
+class VirtualUser:
+    """
+    One client of the contact book. Keeps its tokens and the contacts it has seen, so reads hit existing rows.
+    """
+    def __init__(self, client: httpx.AsyncClient, email: str, stats: Stats, rng: random.Random):
+        self.client = client
+        self.email = email
+        self.stats = stats
+        self.rng = rng
+        self.access_token = self.refresh_token = None
+        self.contacts: dict[int, dict] = {}
+
+    async def request(self, endpoint: str, method: str, url: str, *, ok=(200, 201, 204), token=None, **kwargs):
+        headers = {"Authorization": f"Bearer {token or self.access_token}"} if (token or self.access_token) else {}
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers=headers, **kwargs)
+        except httpx.HTTPError:
+            self.stats.record(endpoint, time.perf_counter() - start, False)
+            return None
+        self.stats.record(endpoint, time.perf_counter() - start, response.status_code in ok)
+        return response if response.status_code in ok else None
+
+    def remember(self, contacts: list[dict]) -> None:
+        for contact in contacts:
+            self.contacts[contact["id"]] = contact
+
+    def any_contact(self) -> dict | None:
+        return self.rng.choice(list(self.contacts.values())) if self.contacts else None
+
+    async def login(self):
+        response = await self.request("POST /api/auth/login", "POST", "/api/auth/login",
+                                      data={"username": self.email, "password": PASSWORD})
+        if response is not None:
+            tokens = response.json()
+            self.access_token, self.refresh_token = tokens["access_token"], tokens["refresh_token"]
+
+    async def refresh(self):
+        response = await self.request("GET /api/auth/refresh_token", "GET", "/api/auth/refresh_token",
+                                      token=self.refresh_token)
+        if response is not None:
+            tokens = response.json()
+            self.access_token, self.refresh_token = tokens["access_token"], tokens["refresh_token"]
+
+    async def step(self, endpoint: str):
+        contact = self.any_contact()
+        if endpoint == "POST /api/auth/login":
+            await self.login()
+        elif endpoint == "GET /api/auth/refresh_token":
+            await self.refresh()
+        elif endpoint == "GET /api/users/me":
+            await self.request(endpoint, "GET", "/api/users/me")
+        elif endpoint == "GET /api/contacts/":
+            response = await self.request(endpoint, "GET", "/api/contacts/",
+                                          params={"limit": self.rng.choice((10, 50, 100)), "offset": 0})
+            if response is not None:
+                self.remember(response.json())
+        elif endpoint == "POST /api/contacts/":
+            response = await self.request(endpoint, "POST", "/api/contacts/", json=fake_contact(self.rng))
+            if response is not None:
+                self.remember([response.json()])
+        elif endpoint == "GET /api/contacts/birthday":
+            # 404 is the answer when no birthday falls into the period
+            await self.request(endpoint, "GET", "/api/contacts/birthday", params={"n": self.rng.choice((7, 30))},
+                               ok=(200, 404))
+        elif contact is None:
+            await self.step("GET /api/contacts/")
+        elif endpoint == "GET /api/contacts/{contact_id}":
+            await self.request(endpoint, "GET", f"/api/contacts/{contact['id']}")
+        elif endpoint == "PUT /api/contacts/{contact_id}":
+            body = {key: contact[key] for key in ("name", "surname", "phone_number", "email", "birthday")}
+            body["notes"] = f"updated at {time.time()}"
+            await self.request(endpoint, "PUT", f"/api/contacts/{contact['id']}", json=body, ok=(200, 404))
+        elif endpoint == "DELETE /api/contacts/{contact_id}":
+            self.contacts.pop(contact["id"])
+            await self.request(endpoint, "DELETE", f"/api/contacts/{contact['id']}", ok=(200, 204, 404))
+        elif endpoint == "GET /api/contacts/name":
+            await self.request(endpoint, "GET", "/api/contacts/name", params={"contact_name": contact["name"]})
+        elif endpoint == "GET /api/contacts/surname":
+            await self.request(endpoint, "GET", "/api/contacts/surname",
+                               params={"contact_surname": contact["surname"]})
+        elif endpoint == "GET /api/contacts/email":
+            await self.request(endpoint, "GET", "/api/contacts/email", params={"contact_email": contact["email"]},
+                               ok=(200, 404))
+
+    async def run(self, deadline: float):
+        await self.login()
+        endpoints, weights = list(MIX), list(MIX.values())
+        while time.monotonic() < deadline:
+            await self.step(self.rng.choices(endpoints, weights)[0])
+
+
+async def load(client: httpx.AsyncClient, users: int, seconds: float) -> dict[str, dict]:
+    stats = Stats()
+    deadline = time.monotonic() + seconds
+    start = time.perf_counter()
+    await asyncio.gather(*(VirtualUser(client, user_email(i), stats, random.Random(i)).run(deadline)
+                           for i in range(users)))
+    return stats.report(time.perf_counter() - start)
+
+
+def configure_rate_limit(rate_limit: str) -> dict[str, str]:
+    """
+    The configure_rate_limit function turns --rate-limit into settings: "off" or a quota for every tier.
+
+    :param rate_limit: str: "off" or a quota, e.g. "100/1"
+    :return: The settings as environment variables
+    :doc-author: Trelent
+    """
+    if rate_limit == "off":
+        return {"RATE_LIMIT_ENABLED": "false"}
+    return {"RATE_LIMIT_ENABLED": "true", "RATE_LIMIT_ROUTES": "{}",
+            "RATE_LIMIT_TIERS": json.dumps({"user": rate_limit})}
+
+
+async def run_in_process(users: int, seconds: float) -> dict[str, dict]:
+    from functools import partial
+    from types import SimpleNamespace
+
+    import fakeredis
+
+    import main
+
+    server = fakeredis.FakeServer()
+    main.redis = SimpleNamespace(Redis=partial(fakeredis.aioredis.FakeRedis, server=server))
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as client:
+            return await load(client, users, seconds)
+
+
+async def run_remote(url: str, users: int, seconds: float) -> dict[str, dict]:
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        return await load(client, users, seconds)
+
+
+def print_report(report: dict[str, dict], baseline: dict[str, dict] | None = None) -> None:
+    print(f"{'endpoint':36} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for endpoint, row in report.items():
+        line = (f"{endpoint:36} {row['requests']:8d} {row['errors']:6d} {row['rps']:8.1f} "
+                f"{row['p50_ms']:8.2f} {row['p95_ms']:8.2f} {row['p99_ms']:8.2f}")
+        if baseline and endpoint in baseline:
+            before = baseline[endpoint]
+            line += "  p95 {:+.0%}  req/s {:+.0%}".format(row["p95_ms"] / before["p95_ms"] - 1,
+                                                          row["rps"] / before["rps"] - 1)
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the contact book with a realistic traffic mix")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="base url of a running server")
+    target.add_argument("--serve", type=int, metavar="WORKERS", help="start gunicorn with this many workers")
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--seconds", type=float, default=30)
+    parser.add_argument("--contacts", type=int, default=100, help="contacts seeded per user")
+    parser.add_argument("--rate-limit", default="off", help='"off" or a quota for every tier, e.g. 100/1')
+    parser.add_argument("--db-url", help="database of the in-process run, sqlite+aiosqlite:///loadtest.db by default")
+    parser.add_argument("--json", help="write the report to this file")
+    parser.add_argument("--compare", help="report written by an earlier run with --json")
+    args = parser.parse_args()
+
+    settings = {**configure_rate_limit(args.rate_limit), "LOG_LEVEL": "WARNING"}
+    in_process = args.url is None and args.serve is None
+    if in_process:
+        settings["DB_URL"] = args.db_url or "sqlite+aiosqlite:///loadtest.db"
+    # before the first import of the settings
+    os.environ.update(settings)
+
+    asyncio.run(seed(args.users, args.contacts))
+    if in_process:
+        report = asyncio.run(run_in_process(args.users, args.seconds))
+    elif args.serve:
+        from benchmarks.bench_server import free_port, start_server
+
+        port = free_port()
+        server = start_server(args.serve, port, settings)
+        try:
+            report = asyncio.run(run_remote(f"http://127.0.0.1:{port}", args.users, args.seconds))
+        finally:
+            server.terminate()
+            server.wait()
+    else:
+        print("--url: the server keeps its own rate limits, start it with RATE_LIMIT_ENABLED=false", file=sys.stderr)
+        report = asyncio.run(run_remote(args.url, args.users, args.seconds))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+    print_report(report, baseline)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
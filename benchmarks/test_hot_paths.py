@@ -0,0 +1,165 @@
+"""
+Benchmarks of the repository and auth hot paths with pytest-benchmark, on in-memory SQLite and fakeredis.
+The database holds --dataset-users users plus the benchmarked one, each with --dataset-contacts contacts.
+
+    pytest benchmarks                                           # run and print the table
+    pytest benchmarks --dataset-contacts 10000 --benchmark-save=baseline
+    pytest benchmarks --benchmark-compare=0001 --benchmark-compare-fail=median:20%
+
+Saved runs are kept in benchmarks/baselines/<machine>/, compare only runs of the same machine.
+The bcrypt benchmarks take about a second each.
+"""
+import asyncio
+import random
+from datetime import date, timedelta
+
+import fakeredis
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from src.entity.models import Base, Contact, User
+from src.repository import contacts as repository_contacts
+from src.repository import users as repository_users
+from src.services.auth import auth_service
+from src.services.rate_limit import limiter
+
+
+NAMES = ["Olena", "Taras", "Iryna", "Andrii", "Sofiia", "Dmytro", "Mariia", "Bohdan", "Oksana", "Yurii"]
+SURNAMES = ["Shevchenko", "Kovalenko", "Bondarenko", "Tkachenko", "Kravchenko", "Oliinyk", "Melnyk", "Lysenko"]
+PASSWORD = "benchmark-password"
+
+
+def fake_contacts(user: User, count: int, rng: random.Random) -> list[Contact]:
+    contacts = []
+    for i in range(count):
+        name, surname = rng.choice(NAMES), rng.choice(SURNAMES)
+        contacts.append(Contact(name=name, surname=surname, phone_number=f"+38050{rng.randrange(10 ** 7):07d}",
+                                email=f"{name.lower()}.{surname.lower()}{i}@example.com",
+                                birthday=date(1970, 1, 1) + timedelta(days=rng.randrange(365 * 40)),
+                                notes="", user=user))
+    return contacts
+
+
+@pytest.fixture(scope="session")
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+@pytest.fixture(scope="session")
+def dataset(request, loop):
+    users = request.config.getoption("--dataset-users")
+    contacts = request.config.getoption("--dataset-contacts")
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", poolclass=StaticPool)
+    session_maker = async_sessionmaker(engine, expire_on_commit=False)
+
+    async def seed():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        rng = random.Random(0)
+        password = auth_service.get_password_hash(PASSWORD)
+        async with session_maker() as db:
+            for i in range(users + 1):
+                user = User(username=f"user{i}", email=f"user{i}@example.com", password=password, confirmed=True)
+                db.add(user)
+                user_contacts = fake_contacts(user, contacts, rng)
+                db.add_all(user_contacts)
+            await db.commit()
+        return user, user_contacts
+
+    user, user_contacts = loop.run_until_complete(seed())
+    yield session_maker, user, user_contacts
+    loop.run_until_complete(engine.dispose())
+
+
+@pytest.fixture
+def db(dataset, loop) -> AsyncSession:
+    session = dataset[0]()
+    yield session
+    loop.run_until_complete(session.close())
+
+
+@pytest.fixture
+def user(dataset) -> User:
+    return dataset[1]
+
+
+@pytest.fixture
+def contacts(dataset) -> list[Contact]:
+    return dataset[2]
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = fakeredis.aioredis.FakeRedis()
+    monkeypatch.setattr(limiter, "redis", cache)
+    return cache
+
+
+@pytest.fixture
+def run(loop):
+    return loop.run_until_complete
+
+
+@pytest.mark.parametrize("limit", [10, 100])
+def test_get_contacts(benchmark, run, db, user, contacts, limit):
+    result = benchmark(lambda: run(repository_contacts.get_contacts(limit, 0, db, user)))
+    assert len(result) == min(limit, len(contacts))
+
+
+def test_get_contact(benchmark, run, db, user, contacts):
+    contact_id = contacts[0].id
+    assert benchmark(lambda: run(repository_contacts.get_contact(contact_id, db, user))) is not None
+
+
+def test_search_contact_by_name(benchmark, run, db, user):
+    benchmark(lambda: run(repository_contacts.search_contact_by_name(NAMES[0], db, user)))
+
+
+def test_search_contact_by_surname(benchmark, run, db, user):
+    benchmark(lambda: run(repository_contacts.search_contact_by_surname(SURNAMES[0], db, user)))
+
+
+def test_search_contact_by_email(benchmark, run, db, user, contacts):
+    email = contacts[-1].email
+    assert benchmark(lambda: run(repository_contacts.search_contact_by_email(email, db, user))) is not None
+
+
+@pytest.mark.parametrize("n", [7, 30])
+def test_get_contact_by_birthday(benchmark, run, db, user, n):
+    benchmark(lambda: run(repository_contacts.get_contact_by_birthday(n, db, user)))
+
+
+def test_get_user_by_email(benchmark, run, db, user):
+    assert benchmark(lambda: run(repository_users.get_user_by_email(user.email, db))) is not None
+
+
+def test_create_access_token(benchmark, run, user):
+    benchmark(lambda: run(auth_service.create_access_token(data={"sub": user.email})))
+
+
+def test_get_current_user_cache_hit(benchmark, run, db, user, cache):
+    token = run(auth_service.create_access_token(data={"sub": user.email}))
+    run(auth_service.get_current_user(token, db))
+    assert benchmark(lambda: run(auth_service.get_current_user(token, db))).email == user.email
+
+
+def test_get_current_user_cache_miss(benchmark, run, db, user, cache):
+    token = run(auth_service.create_access_token(data={"sub": user.email}))
+
+    def evict():
+        run(cache.delete(user.email))
+
+    result = benchmark.pedantic(lambda: run(auth_service.get_current_user(token, db)),
+                                setup=evict, rounds=200, warmup_rounds=1)
+    assert result.email == user.email
+
+
+def test_get_password_hash(benchmark):
+    benchmark.pedantic(auth_service.get_password_hash, args=(PASSWORD,), rounds=5)
+
+
+def test_verify_password(benchmark, user):
+    assert benchmark.pedantic(auth_service.verify_password, args=(PASSWORD, user.password), rounds=5)
@@ -0,0 +1,60 @@
+"""
+Production server: gunicorn supervising uvicorn workers on uvloop and httptools.
+
+    gunicorn main:app                   # this file is read from the working directory
+    kill -HUP <master pid>              # graceful restart: new workers start, old ones finish their requests
+
+The application is imported once in the master (preload_app) and the workers are forked from it,
+so the imported modules, compiled templates, pydantic validators and the OpenAPI schema are shared
+copy-on-write instead of being built by every worker. Nothing that holds a connection may be created
+before the fork: Redis clients and database connections are opened lazily or in the lifespan of each worker.
+
+Workers are recycled after SERVER_MAX_REQUESTS requests (plus jitter, so they do not restart together)
+to bound the growth of their memory.
+"""
+import gc
+import multiprocessing
+import os
+
+from src.config.config import config as settings     #   "config" is a gunicorn setting
+
+
+bind = f"{settings.SERVER_HOST}:{settings.SERVER_PORT}"
+workers = settings.SERVER_WORKERS or multiprocessing.cpu_count()
+worker_class = "src.config.workers.UvloopWorker"
+preload_app = True
+max_requests = settings.SERVER_MAX_REQUESTS
+max_requests_jitter = settings.SERVER_MAX_REQUESTS_JITTER
+graceful_timeout = settings.SERVER_GRACEFUL_TIMEOUT
+keepalive = settings.SERVER_KEEPALIVE
+forwarded_allow_ips = settings.SERVER_FORWARDED_ALLOW_IPS
+
+
+# the workers write their metrics there, the master already does while preloading the application
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def on_starting(server):
+    # samples of the workers of a previous run would be summed into /metrics
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        for name in os.listdir(directory):
+            if name.endswith(".db") and not name.endswith(f"_{os.getpid()}.db"):
+                os.remove(os.path.join(directory, name))
+
+
+def when_ready(server):
+    # builds what every worker would otherwise build on its first request, then moves everything allocated
+    # so far out of the reach of the garbage collector, whose scans would copy the shared pages into every worker
+    app = server.app.wsgi()
+    app.openapi()
+    from src.services.email import mail_config
+    mail_config()
+    gc.freeze()
+
+
+def child_exit(server, worker):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,36 +1,74 @@
+import asyncio
+import contextlib
 from ipaddress import ip_address
+import logging
 import re
+import signal
 from typing import Callable
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse, HTMLResponse
+from fastapi.responses import JSONResponse, HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
 from sqlalchemy import text
 import redis.asyncio as redis
 from sqlalchemy.ext.asyncio import AsyncSession
 from pathlib import Path
 
-import uvicorn
-# from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager
 from fastapi import Depends, FastAPI, Request, status
-from fastapi_limiter import FastAPILimiter
-from fastapi_limiter.depends import RateLimiter
 
-from src.database.db import get_db
+from src.database.db import get_db, sessionmanager, QueryStatsMiddleware
+from src.services.assets import PrecompressedStaticFiles
+from src.services.compression import CompressionMiddleware
+from src.services.contact_cache import contact_cache
+from src.services.health import readiness
+from src.services import metrics
+from src.services.tracing import TracingMiddleware, tracer
+from src.services.rate_limit import limiter
 from src.routres import contacts, auth, users
 from src.config.config import config
 
-# @asynccontextmanager
-# async def lifespan(app: FastAPI):
-#     r = await redis.Redis(host=config.REDIS_DOMAIN, port=config.REDIS_PORT, db=0, 
-#                           password=config.REDIS_PASSWORD, encoding="utf-8",
-#                           decode_responses=True)
-#     delay = await FastAPILimiter.init(r)
-#     yield delay
 
-# app = FastAPI(lifespan=lifespan)
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    The lifespan function creates the shared Redis client when the worker starts and, on shutdown,
+        flushes the rate limiter and closes Redis, the user cache and the database pools,
+        so rolling restarts do not leave connections behind. SIGUSR2 switches tracing on and off.
+    
+    :param app: FastAPI: The application
+    :return: An async context manager
+    :doc-author: Trelent
+    """
+    # short timeouts: a Redis that does not answer must fail fast to turn on the fallbacks
+    r = redis.Redis(host=config.REDIS_DOMAIN, 
+                    port=config.REDIS_PORT, 
+                    db=0, 
+                    password=config.REDIS_PASSWORD,
+                    socket_timeout=config.REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=config.REDIS_CONNECT_TIMEOUT)
+    app.state.redis = r
+    limiter.redis = r
+    contact_cache.redis = r
+    sessionmanager.redis = r
+    loop = asyncio.get_running_loop()
+    with contextlib.suppress(NotImplementedError, RuntimeError):     #   no signals on Windows or off the main thread
+        loop.add_signal_handler(signal.SIGUSR2, tracer.toggle)
+    try:
+        yield
+    finally:
+        with contextlib.suppress(NotImplementedError, RuntimeError):
+            loop.remove_signal_handler(signal.SIGUSR2)
+        await limiter.close()
+        contact_cache.redis = None
+        sessionmanager.redis = None
+        await r.aclose()
+        await sessionmanager.close()
+        tracer.close()
+
+
+app = FastAPI(lifespan=lifespan)
+logging.basicConfig(level=config.LOG_LEVEL)
 
 '''IP blacklist'''
 
@@ -60,6 +98,10 @@ app = FastAPI()
 #     response = await call_next(request)
 #     return response
 
+'''Query stats'''
+
+app.add_middleware(QueryStatsMiddleware)
+
 '''CORS'''
 
 origins = ["*"]     #   public; or origins = ["http://localhost:3000"] for some web on localhost:port
@@ -72,25 +114,34 @@ app.add_middleware(
     allow_headers= ["*"]   #     [*] for all or ["Authorization"]
 )
 
+'''Compression'''
+
+app.add_middleware(CompressionMiddleware)
+
+'''Tracing'''
+
+app.add_middleware(TracingMiddleware)
+
+'''Metrics'''
+
+if config.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
 BASE_DIR = Path(__file__).parent
 directory = BASE_DIR.joinpath("src").joinpath("static")
-app.mount('/static', StaticFiles(directory=directory), name='static')
+build_directory = BASE_DIR.joinpath(config.STATIC_BUILD_DIR)
+if build_directory.joinpath("manifest.json").exists():    #   python -m src.jobs.build_static
+    directory = build_directory
+static_files = PrecompressedStaticFiles(directory=directory)
+app.mount('/static', static_files, name='static')
 
 app.include_router(auth.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
 app.include_router(contacts.router, prefix='/api')
 
 
-@app.on_event("startup")
-async def startup():
-    r = await redis.Redis(host=config.REDIS_DOMAIN, 
-                          port=config.REDIS_PORT, 
-                          db=0, 
-                          password=config.REDIS_PASSWORD)
-    await FastAPILimiter.init(r)
-
-
 templates = Jinja2Templates(directory=BASE_DIR /'src' /'templates')
+templates.env.globals["asset"] = static_files.asset
 
 
 @app.get('/', response_class=HTMLResponse)
@@ -102,8 +153,8 @@ async def healthchecker(db: AsyncSession = Depends(get_db)):
     try:
         # Make request
         result = await db.execute(text("SELECT 1"))
-        reult = result.fetchone() 
-        if result is None:
+        row = result.fetchone() 
+        if row is None:
             raise HTTPException(
                 status_code=500, detail="Database is not configured correctly"
             )
@@ -111,7 +162,65 @@ async def healthchecker(db: AsyncSession = Depends(get_db)):
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Error connecting to the database")
+
+
+@app.get("/livez")
+async def livez():
+    """
+    The livez function is the liveness probe: it answers as long as the event loop is running
+        and never touches the backends.
+    
+    :return: A dict with the status
+    :doc-author: Trelent
+    """
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz(request: Request):
+    """
+    The readyz function is the readiness probe: it checks the database, Redis and the mail relay
+        and reports their latency and the pool saturation. The report is cached for HEALTH_CACHE_SECONDS,
+        so frequent probes do not load the backends. Responds 503 when the database is down,
+        Redis and the mail relay being down only degrade the report.
+    
+    :param request: Request: Current request
+    :return: A JSON response with the readiness report
+    :doc-author: Trelent
+    """
+    report = await readiness(request.app)
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE if report["status"] == "fail" else status.HTTP_200_OK
+    return JSONResponse(report, status_code=status_code)
+
+
+@app.get("/api/healthchecker/pool")
+async def pool_stats():
+    """
+    The pool_stats function reports the live state of the database connection pool:
+        checked out connections, overflow, saturation and how long checkouts waited for a connection.
     
+    :return: A dict with the pool statistics
+    :doc-author: Trelent
+    """
+    return sessionmanager.pool_stats()
+    
+
+@app.get("/metrics", include_in_schema=False)
+def metrics_endpoint():
+    """
+    The metrics_endpoint function serves the Prometheus metrics of all workers.
+        It is a sync route, so reading the files of every worker runs in the threadpool, not on the event loop.
+    
+    :return: The metrics in the Prometheus text format
+    :doc-author: Trelent
+    """
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return Response(metrics.latest(), media_type=metrics.CONTENT_TYPE_LATEST)
+
 
 if __name__ == "__main__":
-    uvicorn.run("app:app", reload=True)
\ No newline at end of file
+    import uvicorn
+
+    #   development server; in production: gunicorn main:app, see gunicorn.conf.py
+    uvicorn.run("main:app", reload=True)
\ No newline at end of file
@@ -0,0 +1,38 @@
+"""add birthday digests
+
+Revision ID: 3c7f1b2a9d41
+Revises: e2e03bcdd708
+Create Date: 2024-03-18 19:42:11.512307
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c7f1b2a9d41'
+down_revision: Union[str, None] = 'e2e03bcdd708'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('birthday_digests',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('digest_date', sa.Date(), nullable=False),
+    sa.Column('contacts_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'digest_date', name='uq_birthday_digests_user_date')
+    )
+    op.create_index('ix_contacts_user_id', 'contacts', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_contacts_user_id', table_name='contacts')
+    op.drop_table('birthday_digests')
@@ -0,0 +1,93 @@
+"""partition contacts by user
+
+Revision ID: 9a4e6c1d2b57
+Revises: 3c7f1b2a9d41
+Create Date: 2024-03-24 12:05:48.301942
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4e6c1d2b57'
+down_revision: Union[str, None] = '3c7f1b2a9d41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+PARTITIONS = 32
+
+# Small partitions get vacuumed and analyzed long before the default 20% of dead rows
+PARTITION_STORAGE = "autovacuum_vacuum_scale_factor = 0.02, autovacuum_analyze_scale_factor = 0.01"
+
+INDEXES = {'ix_contacts_user_id_name': ['user_id', 'name'],
+           'ix_contacts_user_id_surname': ['user_id', 'surname'],
+           'ix_contacts_user_id_email': ['user_id', 'email']}
+
+
+def upgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        with op.batch_alter_table('contacts') as batch_op:
+            batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=False)
+            batch_op.drop_index('ix_contacts_user_id')
+            for name, columns in INDEXES.items():
+                batch_op.create_index(name, columns)
+        return
+
+    op.execute("""
+        DO $$ BEGIN
+            IF EXISTS (SELECT 1 FROM contacts WHERE user_id IS NULL) THEN
+                RAISE EXCEPTION 'contacts without user_id cannot be partitioned, assign or delete them first';
+            END IF;
+        END $$
+    """)
+    op.execute("ALTER TABLE contacts RENAME TO contacts_unpartitioned")
+    op.execute("ALTER INDEX contacts_pkey RENAME TO contacts_unpartitioned_pkey")
+    op.execute("""
+        CREATE TABLE contacts (
+            LIKE contacts_unpartitioned INCLUDING DEFAULTS,
+            PRIMARY KEY (user_id, id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        ) PARTITION BY HASH (user_id)
+    """)
+    for remainder in range(PARTITIONS):
+        op.execute(f"""
+            CREATE TABLE contacts_p{remainder:02d} PARTITION OF contacts
+            FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})
+            WITH ({PARTITION_STORAGE})
+        """)
+    # Indexes on the parent are created on every partition
+    for name, columns in INDEXES.items():
+        op.create_index(name, 'contacts', columns)
+    op.execute("INSERT INTO contacts SELECT * FROM contacts_unpartitioned")
+    op.execute("ALTER SEQUENCE contacts_id_seq OWNED BY contacts.id")
+    op.execute("DROP TABLE contacts_unpartitioned")
+    op.execute("ANALYZE contacts")
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != 'postgresql':
+        with op.batch_alter_table('contacts') as batch_op:
+            for name in INDEXES:
+                batch_op.drop_index(name)
+            batch_op.create_index('ix_contacts_user_id', ['user_id'], unique=False)
+            batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=True)
+        return
+
+    op.execute("ALTER TABLE contacts RENAME TO contacts_partitioned")
+    op.execute("ALTER INDEX contacts_pkey RENAME TO contacts_partitioned_pkey")
+    op.execute("""
+        CREATE TABLE contacts (
+            LIKE contacts_partitioned INCLUDING DEFAULTS,
+            PRIMARY KEY (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+    op.execute("ALTER TABLE contacts ALTER COLUMN user_id DROP NOT NULL")
+    op.execute("INSERT INTO contacts SELECT * FROM contacts_partitioned")
+    op.execute("ALTER SEQUENCE contacts_id_seq OWNED BY contacts.id")
+    op.execute("DROP TABLE contacts_partitioned")
+    op.create_index('ix_contacts_user_id', 'contacts', ['user_id'], unique=False)
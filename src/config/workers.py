@@ -0,0 +1,15 @@
+from uvicorn.workers import UvicornWorker
+
+
+class UvloopWorker(UvicornWorker):
+    """
+    Gunicorn worker running the application on uvloop with the httptools parser.
+    On shutdown requests in flight get graceful_timeout seconds to finish.
+
+        gunicorn -k src.config.workers.UvloopWorker main:app
+    """
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.config.timeout_graceful_shutdown = self.cfg.graceful_timeout
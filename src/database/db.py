@@ -1,36 +1,501 @@
 import contextlib
+import hashlib
+import itertools
+import json
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
 
-from sqlalchemy.ext.asyncio import AsyncEngine, AsyncConnection, async_sessionmaker,create_async_engine
+from fastapi import Depends, Request
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from sqlalchemy import event, make_url, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncConnection, AsyncSession, async_sessionmaker,create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 
 from src.config.config import config
+from src.services.metrics import DB_POOL_TIMEOUTS, DB_POOL_WAIT
+from src.services.tracing import tracer
 
 
+logger = logging.getLogger(__name__)
+
+
+class QueryStats:
+    """
+    Number of SQL statements and time spent in the database during one request.
+    """
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements: Counter = Counter()
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.time += elapsed
+        self.statements[statement] += 1
+
+    def repeated(self, threshold: int) -> dict[str, int]:
+        """
+        The repeated function returns the statements executed at least threshold times,
+            which is how an N+1 query pattern shows up.
+        
+        :param self: Represent the instance of the class
+        :param threshold: int: Minimum number of executions
+        :return: A dict of statement to number of executions
+        :doc-author: Trelent
+        """
+        return {statement: count for statement, count in self.statements.items() if count >= threshold}
+
+
+query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+def redact(parameters) -> list | dict:
+    """
+    The redact function replaces statement parameters with their type names, so logs never contain user data.
+    
+    :param parameters: Parameters passed to the DBAPI cursor
+    :return: The parameters with every value replaced by its type name
+    :doc-author: Trelent
+    """
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [redact(value) if isinstance(value, (list, tuple, dict)) else type(value).__name__ 
+                for value in parameters]
+    return type(parameters).__name__
+
+
+# transaction control emitted by SQLAlchemy itself is not a query of the request
+TRANSACTION_CONTROL = ("BEGIN", "SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = query_stats.get()
+    if stats is not None and not statement.startswith(TRANSACTION_CONTROL):
+        stats.record(statement, elapsed)
+    if elapsed * 1000 >= config.DB_SLOW_QUERY_MS:
+        logger.warning(json.dumps({"event": "slow_query", 
+                                   "duration_ms": round(elapsed * 1000, 3),
+                                   "statement": statement, 
+                                   "parameters": redact(parameters)}))
+
+
+def instrument_engine(engine: AsyncEngine) -> AsyncEngine:
+    """
+    The instrument_engine function hooks the engine's cursor events to count statements per request
+        and to log slow statements.
+    
+    :param engine: AsyncEngine: Engine to instrument
+    :return: The same engine
+    :doc-author: Trelent
+    """
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_cursor_execute)
+    return engine
+
+
+@contextlib.contextmanager
+def count_queries():
+    """
+    The count_queries function collects the statements executed inside the with block.
+    
+    :return: A context manager yielding QueryStats
+    :doc-author: Trelent
+    """
+    stats = QueryStats()
+    token = query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        query_stats.reset(token)
+
+
+@contextlib.contextmanager
+def assert_num_queries(expected: int):
+    """
+    The assert_num_queries function fails if the with block does not execute exactly the expected number of statements.
+        Routes called through TestClient run in another thread, use the X-DB-Queries response header for them.
+    
+    :param expected: int: Expected number of statements
+    :return: A context manager yielding QueryStats
+    :doc-author: Trelent
+    """
+    with count_queries() as stats:
+        yield stats
+    assert stats.count == expected, f"Expected {expected} queries, got {stats.count}: {list(stats.statements)}"
+
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware counting the statements of every HTTP request. The count and the time spent in
+    the database are returned in the X-DB-Queries and X-DB-Time-Ms headers and logged at DEBUG;
+    statements repeated DB_N_PLUS_ONE_THRESHOLD times are logged as a warning.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        start = time.perf_counter()
+        with count_queries() as stats:
+            async def send_wrapper(message: Message) -> None:
+                nonlocal status_code
+                if message["type"] == "http.response.start":
+                    status_code = message["status"]
+                    headers = MutableHeaders(scope=message)
+                    headers["X-DB-Queries"] = str(stats.count)
+                    headers["X-DB-Time-Ms"] = f"{stats.time * 1000:.2f}"
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps({"event": "request", 
+                                     "method": scope["method"], 
+                                     "path": scope["path"], 
+                                     "status": status_code,
+                                     "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+                                     "db_queries": stats.count, 
+                                     "db_time_ms": round(stats.time * 1000, 3)}))
+        repeated = stats.repeated(config.DB_N_PLUS_ONE_THRESHOLD)
+        if repeated:
+            logger.warning(json.dumps({"event": "n_plus_one", 
+                                       "method": scope["method"], 
+                                       "path": scope["path"],
+                                       "statements": repeated}))
+
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that records how long checkouts wait for a connection.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.queued = 0
+        self.timeouts = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _do_get(self):
+        if self.checkedin() == 0 and self._max_overflow > -1 and self.overflow() >= self._max_overflow:
+            self.queued += 1
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.timeouts += 1
+            DB_POOL_TIMEOUTS.inc()
+            raise
+        finally:
+            waited = time.perf_counter() - start
+            self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+            DB_POOL_WAIT.observe(waited)
+
+
+def engine_options(url: str) -> dict:
+    """
+    The engine_options function builds the create_async_engine keyword arguments from the settings.
+        In-memory SQLite keeps the default single-connection pool, asyncpg also gets its statement caches tuned.
+    
+    :param url: str: Database url
+    :return: A dict of keyword arguments for create_async_engine
+    :doc-author: Trelent
+    """
+    url = make_url(url)
+    options = {}
+    if not (url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')):
+        options.update(poolclass=MeteredPool,
+                       pool_size=config.DB_POOL_SIZE,
+                       max_overflow=config.DB_MAX_OVERFLOW,
+                       pool_timeout=config.DB_POOL_TIMEOUT,
+                       pool_recycle=config.DB_POOL_RECYCLE,
+                       pool_pre_ping=config.DB_POOL_PRE_PING)
+    if url.get_driver_name() == 'asyncpg':
+        options.update(connect_args={"statement_cache_size": config.DB_STATEMENT_CACHE_SIZE,
+                                     "prepared_statement_cache_size": config.DB_PREPARED_STATEMENT_CACHE_SIZE})
+    return options
+
+
+def pool_stats(engine: AsyncEngine) -> dict:
+    """
+    The pool_stats function reports the live state of the engine's connection pool.
+        queued counts checkouts that found no idle connection and no overflow left, i.e. requests waiting for the pool.
+    
+    :param engine: AsyncEngine: Engine to inspect
+    :return: A dict with pool size, checked out connections, overflow and wait times
+    :doc-author: Trelent
+    """
+    pool = engine.pool
+    if not isinstance(pool, MeteredPool):
+        return {"pool": type(pool).__name__}
+    capacity = pool.size() + max(pool._max_overflow, 0)
+    return {"pool": type(pool).__name__,
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+            "saturation": round(pool.checkedout() / capacity, 3) if capacity else 0.0,
+            "checkouts": pool.checkouts,
+            "queued": pool.queued,
+            "timeouts": pool.timeouts,
+            "wait_time_total_ms": round(pool.wait_time_total * 1000, 3),
+            "wait_time_max_ms": round(pool.wait_time_max * 1000, 3),
+            "wait_time_avg_ms": round(pool.wait_time_total * 1000 / pool.checkouts, 3) if pool.checkouts else 0.0}
+
+
+class TrackedSession(Session):
+    """
+    Session that remembers in session.info whether it wrote anything.
+    """
+
+
+@event.listens_for(TrackedSession, "after_flush")
+def _track_flush(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(TrackedSession, "do_orm_execute")
+def _track_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+def write_marker(key: str) -> str:
+    # the Redis key of a client's read-your-writes marker, without the token itself
+    return "ryw:" + hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
 
 class DatabaseSessionManager:
-    def __init__(self, url: str):
-        self._engine: AsyncEngine | None = create_async_engine(url)
+    """
+    Sessions on the primary and on the read replicas.
+
+    A client that wrote is pinned to the primary for the read-your-writes window. The marker is kept
+    in process memory and in the shared Redis (set when the worker starts), so the other workers see it too.
+    While Redis is unavailable the guarantee only holds for reads served by the worker that took the write.
+    """
+    def __init__(self, url: str, replica_urls: list[str] | tuple = (), 
+                 read_your_writes_seconds: float = config.DB_READ_YOUR_WRITES_SECONDS):
+        self._engine: AsyncEngine | None = instrument_engine(create_async_engine(url, **engine_options(url)))
         self._session_maker: async_sessionmaker = async_sessionmaker(autoflush=False, 
                                                                      autocommit=False,
-                                                                     bind=self._engine)
+                                                                     bind=self._engine,
+                                                                     sync_session_class=TrackedSession)
+        self._replica_engines: list[AsyncEngine] = [instrument_engine(create_async_engine(replica_url, 
+                                                                                         **engine_options(replica_url)))
+                                                    for replica_url in replica_urls]
+        self._replica_session_makers = itertools.cycle([async_sessionmaker(autoflush=False, 
+                                                                           autocommit=False,
+                                                                           bind=engine,
+                                                                           info={"replica": True}) 
+                                                        for engine in self._replica_engines])
+        self._read_your_writes_seconds = read_your_writes_seconds
+        self._recent_writes: dict[str, float] = {}
+        self.redis = None
+
+    @property
+    def has_replicas(self) -> bool:
+        return bool(self._replica_engines)
 
     @contextlib.asynccontextmanager
     async def session(self):
+        """
+        The session function opens a session on the primary. Opening it is free: a pooled connection
+            is checked out only when the first statement runs, and a session that never ran
+            a statement is closed without touching the pool.
+        
+        :param self: Represent the instance of the class
+        :return: An async context manager yielding a session
+        :doc-author: Trelent
+        """
         if self._session_maker is None:
             raise Exception("Session is not initialized")
         session = self._session_maker()
         try:
             yield session
-        except Exception as err:
-            print(err)
-            await session.rollback()
+        except Exception:
+            if session.in_transaction():
+                await session.rollback()
+            raise
+        finally:
+            await session.close()
+
+    @contextlib.asynccontextmanager
+    async def read_session(self):
+        """
+        The read_session function opens a session on the next replica, round-robin.
+            Without replicas it is the same as session(). Replica sessions have session.info["replica"] set,
+            see is_replica.
+        
+        :param self: Represent the instance of the class
+        :return: An async context manager yielding a session
+        :doc-author: Trelent
+        """
+        if not self.has_replicas:
+            async with self.session() as session:
+                yield session
+            return
+        session = next(self._replica_session_makers)()
+        try:
+            yield session
+        except Exception:
+            if session.in_transaction():
+                await session.rollback()
+            raise
         finally:
             await session.close()
 
+    async def mark_write(self, key: str | None) -> None:
+        """
+        The mark_write function pins reads of the given client to the primary for the read-your-writes window,
+            in this worker and, through Redis, in the others.
+        
+        :param self: Represent the instance of the class
+        :param key: str | None: Client key, see writer_key
+        :return: None
+        :doc-author: Trelent
+        """
+        if key is None or not self.has_replicas:
+            return
+        now = time.monotonic()
+        if len(self._recent_writes) > 10000:
+            self._recent_writes = {k: until for k, until in self._recent_writes.items() if until > now}
+        self._recent_writes[key] = now + self._read_your_writes_seconds
+        if self.redis is None:
+            return
+        try:
+            with tracer.span("redis.set"):
+                await self.redis.set(write_marker(key), 1, px=max(1, int(self._read_your_writes_seconds * 1000)))
+        except Exception as err:
+            logger.warning("Read-your-writes marker not shared, other workers may read from a replica: %s", err)
+
+    async def recently_wrote(self, key: str | None) -> bool:
+        """
+        The recently_wrote function checks whether the client wrote within the read-your-writes window.
+            Writes taken by this worker are known without a round trip, the others are looked up in Redis.
+        
+        :param self: Represent the instance of the class
+        :param key: str | None: Client key, see writer_key
+        :return: True if reads of this client must go to the primary
+        :doc-author: Trelent
+        """
+        if key is None:
+            return False
+        until = self._recent_writes.get(key)
+        if until is not None and until > time.monotonic():
+            return True
+        if self.redis is None:
+            return False
+        try:
+            with tracer.span("redis.exists"):
+                return bool(await self.redis.exists(write_marker(key)))
+        except Exception as err:
+            logger.warning("Read-your-writes marker lookup failed: %s", err)
+            return False
+
+    async def ping(self) -> None:
+        """
+        The ping function runs SELECT 1 on a pooled connection of the primary.
+        
+        :param self: Represent the instance of the class
+        :return: None, raises if the database is unreachable
+        :doc-author: Trelent
+        """
+        async with self._engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    async def close(self) -> None:
+        """
+        The close function disposes the engines of the primary and the replicas,
+            closing their pooled connections.
+        
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        await self._engine.dispose()
+        for engine in self._replica_engines:
+            await engine.dispose()
 
-sessionmanager = DatabaseSessionManager(config.DB_URL)
+    def pool_stats(self) -> dict:
+        stats = pool_stats(self._engine)
+        if self.has_replicas:
+            stats["replicas"] = [pool_stats(engine) for engine in self._replica_engines]
+        return stats
 
 
-async def get_db():
+sessionmanager = DatabaseSessionManager(config.DB_URL, config.DB_REPLICA_URLS)
+
+
+def is_replica(session: AsyncSession) -> bool:
+    """
+    The is_replica function tells whether the session reads from a replica, which may lag behind the primary.
+    
+    :param session: AsyncSession: Session yielded by get_db or get_read_db
+    :return: True for replica sessions
+    :doc-author: Trelent
+    """
+    return session.info.get("replica", False)
+
+
+def writer_key(request: Request) -> str | None:
+    """
+    The writer_key function identifies the client for read-your-writes by its bearer token.
+    
+    :param request: Request: Current request
+    :return: The Authorization header, or None for anonymous requests
+    :doc-author: Trelent
+    """
+    return request.headers.get("authorization")
+
+
+async def get_db(request: Request):
+    """
+    The get_db function is the dependency for the request's primary session. FastAPI resolves it once
+        per request, so the route, Auth.get_current_user and get_read_db all share this session,
+        and requests that never run a statement (e.g. a user served from the cache) never take a pooled connection.
+    
+    :param request: Request: Current request
+    :return: The primary session of the request
+    :doc-author: Trelent
+    """
     async with sessionmanager.session() as session:
-        yield session
\ No newline at end of file
+        yield session
+        if session.info.get("wrote"):
+            await sessionmanager.mark_write(writer_key(request))
+
+
+async def get_read_db(request: Request, db: AsyncSession = Depends(get_db)):
+    """
+    The get_read_db function is a dependency for read-only routes. It yields a replica session,
+        or the request's primary session when there are no replicas or the client wrote
+        within the last DB_READ_YOUR_WRITES_SECONDS.
+    
+    :param request: Request: Current request
+    :param db: AsyncSession: Primary session of the request
+    :return: A session to read from
+    :doc-author: Trelent
+    """
+    if not sessionmanager.has_replicas or await sessionmanager.recently_wrote(writer_key(request)):
+        yield db
+        return
+    async with sessionmanager.read_session() as session:
+        yield session
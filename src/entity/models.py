@@ -1,5 +1,5 @@
 from datetime import date
-from sqlalchemy import Boolean, String, Date, Integer, ForeignKey, DateTime, func
+from sqlalchemy import Boolean, String, Date, Integer, ForeignKey, DateTime, Index, UniqueConstraint, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.orm import DeclarativeBase
 
@@ -10,7 +10,15 @@ class Base(DeclarativeBase):
 
 
 class Contact(Base):
+    """
+    On Postgres the table is hash-partitioned by user_id with primary key (user_id, id),
+    see migration 9a4e6c1d2b57. The mapper identity includes user_id as well, so the ORM's
+    UPDATE and DELETE statements are pruned to a single partition.
+    """
     __tablename__ = "contacts"
+    __table_args__ = (Index('ix_contacts_user_id_name', 'user_id', 'name'),
+                      Index('ix_contacts_user_id_surname', 'user_id', 'surname'),
+                      Index('ix_contacts_user_id_email', 'user_id', 'email'), )
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(50))
     surname: Mapped[str] = mapped_column(String(50))
@@ -25,10 +33,11 @@ class Contact(Base):
                                              default=func.now(), 
                                              onupdate=func.now(), 
                                              nullable=True)
-    user_id: Mapped[int] = mapped_column (Integer, ForeignKey('users.id'), nullable=True)
+    user_id: Mapped[int] = mapped_column (Integer, ForeignKey('users.id'), nullable=False)
     user: Mapped['User'] = relationship('User', 
                                         backref='contacts', 
                                         lazy='joined' )
+    __mapper_args__ = {"primary_key": [user_id, id]}
 
 
 class User(Base):
@@ -46,4 +55,16 @@ class User(Base):
                                              onupdate=func.now())
     confirmed: Mapped[bool] = mapped_column(Boolean, 
                                             default=False, 
-                                            nullable=True) 
\ No newline at end of file
+                                            nullable=True)
+
+
+class BirthdayDigest(Base):
+    __tablename__ = 'birthday_digests'
+    __table_args__ = (UniqueConstraint('user_id', 'digest_date', name='uq_birthday_digests_user_date'), )
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    digest_date: Mapped[date] = mapped_column(Date, nullable=False)
+    contacts_count: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[date] = mapped_column('created_at', DateTime, 
+                                             default=func.now())
+    sent_at: Mapped[date] = mapped_column('sent_at', DateTime, nullable=True)
@@ -0,0 +1,162 @@
+"""
+Daily job that emails every user one digest of their contacts' upcoming birthdays.
+
+Users are split into shards of contiguous ``user_id`` ranges and every shard is read with
+one streamed query. Each shard is locked with a Postgres advisory lock for the
+duration of its run, so several processes can be started with the same arguments
+(e.g. from cron on several hosts) and they will split the shards between them.
+Digests are recorded in ``birthday_digests`` before sending, so a re-run only
+retries the digests that were not delivered.
+
+    python -m src.jobs.birthday_reminders --days 7 --shards 16
+    python -m src.jobs.birthday_reminders --days 7 --shards 16 --shard 3
+"""
+import argparse
+import asyncio
+import time
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config.config import config
+from src.database.db import sessionmanager
+from src.repository import birthdays as repository_birthdays
+from src.services.email import send_birthday_digest
+
+
+LOCK_NAMESPACE = 2703
+
+
+def lock_key(digest_date: date, shard: int, shards: int) -> int:
+    """
+    The lock_key function packs the namespace, date, shard count and shard number into one bigint,
+        so runs with a different number of shards, whose ranges overlap, never share a lock.
+    
+    :param digest_date: date: Day the digests are sent for
+    :param shard: int: Shard number
+    :param shards: int: Total number of shards, below 1000
+    :return: The advisory lock key
+    :doc-author: Trelent
+    """
+    if not 0 <= shard < shards < 1000:
+        raise ValueError(f"shard {shard} of {shards} is out of range, up to 999 shards are supported")
+    return ((LOCK_NAMESPACE * 1_000_000 + digest_date.toordinal()) * 1000 + shards) * 1000 + shard
+
+
+async def try_lock_shard(db: AsyncSession, digest_date: date, shard: int, shards: int) -> bool:
+    """
+    The try_lock_shard function takes a transaction-level advisory lock for the shard and date.
+        The lock is released when the reading transaction ends. Other databases run without locking.
+    
+    :param db: AsyncSession: Session that streams the shard
+    :param digest_date: date: Day the digests are sent for
+    :param shard: int: Shard number
+    :param shards: int: Total number of shards
+    :return: True if the shard is ours, False if another process is working on it
+    :doc-author: Trelent
+    """
+    if db.bind.dialect.name != 'postgresql':
+        return True
+    result = await db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), 
+                              {"key": lock_key(digest_date, shard, shards)})
+    return result.scalar()
+
+
+async def send_batch(batch: list[dict], days: int, digest_date: date, db: AsyncSession, concurrency: int) -> int:
+    """
+    The send_batch function queues the digests of a batch of users and sends the pending ones.
+    
+    :param batch: list[dict]: Digests produced by iter_upcoming_birthdays
+    :param days: int: Number of days the digests cover
+    :param digest_date: date: Day the digests are sent for
+    :param db: AsyncSession: Session used for writes
+    :param concurrency: int: Maximum number of emails sent at the same time
+    :return: The number of digests sent
+    :doc-author: Trelent
+    """
+    pending = await repository_birthdays.claim_digests(batch, digest_date, db)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(digest: dict):
+        async with semaphore:
+            if await send_birthday_digest(digest["email"], digest["username"], digest["contacts"], days):
+                return pending[digest["user_id"]]
+
+    sent = await asyncio.gather(*(send(digest) for digest in batch if digest["user_id"] in pending))
+    sent = [digest_id for digest_id in sent if digest_id is not None]
+    await repository_birthdays.mark_digests_sent(sent, db)
+    return len(sent)
+
+
+async def run_shard(shard: int, shards: int, last_user_id: int, days: int, digest_date: date, 
+                    batch_size: int = config.BIRTHDAY_JOB_BATCH_SIZE, 
+                    concurrency: int = config.BIRTHDAY_JOB_CONCURRENCY) -> int | None:
+    """
+    The run_shard function sends the digests of one shard.
+    
+    :param shard: int: Shard number
+    :param shards: int: Total number of shards
+    :param last_user_id: int: Upper bound of the shard ranges, see max_user_id
+    :param days: int: Number of days to look ahead
+    :param digest_date: date: Day the digests are sent for
+    :param batch_size: int: Number of users queued per write transaction
+    :param concurrency: int: Maximum number of emails sent at the same time
+    :return: The number of digests sent, or None if the shard is locked by another process
+    :doc-author: Trelent
+    """
+    sent = 0
+    async with sessionmanager.session() as reader, sessionmanager.session() as writer:
+        if not await try_lock_shard(reader, digest_date, shard, shards):
+            return None
+        user_ids = repository_birthdays.shard_range(shard, shards, last_user_id)
+        batch = []
+        async for digest in repository_birthdays.iter_upcoming_birthdays(days, user_ids, reader, 
+                                                                          digest_date, yield_per=batch_size):
+            batch.append(digest)
+            if len(batch) >= batch_size:
+                sent += await send_batch(batch, days, digest_date, writer, concurrency)
+                batch = []
+        sent += await send_batch(batch, days, digest_date, writer, concurrency)
+    return sent
+
+
+async def run(days: int, shards: int, shard: int | None = None, digest_date: date | None = None) -> int:
+    """
+    The run function sends the digests of one shard, or of every shard that is not locked by another process.
+    
+    :param days: int: Number of days to look ahead
+    :param shards: int: Total number of shards
+    :param shard: int | None: Run a single shard
+    :param digest_date: date | None: Day the digests are sent for, today by default
+    :return: The total number of digests sent
+    :doc-author: Trelent
+    """
+    digest_date = digest_date or date.today()
+    async with sessionmanager.session() as db:
+        last_user_id = await repository_birthdays.max_user_id(db, digest_date)
+    total = 0
+    for number in ([shard] if shard is not None else range(shards)):
+        start = time.perf_counter()
+        sent = await run_shard(number, shards, last_user_id, days, digest_date)
+        if sent is None:
+            print(f"Shard {number}/{shards} is locked by another process, skipped")
+            continue
+        total += sent
+        print(f"Shard {number}/{shards}: {sent} digests sent in {time.perf_counter() - start:.1f}s")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send birthday digests to all users")
+    parser.add_argument("--days", type=int, default=config.BIRTHDAY_DIGEST_DAYS)
+    parser.add_argument("--shards", type=int, default=config.BIRTHDAY_JOB_SHARDS)
+    parser.add_argument("--shard", type=int, default=None)
+    parser.add_argument("--date", type=date.fromisoformat, default=None)
+    args = parser.parse_args()
+    total = asyncio.run(run(args.days, args.shards, args.shard, args.date))
+    print(f"{total} digests sent")
+
+
+if __name__ == "__main__":
+    main()
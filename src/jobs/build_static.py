@@ -0,0 +1,101 @@
+"""
+Build step for the static files: copies ``src/static`` to ``STATIC_BUILD_DIR`` with the content hash
+in every file name (``product.css`` -> ``product.1a2b3c4d5e.css``), writes ``.gz`` and, when brotli
+is installed, ``.br`` siblings of the text files, and records the hashed names in ``manifest.json``.
+
+Files of earlier builds are kept, so pages rendered before a deploy still find their assets.
+The manifest is written last, a running server never sees names that are not on disk yet.
+
+    python -m src.jobs.build_static
+    python -m src.jobs.build_static --source src/static --target build/static
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+from src.config.config import config
+from src.services.assets import MANIFEST, PRECOMPRESSED_SUFFIXES
+
+try:
+    import brotli
+except ImportError:  # without brotli only .gz siblings are written
+    brotli = None
+
+
+def fingerprint(path: Path, content: bytes) -> Path:
+    """
+    The fingerprint function puts the first 10 hex digits of the sha256 of the content into the file name.
+
+    :param path: Path: Path of the file relative to the source directory
+    :param content: bytes: Content of the file
+    :return: The hashed path
+    :doc-author: Trelent
+    """
+    digest = hashlib.sha256(content).hexdigest()[:10]
+    return path.with_name(f"{path.stem}.{digest}{path.suffix}")
+
+
+def write_precompressed(path: Path, content: bytes) -> None:
+    """
+    The write_precompressed function writes the .gz and .br siblings of a file at the highest levels,
+        the build runs once per deploy. A sibling that is not smaller than the file is not written.
+
+    :param path: Path: Path of the built file
+    :param content: bytes: Content of the file
+    :return: None
+    :doc-author: Trelent
+    """
+    variants = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(content, quality=11)
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(content):
+            path.with_name(path.name + suffix).write_bytes(compressed)
+
+
+def build(source: Path, target: Path) -> dict[str, str]:
+    """
+    The build function copies every file of source to target twice, under its own name and under the
+        hashed name, precompresses the text files and writes the manifest.
+
+    :param source: Path: Directory with the static files
+    :param target: Path: Directory served at /static
+    :return: The manifest, the hashed path of every file by its path relative to source
+    :doc-author: Trelent
+    """
+    manifest = {}
+    for path in sorted(source.rglob("*")):
+        if not path.is_file():
+            continue
+        relative = path.relative_to(source)
+        content = path.read_bytes()
+        hashed = fingerprint(relative, content)
+        for name in (relative, hashed):
+            built = target / name
+            built.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(path, built)
+            if path.suffix in PRECOMPRESSED_SUFFIXES:
+                write_precompressed(built, content)
+        manifest[relative.as_posix()] = hashed.as_posix()
+    target.mkdir(parents=True, exist_ok=True)
+    partial = target / f"{MANIFEST}.tmp"
+    partial.write_text(json.dumps(manifest, indent=2, sort_keys=True))
+    os.replace(partial, target / MANIFEST)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress the static files")
+    parser.add_argument("--source", type=Path, default=Path("src/static"))
+    parser.add_argument("--target", type=Path, default=Path(config.STATIC_BUILD_DIR))
+    args = parser.parse_args()
+    manifest = build(args.source, args.target)
+    print(f"{len(manifest)} files built into {args.target}")
+
+
+if __name__ == "__main__":
+    main()
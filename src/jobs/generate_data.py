@@ -0,0 +1,304 @@
+"""
+Loads synthetic users and contacts for benchmarks and load tests.
+
+Users are generated in chunks of --chunk-size users, every chunk is loaded in one transaction
+and the chunks are split between --workers processes. On Postgres the rows are streamed with COPY
+through asyncpg, on other databases they are inserted in batches of --batch-size rows.
+The chunks are deterministic for a given --seed and only the users that are not in the database yet
+are loaded, so an interrupted run is resumed by starting it again, and a larger --users adds users.
+
+The number of contacts per user is log-normal around --contacts (most users have a few, some have
+hundreds), first names and surnames follow a Zipf-like popularity, birthdays are spread over ages 16-85.
+Every user can log in as datagen<n>@example.com with the password "datagen-password".
+Postgres is expected to be migrated, other databases get their tables created.
+
+    python -m src.jobs.generate_data --users 100000 --contacts 100          # about 10M contacts
+    python -m src.jobs.generate_data --users 1000 --contacts 50 --db-url sqlite+aiosqlite:///datagen.db
+"""
+import argparse
+import asyncio
+import math
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import insert, make_url, select
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from src.config.config import config
+from src.entity.models import Base, Contact, User
+
+
+EMAIL_PREFIX = "datagen"
+PASSWORD = "datagen-password"
+
+FIRST_NAMES = ["Olena", "Oleksandr", "Iryna", "Andrii", "Nataliia", "Dmytro", "Mariia", "Serhii", "Oksana", "Yurii",
+               "Tetiana", "Volodymyr", "Sofiia", "Mykola", "Kateryna", "Taras", "Yuliia", "Bohdan", "Anna", "Ivan",
+               "Viktoriia", "Roman", "Liudmyla", "Maksym", "Halyna", "Petro", "Daryna", "Vasyl", "Khrystyna", "Artem"]
+SURNAMES = ["Melnyk", "Shevchenko", "Boiko", "Kovalenko", "Bondarenko", "Tkachenko", "Kovalchuk", "Kravchenko",
+            "Oliinyk", "Shevchuk", "Koval", "Polishchuk", "Bondar", "Tkachuk", "Moroz", "Marchenko", "Lysenko",
+            "Rudenko", "Savchenko", "Petrenko", "Klymenko", "Pavlenko", "Savchuk", "Kuzmenko", "Ponomarenko"]
+EMAIL_DOMAINS = ["gmail.com", "ukr.net", "i.ua", "meta.ua", "outlook.com", "yahoo.com", "proton.me"]
+PHONE_CODES = ["50", "66", "95", "99", "67", "68", "96", "97", "98", "63", "73", "93"]
+NOTES = ["", "", "", "work", "family", "gym", "university", "neighbour", "call back", "met at the conference"]
+
+
+def zipf_weights(count: int, exponent: float = 1.0) -> list[float]:
+    """
+    The zipf_weights function returns cumulative weights where the k-th item is k ** exponent times rarer
+        than the first, for random.choices(cum_weights=...).
+
+    :param count: int: Number of items
+    :param exponent: float: Skew, 0 gives a uniform choice
+    :return: The cumulative weights
+    :doc-author: Trelent
+    """
+    weights, total = [], 0.0
+    for rank in range(1, count + 1):
+        total += 1 / rank ** exponent
+        weights.append(total)
+    return weights
+
+
+FIRST_NAME_WEIGHTS = zipf_weights(len(FIRST_NAMES))
+SURNAME_WEIGHTS = zipf_weights(len(SURNAMES))
+DOMAIN_WEIGHTS = zipf_weights(len(EMAIL_DOMAINS), 1.5)
+
+# the API requires an avatar, users created through signup get a Gravatar URL
+AVATAR = "https://www.gravatar.com/avatar/"
+USER_COLUMNS = ("username", "email", "password", "avatar", "refresh_token", "created_at", "updated_at", "confirmed")
+CONTACT_COLUMNS = ("name", "surname", "phone_number", "email", "birthday", "notes", "created_at", "updated_at",
+                   "user_id")
+
+
+def user_email(index: int) -> str:
+    return f"{EMAIL_PREFIX}{index}@example.com"
+
+
+def contacts_per_user(rng: random.Random, mean: float) -> int:
+    """
+    The contacts_per_user function draws the size of one contact book from a log-normal distribution
+        with the given mean, capped at 50 times the mean.
+
+    :param rng: random.Random: Generator of the chunk
+    :param mean: float: Mean number of contacts per user
+    :return: The number of contacts
+    :doc-author: Trelent
+    """
+    if mean <= 0:
+        return 0
+    return min(int(rng.lognormvariate(math.log(mean) - 0.5, 1.0) + 0.5), int(mean * 50))
+
+
+def fake_contact(rng: random.Random, today: date, now: datetime) -> tuple:
+    """
+    The fake_contact function generates the values of one contact in CONTACT_COLUMNS order, without user_id.
+
+    :param rng: random.Random: Generator of the chunk
+    :param today: date: Day the ages are counted from
+    :param now: datetime: Creation time of the rows
+    :return: A tuple of column values
+    :doc-author: Trelent
+    """
+    name = rng.choices(FIRST_NAMES, cum_weights=FIRST_NAME_WEIGHTS)[0]
+    surname = rng.choices(SURNAMES, cum_weights=SURNAME_WEIGHTS)[0]
+    domain = rng.choices(EMAIL_DOMAINS, cum_weights=DOMAIN_WEIGHTS)[0]
+    birthday = today - timedelta(days=int(rng.triangular(16, 85, 32) * 365.25))
+    return (name, surname, f"+380{rng.choice(PHONE_CODES)}{rng.randrange(10 ** 7):07d}",
+            f"{name.lower()}.{surname.lower()}{rng.randrange(1000)}@{domain}", birthday,
+            rng.choice(NOTES), now, now)
+
+
+def generate_chunk(chunk: int, chunk_size: int, users: int, contacts: float, seed: int, password: str,
+                   now: datetime | None = None) -> tuple[list[tuple], list[list[tuple]]]:
+    """
+    The generate_chunk function generates the users of one chunk and the contacts of every user.
+        Apart from the timestamps the result only depends on the arguments, which is what makes the load resumable.
+
+    :param chunk: int: Chunk number
+    :param chunk_size: int: Users per chunk
+    :param users: int: Total number of users, the last chunk may be smaller
+    :param contacts: float: Mean number of contacts per user
+    :param seed: int: Seed of the whole data set
+    :param password: str: Password hash shared by all users
+    :param now: datetime | None: Creation time of the rows, the current time by default
+    :return: The user rows in USER_COLUMNS order and, for every user, its contact rows without user_id
+    :doc-author: Trelent
+    """
+    rng = random.Random(seed * 1_000_003 + chunk)
+    now = now or datetime.utcnow()
+    today = now.date()
+    user_rows, contact_rows = [], []
+    for index in range(chunk * chunk_size, min((chunk + 1) * chunk_size, users)):
+        user_rows.append((f"{EMAIL_PREFIX}{index}", user_email(index), password, AVATAR, None, now, now, True))
+        contact_rows.append([fake_contact(rng, today, now) for _ in range(contacts_per_user(rng, contacts))])
+    return user_rows, contact_rows
+
+
+async def copy_chunk(connection, user_rows: list[tuple], contact_rows: list[list[tuple]]) -> int:
+    """
+    The copy_chunk function loads a chunk into Postgres with two COPY statements,
+        the ids of the users are read back in between.
+
+    :param connection: asyncpg.Connection: Connection inside the transaction of the chunk
+    :param user_rows: list[tuple]: Rows of the users
+    :param contact_rows: list[list[tuple]]: Rows of the contacts of every user
+    :return: The number of contacts loaded
+    :doc-author: Trelent
+    """
+    await connection.copy_records_to_table("users", records=user_rows, columns=USER_COLUMNS)
+    ids = dict(await connection.fetch("SELECT email, id FROM users WHERE email = any($1::text[])",
+                                      [row[1] for row in user_rows]))
+    records = [row + (ids[user[1]],) for user, rows in zip(user_rows, contact_rows) for row in rows]
+    await connection.copy_records_to_table("contacts", records=records, columns=CONTACT_COLUMNS)
+    return len(records)
+
+
+async def insert_chunk(connection, user_rows: list[tuple], contact_rows: list[list[tuple]], batch_size: int) -> int:
+    """
+    The insert_chunk function loads a chunk with multi-row INSERT statements of batch_size rows.
+
+    :param connection: AsyncConnection: Connection inside the transaction of the chunk
+    :param user_rows: list[tuple]: Rows of the users
+    :param contact_rows: list[list[tuple]]: Rows of the contacts of every user
+    :param batch_size: int: Rows per statement
+    :return: The number of contacts loaded
+    :doc-author: Trelent
+    """
+    result = await connection.execute(
+        insert(User.__table__).returning(User.__table__.c.id, sort_by_parameter_order=True),
+        [dict(zip(USER_COLUMNS, row)) for row in user_rows])
+    records = [dict(zip(CONTACT_COLUMNS, row + (user_id,)))
+               for user_id, rows in zip(result.scalars().all(), contact_rows) for row in rows]
+    for start in range(0, len(records), batch_size):
+        await connection.execute(insert(Contact.__table__), records[start:start + batch_size])
+    return len(records)
+
+
+def chunk_emails(chunk: int, chunk_size: int, users: int) -> list[str]:
+    return [user_email(index) for index in range(chunk * chunk_size, min((chunk + 1) * chunk_size, users))]
+
+
+def skip_existing(existing: set[str], user_rows: list[tuple],
+                  contact_rows: list[list[tuple]]) -> tuple[list[tuple], list[list[tuple]]]:
+    """
+    The skip_existing function drops the users that are already loaded, and their contacts, from a chunk.
+        A chunk loaded by a run with fewer --users has only its first users, the rest is added by a larger run.
+
+    :param existing: set[str]: Emails of the users of the chunk found in the database
+    :param user_rows: list[tuple]: Rows of the users
+    :param contact_rows: list[list[tuple]]: Rows of the contacts of every user
+    :return: The rows of the users that are missing
+    :doc-author: Trelent
+    """
+    keep = [i for i, row in enumerate(user_rows) if row[1] not in existing]
+    return [user_rows[i] for i in keep], [contact_rows[i] for i in keep]
+
+
+async def load_chunks(url: str, chunks: list[int], chunk_size: int, users: int, contacts: float, seed: int,
+                      password: str, batch_size: int) -> tuple[int, int]:
+    """
+    The load_chunks function loads the users of the given chunks that are not in the database yet,
+        one transaction per chunk.
+
+    :param url: str: SQLAlchemy URL of the database
+    :param chunks: list[int]: Chunk numbers
+    :param chunk_size: int: Users per chunk
+    :param users: int: Total number of users
+    :param contacts: float: Mean number of contacts per user
+    :param seed: int: Seed of the whole data set
+    :param password: str: Password hash shared by all users
+    :param batch_size: int: Rows per INSERT statement, not used with COPY
+    :return: The number of users and contacts loaded
+    :doc-author: Trelent
+    """
+    loaded_users = loaded_contacts = 0
+    url = make_url(url)
+    if url.get_backend_name() == "postgresql":
+        import asyncpg
+
+        connection = await asyncpg.connect(url.set(drivername="postgresql").render_as_string(hide_password=False))
+        try:
+            for chunk in chunks:
+                emails = chunk_emails(chunk, chunk_size, users)
+                async with connection.transaction():
+                    existing = {row[0] for row in await connection.fetch(
+                        "SELECT email FROM users WHERE email = any($1::text[])", emails)}
+                    if len(existing) == len(emails):
+                        continue
+                    user_rows, contact_rows = skip_existing(
+                        existing, *generate_chunk(chunk, chunk_size, users, contacts, seed, password))
+                    loaded_contacts += await copy_chunk(connection, user_rows, contact_rows)
+                loaded_users += len(user_rows)
+        finally:
+            await connection.close()
+        return loaded_users, loaded_contacts
+
+    # SQLite allows one writer at a time, the other processes wait for the lock instead of failing
+    engine = create_async_engine(url, connect_args={"timeout": 600} if url.get_backend_name() == "sqlite" else {})
+    try:
+        for chunk in chunks:
+            emails = chunk_emails(chunk, chunk_size, users)
+            async with engine.begin() as connection:
+                existing = set((await connection.execute(select(User.email).where(User.email.in_(emails)))).scalars())
+                if len(existing) == len(emails):
+                    continue
+                user_rows, contact_rows = skip_existing(
+                    existing, *generate_chunk(chunk, chunk_size, users, contacts, seed, password))
+                loaded_contacts += await insert_chunk(connection, user_rows, contact_rows, batch_size)
+            loaded_users += len(user_rows)
+    finally:
+        await engine.dispose()
+    return loaded_users, loaded_contacts
+
+
+def load_worker(arguments: tuple) -> tuple[int, int]:
+    return asyncio.run(load_chunks(*arguments))
+
+
+async def create_tables(url: str) -> None:
+    engine = create_async_engine(url)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load synthetic users and contacts")
+    parser.add_argument("--users", type=int, required=True)
+    parser.add_argument("--contacts", type=float, default=100, help="mean number of contacts per user")
+    parser.add_argument("--db-url", default=config.DB_URL)
+    parser.add_argument("--workers", type=int, default=0, help="processes, CPU count by default (1 on SQLite)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="users per transaction")
+    parser.add_argument("--batch-size", type=int, default=5000, help="rows per INSERT when COPY is not available")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    backend = make_url(args.db_url).get_backend_name()
+    if backend != "postgresql":
+        asyncio.run(create_tables(args.db_url))
+    workers = args.workers or (os.cpu_count() if backend == "postgresql" else 1)
+    # one bcrypt hash for everybody, hashing millions of passwords would take days
+    from src.services.auth import auth_service
+    password = auth_service.get_password_hash(PASSWORD)
+
+    chunks = math.ceil(args.users / args.chunk_size)
+    work = [(args.db_url, list(range(worker, chunks, workers)), args.chunk_size, args.users, args.contacts,
+             args.seed, password, args.batch_size) for worker in range(min(workers, chunks))]
+    start = time.perf_counter()
+    if len(work) == 1:
+        results = [load_worker(work[0])]
+    else:
+        with ProcessPoolExecutor(len(work)) as executor:
+            results = list(executor.map(load_worker, work))
+    elapsed = time.perf_counter() - start
+    users, contacts = map(sum, zip(*results)) if results else (0, 0)
+    print(f"{users} users and {contacts} contacts loaded in {elapsed:.1f}s "
+          f"({contacts / elapsed if elapsed else 0:.0f} contacts/s), "
+          f"{args.users - users} users were already there")
+
+
+if __name__ == "__main__":
+    main()
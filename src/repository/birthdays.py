@@ -0,0 +1,199 @@
+import calendar
+from datetime import date, datetime, timedelta
+from operator import itemgetter
+
+from sqlalchemy import select, update, extract, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.entity.models import BirthdayDigest, Contact, User
+
+
+def birthday_keys(n: int, today: date) -> list[int]:
+    """
+    The birthday_keys function turns the next n days into month * 100 + day keys,
+        so birthdays can be matched with a plain IN filter regardless of the birth year.
+        Contacts born on February 29 are matched on February 28 in non-leap years.
+    
+    :param n: int: Number of days to look ahead, today included
+    :param today: date: First day of the period
+    :return: A sorted list of integer keys
+    :doc-author: Trelent
+    """
+    keys = set()
+    for i in range(n + 1):
+        day = today + timedelta(days=i)
+        keys.add(day.month * 100 + day.day)
+        if day.month == 2 and day.day == 28 and not calendar.isleap(day.year):
+            keys.add(229)
+    return sorted(keys)
+
+
+async def max_user_id(db: AsyncSession, before: date) -> int:
+    """
+    The max_user_id function returns the highest id of the users created before the given day.
+        Every process of a day's run reads the same value, so they split the users into the same shard ranges.
+    
+    :param db: AsyncSession: Pass the database session to the function
+    :param before: date: Day the digests are sent for
+    :return: The highest user id, 0 if there are no users
+    :doc-author: Trelent
+    """
+    result = await db.execute(select(func.max(User.id)).where(User.created_at < before))
+    return result.scalar() or 0
+
+
+def shard_range(shard: int, shards: int, last_user_id: int) -> tuple[int, int | None]:
+    """
+    The shard_range function splits the user ids into shards of contiguous ranges.
+        A range reads contacts through the indexes that lead with user_id instead of scanning
+        the whole table once per shard. The last shard is open-ended, so newer users are not left out.
+    
+    :param shard: int: Shard number
+    :param shards: int: Total number of shards
+    :param last_user_id: int: Highest user id, see max_user_id
+    :return: A tuple of the first user id and the end of the range, excluded; None for the last shard
+    :doc-author: Trelent
+    """
+    span = last_user_id // shards + 1
+    return shard * span, (shard + 1) * span if shard < shards - 1 else None
+
+
+def upcoming_birthdays_stmt(n: int, user_ids: tuple[int, int | None], today: date):
+    """
+    The upcoming_birthdays_stmt function builds one set-based query for all confirmed users of a shard
+        whose contacts have birthdays within the next n days. Rows are ordered by user,
+        so they can be grouped into digests while streaming.
+    
+    :param n: int: Number of days to look ahead
+    :param user_ids: tuple[int, int | None]: User id range of the shard, see shard_range
+    :param today: date: First day of the period
+    :return: A select statement
+    :doc-author: Trelent
+    """
+    first, end = user_ids
+    bday_key = extract('month', Contact.birthday) * 100 + extract('day', Contact.birthday)
+    stmt = (select(User.id, User.email, User.username, 
+                   Contact.name, Contact.surname, Contact.phone_number, Contact.birthday)
+            .select_from(Contact)
+            .join(User, Contact.user_id == User.id)
+            .where(Contact.user_id >= first, 
+                   User.confirmed == True,
+                   bday_key.in_(birthday_keys(n, today)))
+            .order_by(Contact.user_id))
+    if end is not None:
+        stmt = stmt.where(Contact.user_id < end)
+    return stmt
+
+
+def next_birthday(birthday: date, today: date) -> date:
+    """
+    The next_birthday function returns the date of the next birthday on or after today.
+    
+    :param birthday: date: Birthday of the contact
+    :param today: date: Day to count from
+    :return: The date of the next birthday
+    :doc-author: Trelent
+    """
+    for year in (today.year, today.year + 1):
+        day = birthday.day
+        if birthday.month == 2 and day == 29 and not calendar.isleap(year):
+            day = 28
+        bday = date(year, birthday.month, day)
+        if bday >= today:
+            return bday
+
+
+def make_digest(rows: list, today: date) -> dict:
+    """
+    The make_digest function builds the digest of one user from its rows of the shard query.
+    
+    :param rows: list: All rows of the user
+    :param today: date: First day of the period
+    :return: A dict with user_id, email, username and the contacts sorted by their next birthday
+    :doc-author: Trelent
+    """
+    return {"user_id": rows[0][0], 
+            "email": rows[0].email, 
+            "username": rows[0].username,
+            "contacts": sorted(({"name": row.name, 
+                                 "surname": row.surname, 
+                                 "phone_number": row.phone_number,
+                                 "birthday": next_birthday(row.birthday, today)} for row in rows),
+                               key=itemgetter("birthday"))}
+
+
+async def iter_upcoming_birthdays(n: int, user_ids: tuple[int, int | None], db: AsyncSession, 
+                                  today: date, yield_per: int = 1000):
+    """
+    The iter_upcoming_birthdays function streams the shard query and yields one digest per user.
+        Rows are fetched in chunks of yield_per, so memory stays flat for large shards.
+        The rows of a user may span several chunks, so a digest is only yielded
+        once the next user starts or the rows run out.
+    
+    :param n: int: Number of days to look ahead
+    :param user_ids: tuple[int, int | None]: User id range of the shard, see shard_range
+    :param db: AsyncSession: Session used for streaming, it should not be used for writes meanwhile
+    :param today: date: First day of the period
+    :param yield_per: int: Number of rows fetched per round-trip
+    :return: An async iterator of dicts with user_id, email, username and contacts
+    :doc-author: Trelent
+    """
+    stmt = upcoming_birthdays_stmt(n, user_ids, today).execution_options(yield_per=yield_per)
+    result = await db.stream(stmt)
+    rows = []
+    async for partition in result.partitions():
+        for row in partition:
+            if rows and row[0] != rows[0][0]:
+                yield make_digest(rows, today)
+                rows = []
+            rows.append(row)
+    if rows:
+        yield make_digest(rows, today)
+
+
+async def claim_digests(digests: list[dict], digest_date: date, db: AsyncSession) -> dict[int, int]:
+    """
+    The claim_digests function queues one digest row per user and date.
+        Existing rows are left untouched thanks to the unique (user_id, digest_date) constraint,
+        so re-running the job never queues a second digest. Only digests that are not sent yet are returned.
+    
+    :param digests: list[dict]: Digests produced by iter_upcoming_birthdays
+    :param digest_date: date: Day the digests are sent for
+    :param db: AsyncSession: Pass the database session to the function
+    :return: A dict of user_id to digest id for the digests that still have to be sent
+    :doc-author: Trelent
+    """
+    if not digests:
+        return {}
+    dialect = postgresql if db.bind.dialect.name == 'postgresql' else sqlite
+    now = datetime.now()
+    stmt = (dialect.insert(BirthdayDigest)
+            .values([{"user_id": digest["user_id"], 
+                      "digest_date": digest_date, 
+                      "contacts_count": len(digest["contacts"]),
+                      "created_at": now} for digest in digests])
+            .on_conflict_do_nothing(index_elements=['user_id', 'digest_date']))
+    await db.execute(stmt)
+    stmt = (select(BirthdayDigest.user_id, BirthdayDigest.id)
+            .where(BirthdayDigest.user_id.in_([digest["user_id"] for digest in digests]),
+                   BirthdayDigest.digest_date == digest_date,
+                   BirthdayDigest.sent_at == None))
+    pending = await db.execute(stmt)
+    await db.commit()
+    return dict(pending.all())
+
+
+async def mark_digests_sent(digest_ids: list[int], db: AsyncSession) -> None:
+    """
+    The mark_digests_sent function marks the given digests as sent.
+    
+    :param digest_ids: list[int]: Ids of the digests that were delivered
+    :param db: AsyncSession: Pass the database session to the function
+    :return: None
+    :doc-author: Trelent
+    """
+    if digest_ids:
+        stmt = update(BirthdayDigest).where(BirthdayDigest.id.in_(digest_ids)).values(sent_at=datetime.now())
+        await db.execute(stmt)
+    await db.commit()
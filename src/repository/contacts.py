@@ -1,12 +1,34 @@
+import calendar
 from datetime import timedelta, datetime
 
-from sqlalchemy import select
+from sqlalchemy import select, bindparam
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.entity.models import Contact, User
 from src.schemas.contact import ContactSchema
+from src.services.contact_cache import contact_cache
+from src.services.tracing import traced
 
 
+'''Statements are built once: SQLAlchemy memoizes their cache key, so every call reuses the compiled SQL
+and asyncpg reuses the prepared statement of the connection'''
+
+_get_contacts_stmt = (select(Contact)
+                      .where(Contact.user_id == bindparam('user_id'))
+                      .offset(bindparam('offset'))
+                      .limit(bindparam('limit')))
+_get_contact_stmt = select(Contact).where(Contact.id == bindparam('contact_id'), 
+                                          Contact.user_id == bindparam('user_id'))
+_search_by_name_stmt = select(Contact).where(Contact.name == bindparam('name'), 
+                                             Contact.user_id == bindparam('user_id'))
+_search_by_surname_stmt = select(Contact).where(Contact.surname == bindparam('surname'), 
+                                                Contact.user_id == bindparam('user_id'))
+_search_by_email_stmt = select(Contact).where(Contact.email == bindparam('email'), 
+                                              Contact.user_id == bindparam('user_id'))
+_birthdays_stmt = select(Contact).where(Contact.user_id == bindparam('user_id'), Contact.birthday != None)
+
+
+@traced(attributes=("limit", "offset", "user.id"))
 async def get_contacts(limit: int, offset: int, db: AsyncSession, user: User):
     """
     The get_contacts function returns a list of contacts for the given user.
@@ -18,10 +40,10 @@ async def get_contacts(limit: int, offset: int, db: AsyncSession, user: User):
     :return: A list of contact objects
     :doc-author: Trelent
     """
-    stmt = select(Contact).filter_by(user=user).offset(offset).limit(limit)
-    contacts = await db.execute(stmt)
+    contacts = await db.execute(_get_contacts_stmt, {"user_id": user.id, "offset": offset, "limit": limit})
     return contacts.scalars().all()
 
+@traced(attributes=("user.id",))
 async def search_contact_by_name(contact_name: str, db: AsyncSession, user: User):
     """
     The search_contact_by_name function searches for a contact by name.
@@ -36,11 +58,11 @@ async def search_contact_by_name(contact_name: str, db: AsyncSession, user: User
     :return: A list of contact objects
     :doc-author: Trelent
     """
-    stmt = select(Contact).filter_by(name=contact_name, user=user)
-    contact = await db.execute(stmt)
+    contact = await db.execute(_search_by_name_stmt, {"name": contact_name, "user_id": user.id})
     return contact.scalars().all()
 
 
+@traced(attributes=("user.id",))
 async def search_contact_by_surname(contact_surname: str, db: AsyncSession, user: User):
     """
     The search_contact_by_surname function searches for a contact by surname.
@@ -55,11 +77,11 @@ async def search_contact_by_surname(contact_surname: str, db: AsyncSession, user
     :return: A list of contacts
     :doc-author: Trelent
     """
-    stmt = select(Contact).filter_by(surname=contact_surname, user=user)
-    contact = await db.execute(stmt)
+    contact = await db.execute(_search_by_surname_stmt, {"surname": contact_surname, "user_id": user.id})
     return contact.scalars().all()
 
 
+@traced(attributes=("user.id",))
 async def search_contact_by_email(contact_email: str, db: AsyncSession, user: User):
     """
     The search_contact_by_email function searches for a contact by email.
@@ -76,11 +98,11 @@ async def search_contact_by_email(contact_email: str, db: AsyncSession, user: Us
     :return: A single contact
     :doc-author: Trelent
     """
-    stmt = select(Contact).filter_by(email=contact_email, user=user)
-    contact = await db.execute(stmt)
+    contact = await db.execute(_search_by_email_stmt, {"email": contact_email, "user_id": user.id})
     return contact.scalar_one_or_none()
 
 
+@traced(attributes=("n", "user.id"))
 async def get_contact_by_birthday(n:int, db: AsyncSession, user: User):
     """
     The get_contact_by_birthday function takes in a number of days and returns all contacts with birthdays within that time frame.
@@ -99,14 +121,16 @@ async def get_contact_by_birthday(n:int, db: AsyncSession, user: User):
     seven_days_later = start + timedelta(days=n)
     contacts_with_bdays = []
 
-    stmt = select(Contact).filter_by(user=user).where(Contact.birthday != None)
-    contacts = await db.execute(stmt)
+    contacts = await db.execute(_birthdays_stmt, {"user_id": user.id})
     contacts = contacts.scalars().all()
     
     for contact in contacts:
+        day = contact.birthday.day
+        if contact.birthday.month == 2 and day == 29 and not calendar.isleap(start.year):
+            day = 28
         bday_this_year = datetime(year=start.year, 
                                   month=contact.birthday.month, 
-                                  day=contact.birthday.day)
+                                  day=day)
 
         if bday_this_year >= start and bday_this_year <= seven_days_later:
             contacts_with_bdays.append(contact)
@@ -114,6 +138,7 @@ async def get_contact_by_birthday(n:int, db: AsyncSession, user: User):
     return contacts_with_bdays
 
 
+@traced(attributes=("contact_id", "user.id"))
 async def get_contact(contact_id:int, db: AsyncSession, user: User):
     """
     The get_contact function returns a contact object from the database.
@@ -124,11 +149,11 @@ async def get_contact(contact_id:int, db: AsyncSession, user: User):
     :return: A contact object
     :doc-author: Trelent
     """
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
-    contact = await db.execute(stmt)
+    contact = await db.execute(_get_contact_stmt, {"contact_id": contact_id, "user_id": user.id})
     return contact.scalar_one_or_none()
 
 
+@traced(attributes=("user.id",))
 async def create_contact(body: ContactSchema, db: AsyncSession, user: User):
     """
     The create_contact function creates a new contact in the database.
@@ -141,15 +166,18 @@ async def create_contact(body: ContactSchema, db: AsyncSession, user: User):
     """
     contact = Contact(**body.model_dump(exclude_unset=True), user=user)
     db.add(contact)
+    # read before the commit, which expires the user when the session has expire_on_commit
+    user_id = user.id
     await db.commit()
+    await contact_cache.invalidate(user_id)
     await db.refresh(contact)
     return contact
 
 
 
+@traced(attributes=("contact_id", "user.id"))
 async def update_contact(contact_id: int, body: ContactSchema, db: AsyncSession, user: User):
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
-    result = await db.execute(stmt)
+    result = await db.execute(_get_contact_stmt, {"contact_id": contact_id, "user_id": user.id})
     contact = result.scalar_one_or_none()
     if contact:
         contact.name = body.name
@@ -158,19 +186,23 @@ async def update_contact(contact_id: int, body: ContactSchema, db: AsyncSession,
         contact.email = body.email
         contact.birthday = body.birthday
         contact.notes = body.notes
+        user_id = user.id
         await db.commit()
+        await contact_cache.invalidate(user_id)
         await db.refresh(contact)
     return contact
     
 
 
+@traced(attributes=("contact_id", "user.id"))
 async def delete_contact(contact_id:int, db: AsyncSession, user: User):
-    stmt = select(Contact).filter_by(id=contact_id, user=user)
-    contact = await db.execute(stmt)
+    contact = await db.execute(_get_contact_stmt, {"contact_id": contact_id, "user_id": user.id})
     contact = contact.scalar_one_or_none()
     if contact:
         await db.delete(contact)
+        user_id = user.id
         await db.commit()
+        await contact_cache.invalidate(user_id)
     return contact
 
 
@@ -1,5 +1,5 @@
 from fastapi import Depends
-from sqlalchemy import select
+from sqlalchemy import select, bindparam
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from libgravatar import Gravatar
@@ -7,9 +7,14 @@ from libgravatar import Gravatar
 from src.database.db import get_db
 from src.entity.models import User
 from src.schemas.user import UserSchema
+from src.services.contact_cache import contact_cache
+from src.services.tracing import traced
 
 
+_get_user_by_email_stmt = select(User).where(User.email == bindparam('email'))
 
+
+@traced()
 async def get_user_by_email(email: str, db: AsyncSession = Depends(get_db)):
     """
     The get_user_by_email function returns a user object from the database based on the email address provided.
@@ -20,12 +25,12 @@ async def get_user_by_email(email: str, db: AsyncSession = Depends(get_db)):
     :return: A user object
     :doc-author: Trelent
     """
-    stmt = select(User).filter_by(email=email)
-    user = await db.execute(stmt)
+    user = await db.execute(_get_user_by_email_stmt, {"email": email})
     user = user.scalar_one_or_none()
     return user
 
 
+@traced()
 async def create_user(body: UserSchema, db: AsyncSession = Depends(get_db)):
     """
     The create_user function creates a new user in the database.
@@ -50,6 +55,7 @@ async def create_user(body: UserSchema, db: AsyncSession = Depends(get_db)):
     return new_user
 
 
+@traced(attributes=("user.id",))
 async def update_token(user: User, token: str | None, db: AsyncSession = Depends(get_db)):
     """
     The update_token function updates the refresh_token of a user.
@@ -67,6 +73,7 @@ async def update_token(user: User, token: str | None, db: AsyncSession = Depends
     await db.commit()
 
 
+@traced()
 async def confirmed_email(email: str, db: AsyncSession) -> None:
     """
     The confirmed_email function marks a user as confirmed in the database.
@@ -81,6 +88,7 @@ async def confirmed_email(email: str, db: AsyncSession) -> None:
     await db.commit()
 
 
+@traced()
 async def update_avatar_url(email: str, url: str | None, db: AsyncSession) -> User:
     """
     The update_avatar_url function updates the avatar url of a user.
@@ -93,11 +101,15 @@ async def update_avatar_url(email: str, url: str | None, db: AsyncSession) -> Us
     """
     user = await get_user_by_email(email, db)
     user.avatar = url
+    user_id = user.id
     await db.commit()
+    # cached contact responses embed the owner with the avatar
+    await contact_cache.invalidate(user_id)
     await db.refresh(user)
     return user
 
 
+@traced()
 async def update_password(email: str, new_password: str, db: AsyncSession) -> User:
     """
     The update_password function updates the password of a user.
@@ -1,25 +1,63 @@
 from datetime import date
 
+import orjson
 from fastapi import APIRouter, HTTPException, Depends, status, Path, Query
+from fastapi.responses import Response
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi_limiter.depends import RateLimiter
 
 from src.entity.models import User
-from src.services.auth import auth_service
-from src.database.db import get_db
+from src.services.auth import RateLimitedUser, RateLimitedReadUser
+from src.database.db import get_db, get_read_db, is_replica
 from src.repository import contacts as repository_contacts
-from src.schemas.contact  import ContactSchema, ContactResponse
+from src.schemas.contact  import ContactSchema, ContactResponse, contact_list_adapter
+from src.services.contact_cache import contact_cache
+from src.services.single_flight import single_flight
 
 
 router = APIRouter(prefix='/contacts', tags=['contacts'])
 
 
+def render_contacts(contacts) -> bytes:
+    # the one serializer of contact lists: every list route, cached or not, goes through it
+    contacts = contact_list_adapter.validate_python(contacts, from_attributes=True)
+    return orjson.dumps(contact_list_adapter.dump_python(contacts))
+
+
+def render_contact(contact) -> bytes:
+    return orjson.dumps(ContactResponse.model_validate(contact, from_attributes=True).model_dump())
+
+
+class RenderedResponse(Response):
+    """
+    Response for a body that is already JSON, e.g. shared by identical requests coalesced by single_flight.
+    """
+    media_type = "application/json"
+
+
+async def cached_query(user: User, query: tuple, render, db: AsyncSession) -> RenderedResponse:
+    """
+    The cached_query function answers a read of the user's contacts from the versioned contact cache,
+        rendering it on a miss; identical requests in flight share one lookup.
+        Bodies read from a replica are served but not cached, and not shared with requests reading the primary.
+
+    :param user: User: Owner of the contacts
+    :param query: tuple: The route name followed by the validated parameters
+    :param render: Coroutine function producing the body from the database
+    :param db: AsyncSession: The session render reads from
+    :return: The response
+    :doc-author: Trelent
+    """
+    replica = is_replica(db)
+    body = await single_flight.do((query[0], user.id, replica, *query[1:]),
+                                  lambda: contact_cache.fetch(user.id, query, render, store=not replica))
+    return RenderedResponse(body)
+
+
 @router.get('/', response_model=list[ContactResponse], 
-            description='No more than 1 requests per 20 sec',
-            dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+            description='No more than 1 requests per 20 sec')
 async def get_contacts(limit: int = Query(10, ge=10, le=500), 
-                       offset: int = Query(0, ge=0), db: AsyncSession = Depends(get_db), 
-                       user: User = Depends(auth_service.get_current_user)):
+                       offset: int = Query(0, ge=0), db: AsyncSession = Depends(get_read_db), 
+                       user: User = Depends(RateLimitedReadUser("contacts:list"))):
     """
     The get_contacts function returns a list of contacts for the current user.
         The limit and offset parameters are used to paginate the results.
@@ -35,22 +73,23 @@ async def get_contacts(limit: int = Query(10, ge=10, le=500),
     :return: A list of contact objects
     :doc-author: Trelent
     """
-    contacts = await repository_contacts.get_contacts(limit, offset, db, user)
-    return contacts
+    async def render() -> bytes:
+        return render_contacts(await repository_contacts.get_contacts(limit, offset, db, user))
+
+    return await cached_query(user, ("contacts:list", limit, offset), render, db)
 
 
 @router.get("/name", response_model=list[ContactResponse], 
-            description='No more than 1 requests per 20 sec',
-            dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+            description='No more than 1 requests per 20 sec')
 async def search_contact_by_name(contact_name: str, 
-                                 db: AsyncSession = Depends(get_db),
-                                 user: User = Depends(auth_service.get_current_user)):
+                                 db: AsyncSession = Depends(get_read_db),
+                                 user: User = Depends(RateLimitedReadUser("contacts:search"))):
     """
     The search_contact_by_name function searches for a contact by name.
         Args:
             contact_name (str): The name of the contact to search for.
-            db (AsyncSession, optional): An async database session object. Defaults to Depends(get_db).
-            user (User, optional): A User object containing information about the current user's session. Defaults to Depends(auth_service.get_current_user).
+            db (AsyncSession, optional): An async database session object. Defaults to Depends(get_read_db).
+            user (User, optional): A User object containing information about the current user's session. Defaults to Depends(RateLimitedReadUser("contacts:search")).
         Returns:
             Contact: A Contact object containing information about the searched-for contact.
     
@@ -60,24 +99,26 @@ async def search_contact_by_name(contact_name: str,
     :return: A contact object, which is a dict
     :doc-author: Trelent
     """
-    contact = await repository_contacts.search_contact_by_name(contact_name, db, user)
-    if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
-    return contact
+    async def render() -> bytes:
+        contact = await repository_contacts.search_contact_by_name(contact_name, db, user)
+        if contact is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+        return render_contacts(contact)
+
+    return await cached_query(user, ("contacts:name", contact_name), render, db)
 
 
 @router.get("/surname", response_model=list[ContactResponse], 
-            description='No more than 1 requests per 20 sec',
-            dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+            description='No more than 1 requests per 20 sec')
 async def search_contact_by_surname(contact_surname: str, 
-                                    db: AsyncSession = Depends(get_db),
-                                    user: User = Depends(auth_service.get_current_user)):
+                                    db: AsyncSession = Depends(get_read_db),
+                                    user: User = Depends(RateLimitedReadUser("contacts:search"))):
     """
     The search_contact_by_surname function searches for a contact by surname.
         Args:
             contact_surname (str): The surname of the contact to search for.
-            db (AsyncSession, optional): An async database session object. Defaults to Depends(get_db).
-            user (User, optional): A User object containing information about the current user's session. Defaults to Depends(auth_service.get_current_user).
+            db (AsyncSession, optional): An async database session object. Defaults to Depends(get_read_db).
+            user (User, optional): A User object containing information about the current user's session. Defaults to Depends(RateLimitedReadUser("contacts:search")).
         Returns:
             Contact: A Contact object containing information about the searched-for contact.
     
@@ -87,24 +128,26 @@ async def search_contact_by_surname(contact_surname: str,
     :return: A list of contacts
     :doc-author: Trelent
     """
-    contact = await repository_contacts.search_contact_by_surname(contact_surname, db, user)
-    if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
-    return contact
+    async def render() -> bytes:
+        contact = await repository_contacts.search_contact_by_surname(contact_surname, db, user)
+        if contact is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+        return render_contacts(contact)
+
+    return await cached_query(user, ("contacts:surname", contact_surname), render, db)
 
 
 @router.get("/email", response_model=ContactResponse, 
-            description='No more than 1 requests per 20 sec',
-            dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+            description='No more than 1 requests per 20 sec')
 async def search_contact_by_email(contact_email: str, 
-                                  db: AsyncSession = Depends(get_db),
-                                  user: User = Depends(auth_service.get_current_user)):
+                                  db: AsyncSession = Depends(get_read_db),
+                                  user: User = Depends(RateLimitedReadUser("contacts:search"))):
     """
     The search_contact_by_email function searches for a contact by email.
         Args:
             contact_email (str): The email of the contact to search for.
-            db (AsyncSession, optional): An async database session object. Defaults to Depends(get_db).
-            user (User, optional): A User object containing information about the current user's session. Defaults to Depends(auth_service.get_current_user).
+            db (AsyncSession, optional): An async database session object. Defaults to Depends(get_read_db).
+            user (User, optional): A User object containing information about the current user's session. Defaults to Depends(RateLimitedReadUser("contacts:search")).
     
     :param contact_email: str: Search for a contact by email
     :param db: AsyncSession: Pass the database session to the function
@@ -112,18 +155,20 @@ async def search_contact_by_email(contact_email: str,
     :return: A contact object
     :doc-author: Trelent
     """
-    contact = await repository_contacts.search_contact_by_email(contact_email, db, user)
-    if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
-    return contact
+    async def render() -> bytes:
+        contact = await repository_contacts.search_contact_by_email(contact_email, db, user)
+        if contact is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+        return render_contact(contact)
+
+    return await cached_query(user, ("contacts:email", contact_email), render, db)
 
 
 @router.get("/birthday", response_model=list[ContactResponse], 
-            description='No more than 1 requests per 20 sec',
-            dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+            description='No more than 1 requests per 20 sec')
 async def get_contact_by_birthday(n: int = 7, 
-                                  db: AsyncSession = Depends(get_db),
-                                  user: User = Depends(auth_service.get_current_user)):
+                                  db: AsyncSession = Depends(get_read_db),
+                                  user: User = Depends(RateLimitedReadUser("contacts:birthday"))):
     """
     The get_contact_by_birthday function returns a list of contacts with birthdays within the next n days.
         The default value for n is 7, but it can be changed by passing in an integer as a parameter.
@@ -134,19 +179,22 @@ async def get_contact_by_birthday(n: int = 7,
     :return: A list of contacts
     :doc-author: Trelent
     """
-    contacts = await repository_contacts.get_contact_by_birthday(n, db, user)
-    if contacts == []:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
-                            detail="There are no birthdays within the given period")
-    return contacts
+    async def render() -> bytes:
+        contacts = await repository_contacts.get_contact_by_birthday(n, db, user)
+        if contacts == []:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, 
+                                detail="There are no birthdays within the given period")
+        return render_contacts(contacts)
+
+    # the answer changes with the day
+    return await cached_query(user, ("contacts:birthday", n, date.today().isoformat()), render, db)
 
 
 @router.get('/{contact_id}', response_model=ContactResponse, 
-            description='No more than 1 requests per 20 sec',
-            dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+            description='No more than 1 requests per 20 sec')
 async def get_contact(contact_id: int, 
-                      db: AsyncSession = Depends(get_db),
-                      user: User = Depends(auth_service.get_current_user)):
+                      db: AsyncSession = Depends(get_read_db),
+                      user: User = Depends(RateLimitedReadUser("contacts:get"))):
     """
     The get_contact function returns a contact by its id.
         If the user is not logged in, an HTTP 401 Unauthorized error will be returned.
@@ -158,19 +206,21 @@ async def get_contact(contact_id: int,
     :return: A contact object
     :doc-author: Trelent
     """
-    contact = await repository_contacts.get_contact(contact_id, db, user)
-    if contact is None:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
-    return contact
+    async def render() -> bytes:
+        contact = await repository_contacts.get_contact(contact_id, db, user)
+        if contact is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+        return render_contact(contact)
+
+    return RenderedResponse(await single_flight.do(("contacts:get", user.id, is_replica(db), contact_id), render))
 
 
 @router.post('/', response_model=ContactResponse, 
              status_code=status.HTTP_201_CREATED, 
-             description='No more than 1 requests per 20 sec',
-            dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+             description='No more than 1 requests per 20 sec')
 async def create_contact(body: ContactSchema, 
                          db: AsyncSession = Depends(get_db),
-                         user: User = Depends(auth_service.get_current_user)):
+                         user: User = Depends(RateLimitedUser("contacts:create"))):
     """
     The create_contact function creates a new contact in the database.
         The function takes a ContactSchema object as input, and returns the newly created contact.
@@ -186,12 +236,11 @@ async def create_contact(body: ContactSchema,
 
 
 @router.put('/{contact_id}', 
-            description='No more than 1 requests per 20 sec',
-            dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+            description='No more than 1 requests per 20 sec')
 async def update_contact(body:ContactSchema, 
                          contact_id: int = Path(ge=1), 
                          db: AsyncSession = Depends(get_db),
-                         user: User = Depends(auth_service.get_current_user)):
+                         user: User = Depends(RateLimitedUser("contacts:update"))):
     """
     The update_contact function updates a contact in the database.
         The function takes an id, body and db as parameters.
@@ -211,11 +260,10 @@ async def update_contact(body:ContactSchema,
 
 
 @router.delete('/{contact_id}', status_code=status.HTTP_204_NO_CONTENT, 
-               description='No more than 1 requests per 20 sec',
-               dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+               description='No more than 1 requests per 20 sec')
 async def delete_contact(contact_id: int = Path(ge=1), 
                          db: AsyncSession = Depends(get_db),
-                         user: User = Depends(auth_service.get_current_user)):
+                         user: User = Depends(RateLimitedUser("contacts:delete"))):
     """
     The delete_contact function deletes a contact from the database.
         Args:
@@ -1,14 +1,12 @@
 import pickle
+from functools import lru_cache
 
-import cloudinary
-import cloudinary.uploader
 from fastapi import APIRouter, HTTPException, Depends, status, Path, Query, UploadFile, File
 from sqlalchemy.ext.asyncio import AsyncSession
-from fastapi_limiter.depends import RateLimiter
 
 
 from src.entity.models import User
-from src.services.auth import auth_service
+from src.services.auth import auth_service, RateLimitedUser, RateLimitedReadUser
 from src.schemas.user import UserResponse
 from src.database.db import get_db
 from src.config.config import config
@@ -16,15 +14,29 @@ from src.repository import users as repository_users
 
 
 router = APIRouter(prefix='/users', tags=['users'])
-cloudinary.config(cloud_name=config.CLD_NAME, 
-                  api_key=config.CLD_API_KEY, 
-                  api_secret=config.CLD_API_SECRET,
-                  secure=True)
+
+
+@lru_cache
+def cloudinary_client():
+    """
+    The cloudinary_client function imports and configures cloudinary on the first avatar upload,
+        so importing the routes has no side effects.
+    
+    :return: The configured cloudinary module
+    :doc-author: Trelent
+    """
+    import cloudinary
+    import cloudinary.uploader
+
+    cloudinary.config(cloud_name=config.CLD_NAME, 
+                      api_key=config.CLD_API_KEY, 
+                      api_secret=config.CLD_API_SECRET,
+                      secure=True)
+    return cloudinary
 
 @router.get('/me', response_model=UserResponse, 
-            description='No more than 1 requests per 20 sec',
-            dependencies=[Depends(RateLimiter(times=1, seconds=20))])
-async def get_current_user(user: User = Depends(auth_service.get_current_user)):
+            description='No more than 1 requests per 20 sec')
+async def get_current_user(user: User = Depends(RateLimitedReadUser("users:me"))):
     """
     The get_current_user function is a dependency that will be injected into the
         get_current_user endpoint. It uses the auth_service to retrieve the current user,
@@ -38,10 +50,9 @@ async def get_current_user(user: User = Depends(auth_service.get_current_user)):
 
 
 @router.patch('/avatar', response_model=UserResponse, 
-              description='No more than 1 requests per 20 sec',
-              dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+              description='No more than 1 requests per 20 sec')
 async def update_avatar(file: UploadFile = File(),  
-                        user: User = Depends(auth_service.get_current_user),
+                        user: User = Depends(RateLimitedUser("users:avatar")),
                         db: AsyncSession = Depends(get_db)):
     """
     The update_avatar function updates the avatar of a user.
@@ -56,6 +67,7 @@ async def update_avatar(file: UploadFile = File(),
     :return: The user object
     :doc-author: Trelent
     """
+    cloudinary = cloudinary_client()
     public_id = f"Web18/{user.email}"
     res = cloudinary.uploader.upload(file.file, public_id=public_id, owerite=True)
     print(res)
@@ -67,11 +79,10 @@ async def update_avatar(file: UploadFile = File(),
 
 
 @router.patch('/password', response_model=UserResponse, 
-              description='No more than 1 requests per 20 sec',
-              dependencies=[Depends(RateLimiter(times=1, seconds=20))])
+              description='No more than 1 requests per 20 sec')
 async def update_password(old_password: str,  
                           new_password: str,
-                          user: User = Depends(auth_service.get_current_user),
+                          user: User = Depends(RateLimitedUser("users:password")),
                           db: AsyncSession = Depends(get_db)):
     """
     The update_password function updates the password of a user.
@@ -1,7 +1,7 @@
 from typing import Optional
 from datetime import datetime, date
 
-from pydantic import BaseModel, EmailStr, Field, ConfigDict
+from pydantic import BaseModel, EmailStr, Field, ConfigDict, TypeAdapter
 
 from src.schemas.user import UserResponse
 
@@ -16,6 +16,8 @@ class ContactSchema(BaseModel):
 
 
 class ContactResponse(ContactSchema):
+    # stored emails were validated on the way in, re-validating them is most of the cost of a response
+    email: str = Field(json_schema_extra={"format": "email"})
     id: int = 1
     created_at: datetime | None
     updated_at: datetime | None
@@ -23,4 +25,7 @@ class ContactResponse(ContactSchema):
     
     model_config = ConfigDict(from_attributes = True)
 
+
+contact_list_adapter = TypeAdapter(list[ContactResponse])
+
     
\ No newline at end of file
@@ -0,0 +1,88 @@
+import json
+import os
+import stat
+from pathlib import Path
+
+import anyio.to_thread
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from src.services.compression import negotiate
+
+
+MANIFEST = "manifest.json"
+PRECOMPRESSED_SUFFIXES = frozenset({".css", ".html", ".js", ".json", ".map", ".svg", ".txt"})
+IMMUTABLE = "public, max-age=31536000, immutable"
+VARIANTS = {"br": (".br", ".gz"), "gzip": (".gz",)}
+
+
+def load_manifest(directory: str | os.PathLike) -> dict[str, str]:
+    """
+    The load_manifest function reads the manifest written by src.jobs.build_static.
+
+    :param directory: str | os.PathLike: Directory served at /static
+    :return: The hashed path of every static file by its source path, empty if the directory is not built
+    :doc-author: Trelent
+    """
+    try:
+        return json.loads(Path(directory, MANIFEST).read_text())
+    except FileNotFoundError:
+        return {}
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    StaticFiles serving the .br or .gz sibling of a file when the client accepts it, with the headers
+    of the original file. Fingerprinted files from the manifest are cached forever with immutable,
+    everything else is revalidated with its ETag.
+    """
+    def __init__(self, *, directory: str | os.PathLike, **kwargs):
+        super().__init__(directory=directory, **kwargs)
+        self.manifest = load_manifest(directory)
+        self.hashed = frozenset(self.manifest.values())
+
+    def asset(self, path: str) -> str:
+        """
+        The asset function maps a static file to its fingerprinted name, for templates:
+            {{ url_for('static', path=asset('product.css')) }}
+
+        :param self: Represent the instance of the class
+        :param path: str: Path of the file in src/static
+        :return: The hashed path, or path itself when the build has not run
+        :doc-author: Trelent
+        """
+        return self.manifest.get(path, path)
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = None
+        if scope["method"] in ("GET", "HEAD"):
+            response = await self.precompressed_response(path, scope)
+        if response is None:
+            response = await super().get_response(path, scope)
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = IMMUTABLE if path in self.hashed else "no-cache"
+        return response
+
+    async def precompressed_response(self, path: str, scope: Scope) -> Response | None:
+        """
+        The precompressed_response function looks for the sibling of path in the encoding the client prefers.
+
+        :param self: Represent the instance of the class
+        :param path: str: Requested path
+        :param scope: Scope: Scope of the request
+        :return: The response with the compressed file, or None if there is no sibling to serve
+        :doc-author: Trelent
+        """
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        for suffix in VARIANTS.get(encoding, ()):
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+                continue
+            # mimetypes skips the .gz/.br suffix, so the response keeps the type of the original file
+            response = self.file_response(full_path, stat_result, scope)
+            response.headers["Content-Encoding"] = "br" if suffix == ".br" else "gzip"
+            response.headers.add_vary_header("Accept-Encoding")
+            return response
+        return None
@@ -1,4 +1,7 @@
+import logging
+import math
 import pickle
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -10,21 +13,23 @@ from jose import JWTError, jwt
 import redis
 
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.repository import users as repository_users
 from src.config.config import config
+from src.services.metrics import USER_CACHE_ERROR, USER_CACHE_HIT, USER_CACHE_MISS
+from src.services.rate_limit import limiter, window_key, too_many_requests
+from src.services.tracing import traced, tracer
 
 
+logger = logging.getLogger(__name__)
+
 class Auth:
     
     pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
     SECRET_KEY = config.SECRET_KEY_JWT
     ALGORITHM = config.ALGORITHM
-    cache = redis.Redis(host=config.REDIS_DOMAIN, 
-                        port=config.REDIS_PORT, 
-                        db=0, 
-                        password=config.REDIS_PASSWORD)
 
+    @traced()
     def verify_password(self, plain_password, hashed_password):
         """
         The verify_password function takes a plain-text password and the hashed version of that password,
@@ -39,6 +44,7 @@ class Auth:
         """
         return self.pwd_context.verify(plain_password, hashed_password)
 
+    @traced()
     def get_password_hash(self, password: str):
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
@@ -55,6 +61,7 @@ class Auth:
 
 
     # define a function to generate a new access token
+    @traced()
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None):
         """
         The create_access_token function creates a new access token for the user.
@@ -77,6 +84,7 @@ class Auth:
 
 
     # define a function to generate a new refresh token
+    @traced()
     async def create_refresh_token(self, data: dict, expires_delta: Optional[float] = None):
         """
         The create_refresh_token function creates a refresh token for the user.
@@ -100,6 +108,7 @@ class Auth:
         return encoded_refresh_token
 
 
+    @traced()
     async def decode_refresh_token(self, refresh_token: str):
         """
         The decode_refresh_token function takes a refresh token and decodes it.
@@ -124,15 +133,14 @@ class Auth:
                                 detail='Could not validate credentials')
 
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    @traced()
+    def decode_access_token(self, token: str) -> str:
         """
-        The get_current_user function is a dependency that will be called by FastAPI to retrieve the current user.
-        It uses the token in the Authorization header of each request to validate and decode it, then returns an instance of User.
+        The decode_access_token function validates an access token and returns its subject.
         
         :param self: Represent the instance of the class
-        :param token: str: Get the token from the request header
-        :param db: AsyncSession: Get the database session
-        :return: A user object
+        :param token: str: Access token from the Authorization header
+        :return: The email of the user
         :doc-author: Trelent
         """
         credentials_exception = HTTPException(
@@ -149,23 +157,89 @@ class Auth:
                 raise credentials_exception
         except JWTError as e:
             raise credentials_exception
+        return email
 
+    @traced()
+    async def load_user(self, email: str, db: AsyncSession):
+        """
+        The load_user function returns the user from the cache, or from the database on a miss
+            and caches it for 5 minutes. The cache is the async Redis client shared with the rate limiter;
+            it is skipped before the app has started it and while the rate limiter has found Redis down,
+            so requests do not wait for a Redis that does not answer.
+        
+        :param self: Represent the instance of the class
+        :param email: str: Email of the user
+        :param db: AsyncSession: Session used on a cache miss
+        :return: A user object
+        :doc-author: Trelent
+        """
         user_hash = str(email)
-        user = self.cache.get(user_hash)
+        client = limiter.redis
+        use_cache = client is not None and limiter.healthy
+        user = None
+        if use_cache:
+            try:
+                with tracer.span("redis.get"):
+                    user = await client.get(user_hash)
+            except redis.RedisError as err:
+                # the cache is an optimization, a Redis outage must not fail authentication
+                logger.warning("user cache get failed, loading the user from the database: %s", err)
+                USER_CACHE_ERROR.inc()
+                use_cache = False
+            else:
+                (USER_CACHE_MISS if user is None else USER_CACHE_HIT).inc()
         
         if user is None:
-            print('User from DB')
+            logger.debug("user %s from the database", user_hash)
             user = await repository_users.get_user_by_email(email, db)
             if user is None:
-                raise credentials_exception
-            self.cache.set(user_hash, pickle.dumps(user))
-            self.cache.expire(user_hash, 300)
+                raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                                    detail="Could not validate credentials",
+                                    headers={"WWW-Authenticate": "Bearer"})
+            if use_cache:
+                try:
+                    with tracer.span("redis.set"):
+                        await client.set(user_hash, pickle.dumps(user), ex=300)
+                except redis.RedisError as err:
+                    logger.warning("user cache set failed: %s", err)
         else:
-            print('User from cache')
+            logger.debug("user %s from the cache", user_hash)
             user = pickle.loads(user)
         return user
+
+    @traced()
+    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+        """
+        The get_current_user function is a dependency that will be called by FastAPI to retrieve the current user.
+        It uses the token in the Authorization header of each request to validate and decode it, then returns an instance of User.
+        
+        :param self: Represent the instance of the class
+        :param token: str: Get the token from the request header
+        :param db: AsyncSession: Get the database session
+        :return: A user object
+        :doc-author: Trelent
+        """
+        email = self.decode_access_token(token)
+        return await self.load_user(email, db)
+    
+
+    @traced()
+    async def get_current_user_read(self, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_read_db)):
+        """
+        The get_current_user_read function is the get_current_user dependency for read-only routes.
+            On a cache miss the user is loaded through get_read_db, i.e. from a replica when one is configured.
+            Routes that write must use get_current_user, so the user is attached to the primary session.
+        
+        :param self: Represent the instance of the class
+        :param token: str: Get the token from the request header
+        :param db: AsyncSession: Get the read session
+        :return: A user object
+        :doc-author: Trelent
+        """
+        return await self.get_current_user(token, db)
     
 
+    @traced()
     def create_email_token(self, data: dict):
         """
         The create_email_token function takes a dictionary of data and returns a JWT token.
@@ -185,6 +259,7 @@ class Auth:
         return token
     
 
+    @traced()
     async def get_email_from_token(self, token: str):
         """
         The get_email_from_token function takes a token as an argument and returns the email address associated with that token.
@@ -207,4 +282,109 @@ class Auth:
 
 
 
-auth_service = Auth()
\ No newline at end of file
+auth_service = Auth()
+
+
+'''Rate limit and cached user in one Redis round trip'''
+
+# KEYS[1] cached user, KEYS[2] window counter of the rate limit (optional)
+# ARGV[1] requests to add to the counter, ARGV[2] ttl of the counter
+LIMITED_USER_SCRIPT = """
+local used = 0
+if KEYS[2] then
+    if tonumber(ARGV[1]) > 0 then
+        used = redis.call('INCRBY', KEYS[2], ARGV[1])
+        redis.call('EXPIRE', KEYS[2], ARGV[2])
+    else
+        used = tonumber(redis.call('GET', KEYS[2]) or '0')
+    end
+end
+return {redis.call('GET', KEYS[1]), used}
+"""
+
+
+class RateLimitedUser:
+    """
+    Route dependency that rate limits and authenticates the caller: the request is checked against
+    the local token bucket, then one Lua script both reconciles the bucket with its Redis window counter
+    and fetches the cached user. A cache miss costs one more round trip, the SET of the loaded user.
+
+        async def get_contacts(user: User = Depends(RateLimitedReadUser("contacts:list"))): ...
+    """
+    _script = None
+
+    def __init__(self, route: str):
+        self.route = route
+
+    async def __call__(self, token: str = Depends(Auth.oauth2_scheme), db: AsyncSession = Depends(get_db)):
+        return await self.resolve(token, db)
+
+    @classmethod
+    def script(cls, client):
+        if cls._script is None or cls._script.registered_client is not client:
+            cls._script = client.register_script(LIMITED_USER_SCRIPT)
+        return cls._script
+
+    @traced(attributes=("self.route",))
+    async def resolve(self, token: str, db: AsyncSession):
+        """
+        The resolve function rate limits the caller and returns the current user.
+        
+        :param self: Represent the instance of the class
+        :param token: str: Access token from the Authorization header
+        :param db: AsyncSession: Session used on a cache miss
+        :return: A user object
+        :doc-author: Trelent
+        """
+        email = auth_service.decode_access_token(token)
+        key = f"user:{email}"
+        if config.RATE_LIMIT_ENABLED:
+            retry_after = limiter.hit(self.route, key, config.RATE_LIMIT_USER_TIERS.get(email, "user"))
+            if retry_after:
+                raise too_many_requests(retry_after)
+        client = limiter.redis
+        if client is None or not limiter.healthy:
+            # probes Redis even when rate limiting is off, so the user cache comes back
+            limiter.schedule(time.monotonic())
+            return await auth_service.load_user(email, db)
+
+        bucket, pending = limiter.claim(self.route, key)
+        keys = [email]
+        if bucket is not None:
+            keys.append(window_key(self.route, key, bucket.period, time.time()))
+        try:
+            with tracer.span("redis.evalsha", script="limited_user", pending=pending):
+                cached, used = await self.script(client)(keys=keys,
+                                                         args=[pending, math.ceil(bucket.period) if bucket else 0])
+        except Exception as err:
+            if bucket is not None:
+                bucket.pending += pending
+            # e.g. a timeout: limit in memory and skip the cache until Redis answers a probe
+            limiter.fail(err)
+            return await auth_service.load_user(email, db)
+        if bucket is not None:
+            limiter.settle(bucket, used)
+        if cached is not None:
+            USER_CACHE_HIT.inc()
+            return pickle.loads(cached)
+        USER_CACHE_MISS.inc()
+
+        user = await repository_users.get_user_by_email(email, db)
+        if user is None:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED,
+                                detail="Could not validate credentials",
+                                headers={"WWW-Authenticate": "Bearer"})
+        try:
+            with tracer.span("redis.set"):
+                await client.set(email, pickle.dumps(user), ex=300)
+        except Exception as err:
+            logger.warning("user cache set failed: %s", err)
+        return user
+
+
+class RateLimitedReadUser(RateLimitedUser):
+    """
+    RateLimitedUser for read-only routes: on a cache miss the user is loaded through get_read_db.
+    """
+    async def __call__(self, token: str = Depends(Auth.oauth2_scheme), db: AsyncSession = Depends(get_read_db)):
+        return await self.resolve(token, db)
\ No newline at end of file
@@ -0,0 +1,185 @@
+import gzip
+import zlib
+from functools import lru_cache
+
+import anyio.to_thread
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.config.config import config
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, without it responses are only gzipped
+    brotli = None
+
+
+COMPRESSIBLE_TYPES = frozenset({"application/json", "application/javascript", "application/xml",
+                                "image/svg+xml", "text/css", "text/html", "text/javascript", "text/plain"})
+
+
+@lru_cache(maxsize=256)
+def negotiate(accept_encoding: str) -> str | None:
+    """
+    The negotiate function picks the response encoding from the Accept-Encoding header:
+        br when brotli is installed and the client accepts it, then gzip, honouring q=0.
+
+    :param accept_encoding: str: Accept-Encoding header of the request
+    :return: "br", "gzip" or None when the body must be sent as is
+    :doc-author: Trelent
+    """
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        coding, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip()] = q
+    wildcard = accepted.get("*", 0.0)
+    for coding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(coding, wildcard) > 0:
+            return coding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=config.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=config.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class StreamCompressor:
+    """
+    Incremental compressor for streamed responses.
+    """
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=config.COMPRESSION_BROTLI_QUALITY)
+            self._compress, self._finish = self._compressor.process, self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(config.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._compress, self._finish = self._compressor.compress, self._compressor.flush
+
+    def compress(self, chunk: bytes) -> bytes:
+        return self._compress(chunk)
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware compressing responses with brotli or gzip, as negotiated with Accept-Encoding.
+
+    Only bodies of an allowlisted content type and of at least minimum_size bytes are compressed;
+    responses that are already encoded, partial or empty pass through. Bodies of thread_size bytes
+    or more are compressed on a worker thread, so a large page does not block the event loop.
+    """
+    def __init__(self, app: ASGIApp,
+                 minimum_size: int = config.COMPRESSION_MINIMUM_SIZE,
+                 thread_size: int = config.COMPRESSION_THREAD_SIZE,
+                 content_types: frozenset[str] = COMPRESSIBLE_TYPES):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.thread_size = thread_size
+        self.content_types = content_types
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await CompressionResponder(self, encoding, send)(self.app, scope, receive)
+
+
+class CompressionResponder:
+    """
+    Wraps send for one response: holds back http.response.start until the first body chunk shows
+    whether the response is worth compressing.
+    """
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self.send = send
+        self.start: Message | None = None
+        self.compressor: StreamCompressor | None = None
+        self.passthrough = False
+
+    async def __call__(self, app: ASGIApp, scope: Scope, receive: Receive) -> None:
+        await app(scope, receive, self.send_wrapper)
+
+    def eligible(self, message: Message) -> bool:
+        headers = Headers(raw=message["headers"])
+        content_type = headers.get("content-type", "").partition(";")[0].strip().lower()
+        return (message["status"] not in (204, 206, 304)
+                and "content-encoding" not in headers
+                and "content-range" not in headers
+                and content_type in self.middleware.content_types)
+
+    async def send_wrapper(self, message: Message) -> None:
+        if self.passthrough:
+            await self.send(message)
+            return
+
+        if message["type"] == "http.response.start":
+            if self.eligible(message):
+                self.start = message
+            else:
+                self.passthrough = True
+                await self.send(message)
+            return
+
+        if message["type"] != "http.response.body":
+            # http.response.debug comes before the start, after it e.g. http.response.pathsend,
+            # where the server sends the file itself
+            if self.start is not None:
+                self.passthrough = True
+                await self.send(self.start)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None and not more_body:
+            if len(body) < self.middleware.minimum_size:
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+            if len(body) >= self.middleware.thread_size:
+                body = await anyio.to_thread.run_sync(compress, body, self.encoding)
+            else:
+                body = compress(body, self.encoding)
+            headers = self.set_encoding()
+            headers["Content-Length"] = str(len(body))
+            await self.send(self.start)
+            await self.send({"type": "http.response.body", "body": body})
+            return
+
+        if self.compressor is None:
+            self.compressor = StreamCompressor(self.encoding)
+            headers = self.set_encoding()
+            del headers["Content-Length"]
+            await self.send(self.start)
+
+        if len(body) >= self.middleware.thread_size:
+            chunk = await anyio.to_thread.run_sync(self.compressor.compress, body)
+        else:
+            chunk = self.compressor.compress(body)
+        if not more_body:
+            chunk += self.compressor.finish()
+        await self.send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+    def set_encoding(self) -> MutableHeaders:
+        headers = MutableHeaders(raw=self.start["headers"])
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        return headers
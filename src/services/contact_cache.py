@@ -0,0 +1,142 @@
+"""
+Redis cache of the rendered JSON of contact queries (list, searches, birthdays).
+
+Every user has a version counter. Entries are stored under the version that was current when they
+were looked up, and every write to the user's contacts increments the counter after its commit,
+so one INCR makes all cached queries of the user unreachable without looking for their keys;
+the orphaned entries expire on their own. Every store and every increment sets the ttl of the counter
+to the ttl of the entries, so the counter outlives the entries of all its versions and never goes back
+to a version whose entries still exist.
+
+A lookup is one Lua script that reads the version and the entry together. A hit skips the database
+and pydantic. While Redis is unavailable the queries go to the database.
+
+Misses are only stored when they were read from the primary: a lagging replica could return rows from
+before a write whose increment already happened, and its answer would be cached under the new version.
+"""
+import hashlib
+import logging
+
+import orjson
+
+from src.config.config import config
+from src.services.metrics import CONTACT_CACHE_ERROR, CONTACT_CACHE_HIT, CONTACT_CACHE_MISS
+from src.services.tracing import tracer
+
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] version counter of the user
+# ARGV[1] prefix of the entry keys of the user, ARGV[2] query part of the entry key
+LOOKUP_SCRIPT = """
+local version = redis.call('GET', KEYS[1]) or '0'
+return {version, redis.call('GET', ARGV[1] .. version .. ':' .. ARGV[2])}
+"""
+
+
+def user_prefix(user_id: int) -> str:
+    # the hash tag keeps all keys of a user in one cluster slot
+    return f"contacts:{{{user_id}}}:"
+
+
+def query_key(query: tuple) -> str:
+    """
+    The query_key function turns a query into the fixed-length part of its cache key,
+        e.g. ("contacts:name", "Olena") -> "contacts:name:<hash of the parameters>".
+
+    :param query: tuple: The route name followed by the validated parameters
+    :return: The key part
+    :doc-author: Trelent
+    """
+    digest = hashlib.blake2b(orjson.dumps(query[1:]), digest_size=12).hexdigest()
+    return f"{query[0]}:{digest}"
+
+
+class ContactCache:
+    """
+    Versioned per-user cache of rendered contact queries. redis is the application's asyncio client,
+    set when the worker starts.
+    """
+    _script = None
+
+    def __init__(self, ttl: int, enabled: bool = True):
+        self.ttl = ttl
+        self.enabled = enabled
+        self.redis = None
+
+    def script(self, client):
+        if self._script is None or self._script.registered_client is not client:
+            self._script = client.register_script(LOOKUP_SCRIPT)
+        return self._script
+
+    async def fetch(self, user_id: int, query: tuple, render, store: bool = True) -> bytes:
+        """
+        The fetch function returns the cached body of the query, or renders it and caches it
+            under the version that was current before rendering.
+
+            body = await contact_cache.fetch(user.id, ("contacts:list", limit, offset), render)
+
+        :param self: Represent the instance of the class
+        :param user_id: int: Owner of the contacts
+        :param query: tuple: The route name followed by the validated parameters
+        :param render: Coroutine function producing the body from the database
+        :param store: bool: Whether a rendered body may be cached, False when render reads from a replica
+        :return: The body
+        :doc-author: Trelent
+        """
+        client = self.redis
+        if client is None or not self.enabled:
+            return await render()
+
+        prefix, key = user_prefix(user_id), query_key(query)
+        try:
+            with tracer.span("redis.evalsha", script="contact_cache"):
+                version, body = await self.script(client)(keys=[prefix + "version"], args=[prefix, key])
+        except Exception as err:
+            logger.warning("Contact cache lookup failed: %s", err)
+            CONTACT_CACHE_ERROR.inc()
+            return await render()
+        if body is not None:
+            CONTACT_CACHE_HIT.inc()
+            return body
+        CONTACT_CACHE_MISS.inc()
+
+        body = await render()
+        if not store:
+            return body
+        try:
+            with tracer.span("redis.pipeline", operation="contact_cache_store"):
+                async with client.pipeline(transaction=False) as pipe:
+                    pipe.set(f"{prefix}{version.decode()}:{key}", body, ex=self.ttl)
+                    pipe.expire(prefix + "version", self.ttl)
+                    await pipe.execute()
+        except Exception as err:
+            logger.warning("Contact cache store failed: %s", err)
+        return body
+
+    async def invalidate(self, user_id: int) -> None:
+        """
+        The invalidate function moves the user to a new version, so none of the cached queries is found again.
+            It must be called after the write is committed.
+
+        :param self: Represent the instance of the class
+        :param user_id: int: Owner of the contacts
+        :return: None
+        :doc-author: Trelent
+        """
+        client = self.redis
+        if client is None or not self.enabled:
+            return
+        version_key = user_prefix(user_id) + "version"
+        try:
+            with tracer.span("redis.pipeline", operation="contact_cache_invalidate"):
+                async with client.pipeline(transaction=False) as pipe:
+                    pipe.incr(version_key)
+                    pipe.expire(version_key, self.ttl)
+                    await pipe.execute()
+        except Exception as err:
+            # the entries of the old version are served until they expire
+            logger.error("Contact cache invalidation of user %s failed: %s", user_id, err)
+
+
+contact_cache = ContactCache(config.CONTACT_CACHE_SECONDS, enabled=config.CONTACT_CACHE_ENABLED)
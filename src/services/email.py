@@ -1,27 +1,117 @@
+import time
+from functools import lru_cache
 from pathlib import Path
 
-from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
-from fastapi_mail.errors import ConnectionErrors
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache, select_autoescape
 from pydantic import EmailStr
 
 from src.services.auth import auth_service
 from src.config.config import config
+from src.services.metrics import EMAIL_LATENCY
+from src.services.tracing import traced
 
-conf = ConnectionConfig(
-    MAIL_USERNAME=config.MAIL_USERNAME,
-    MAIL_PASSWORD=config.MAIL_PASSWORD,
-    MAIL_FROM=config.MAIL_FROM,
-    MAIL_PORT=config.MAIL_PORT, 
-    MAIL_SERVER=config.MAIL_SERVER,
-    MAIL_FROM_NAME="Homework 13",
-    MAIL_STARTTLS=False,
-    MAIL_SSL_TLS=True,
-    USE_CREDENTIALS=True,
-    VALIDATE_CERTS=True,
-    TEMPLATE_FOLDER=Path(__file__).parent / 'templates',
-)
 
+TEMPLATE_FOLDER = Path(__file__).parent / 'templates'
 
+'''fastapi-mail is imported on the first email, it is the slowest import of the application'''
+
+
+@lru_cache
+def mail_config():
+    """
+    The mail_config function builds the fastapi-mail connection settings on first use.
+    
+    :return: A ConnectionConfig
+    :doc-author: Trelent
+    """
+    from fastapi_mail import ConnectionConfig
+
+    return ConnectionConfig(
+        MAIL_USERNAME=config.MAIL_USERNAME,
+        MAIL_PASSWORD=config.MAIL_PASSWORD,
+        MAIL_FROM=config.MAIL_FROM,
+        MAIL_PORT=config.MAIL_PORT, 
+        MAIL_SERVER=config.MAIL_SERVER,
+        MAIL_FROM_NAME="Homework 13",
+        MAIL_STARTTLS=False,
+        MAIL_SSL_TLS=True,
+        USE_CREDENTIALS=True,
+        VALIDATE_CERTS=True,
+        TEMPLATE_FOLDER=TEMPLATE_FOLDER,
+    )
+
+
+@lru_cache
+def mail_client():
+    """
+    The mail_client function returns the FastMail client shared by every sender.
+    
+    :return: A FastMail instance
+    :doc-author: Trelent
+    """
+    from fastapi_mail import FastMail
+
+    return FastMail(mail_config())
+
+
+async def deliver(message, kind: str) -> None:
+    """
+    The deliver function hands the message to the mail relay and observes how long it took.
+    
+    :param message: MessageSchema: Message to send
+    :param kind: str: Kind of the email, the label of the latency histogram
+    :return: None
+    :doc-author: Trelent
+    """
+    start = time.perf_counter()
+    result = "error"
+    try:
+        await mail_client().send_message(message)
+        result = "ok"
+    finally:
+        EMAIL_LATENCY.labels(kind, result).observe(time.perf_counter() - start)
+
+
+'''Email templates are compiled once and shared by every sender'''
+
+templates_env = Environment(loader=FileSystemLoader(TEMPLATE_FOLDER),
+                            bytecode_cache=FileSystemBytecodeCache(config.EMAIL_TEMPLATE_CACHE_DIR),
+                            autoescape=select_autoescape(['html']),
+                            auto_reload=False)
+verify_email_template = templates_env.get_template('verify_email.html')
+birthday_digest_template = templates_env.get_template('birthday_digest.html')
+
+
+@lru_cache(maxsize=128)
+def host_context(host: str) -> dict:
+    """
+    The host_context function builds the part of the template context that depends only on the host.
+        The result is cached, so the urls are concatenated once per host instead of once per email.
+    
+    :param host: str: Base url of the application, e.g. http://127.0.0.1:8000/
+    :return: A dict with the host and the prebuilt urls used by the templates
+    :doc-author: Trelent
+    """
+    return {"host": host, 
+            "confirm_url": f"{host}api/auth/confirmed_email/",
+            "static_url": f"{host}static/"}
+
+
+def render_verify_email(email: str, username: str, host: str) -> str:
+    """
+    The render_verify_email function renders the verification email for the user.
+    
+    :param email: str: Email of the user, encoded into the verification token
+    :param username: str: Pass the username to the email template
+    :param host: str: Base url of the application
+    :return: The rendered html body of the email
+    :doc-author: Trelent
+    """
+    token_verification = auth_service.create_email_token({"sub": email})
+    return verify_email_template.render(host_context(host), username=username, token=token_verification)
+
+
+@traced()
 async def send_email(email: EmailStr, username: str, host: str): 
     """
     The send_email function sends an email to the user with a link to verify their email address.
@@ -37,18 +127,48 @@ async def send_email(email: EmailStr, username: str, host: str):
     :return: A coroutine object
     :doc-author: Trelent
     """
+    from fastapi_mail import MessageSchema, MessageType
+    from fastapi_mail.errors import ConnectionErrors
+
     try:
-        token_verification = auth_service.create_email_token({"sub": email})
         message = MessageSchema(
             subject="Confirm your email ",
             recipients=[email],
-            template_body={"host": host, "username": username, "token": token_verification},
+            body=render_verify_email(email, username, host),
+            subtype=MessageType.html
+        )
+
+        await deliver(message, "verify_email")
+    except ConnectionErrors as err:
+        print(err)
+
+
+@traced()
+async def send_birthday_digest(email: EmailStr, username: str, contacts: list[dict], days: int) -> bool:
+    """
+    The send_birthday_digest function sends one email with all upcoming birthdays of the user's contacts.
+    
+    :param email: EmailStr: Email of the user
+    :param username: str: Pass the username to the email template
+    :param contacts: list[dict]: Contacts with name, surname, phone_number and birthday
+    :param days: int: Number of days the digest covers
+    :return: True if the email was sent, False otherwise
+    :doc-author: Trelent
+    """
+    from fastapi_mail import MessageSchema, MessageType
+    from fastapi_mail.errors import ConnectionErrors
+
+    try:
+        message = MessageSchema(
+            subject="Upcoming birthdays",
+            recipients=[email],
+            body=birthday_digest_template.render(username=username, contacts=contacts, days=days),
             subtype=MessageType.html
         )
 
-        fm = FastMail(conf)
-        await fm.send_message(message, template_name="verify_email.html")
+        await deliver(message, "birthday_digest")
+        return True
     except ConnectionErrors as err:
         print(err)
+        return False
 
- 
\ No newline at end of file
@@ -0,0 +1,118 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from fastapi import FastAPI
+
+from src.database.db import sessionmanager
+from src.config.config import config
+
+
+async def check_database(app: FastAPI) -> dict:
+    """
+    The check_database function pings the primary database and reports the state of its connection pool.
+
+    :param app: FastAPI: The application
+    :return: A dict with the pool statistics
+    :doc-author: Trelent
+    """
+    await sessionmanager.ping()
+    return {"pool": sessionmanager.pool_stats()}
+
+
+async def check_redis(app: FastAPI) -> dict:
+    """
+    The check_redis function pings the Redis client created at startup.
+
+    :param app: FastAPI: The application, its state holds the Redis client
+    :return: An empty dict
+    :doc-author: Trelent
+    """
+    redis = getattr(app.state, "redis", None)
+    if redis is None:
+        raise RuntimeError("Redis is not initialized")
+    await redis.ping()
+    return {}
+
+
+async def check_mail(app: FastAPI) -> dict:
+    """
+    The check_mail function opens a TCP connection to the mail relay and closes it right away.
+
+    :param app: FastAPI: The application
+    :return: A dict with the relay address
+    :doc-author: Trelent
+    """
+    reader, writer = await asyncio.open_connection(config.MAIL_SERVER, config.MAIL_PORT)
+    writer.close()
+    await writer.wait_closed()
+    return {"server": f"{config.MAIL_SERVER}:{config.MAIL_PORT}"}
+
+
+class ReadinessProbe:
+    """
+    Runs the backend checks concurrently and keeps the report for cache_seconds, so frequent probes
+    from the orchestrator are answered from memory. Concurrent probes wait for the one check in flight.
+    A failed critical check fails readiness, a failed optional check only degrades it.
+    """
+    def __init__(self,
+                 checks: dict[str, Callable[[FastAPI], Awaitable[dict]]],
+                 critical: set[str],
+                 cache_seconds: float = config.HEALTH_CACHE_SECONDS,
+                 timeout: float = config.HEALTH_CHECK_TIMEOUT):
+        self.checks = checks
+        self.critical = critical
+        self.cache_seconds = cache_seconds
+        self.timeout = timeout
+        self._report: dict | None = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _cached(self) -> dict | None:
+        if self._report is not None and time.monotonic() - self._checked_at < self.cache_seconds:
+            return {**self._report, "cached": True}
+        return None
+
+    async def _run_check(self, check: Callable[[FastAPI], Awaitable[dict]], app: FastAPI) -> dict:
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(check(app), self.timeout)
+            result = {"status": "ok", **result}
+        except Exception as err:
+            result = {"status": "fail", "error": f"{type(err).__name__}: {err}"}
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 3)
+        return result
+
+    async def __call__(self, app: FastAPI) -> dict:
+        """
+        The __call__ function returns the readiness report, from the cache when it is fresh.
+
+        :param self: Represent the instance of the class
+        :param app: FastAPI: The application passed to the checks
+        :return: A dict with the overall status, the result of every check and whether it was cached
+        :doc-author: Trelent
+        """
+        report = self._cached()
+        if report is not None:
+            return report
+        async with self._lock:
+            report = self._cached()
+            if report is not None:
+                return report
+            results = await asyncio.gather(*(self._run_check(check, app) for check in self.checks.values()))
+            checks = dict(zip(self.checks, results))
+            failed = {name for name, result in checks.items() if result["status"] != "ok"}
+            if failed & self.critical:
+                status = "fail"
+            elif failed:
+                status = "degraded"
+            else:
+                status = "ok"
+            self._report = {"status": status, "checks": checks}
+            self._checked_at = time.monotonic()
+        return {**self._report, "cached": False}
+
+
+# without Redis the limiter falls back to memory and the caches to the database, so it only degrades readiness
+readiness = ReadinessProbe({"database": check_database, "redis": check_redis, "mail": check_mail},
+                           critical={"database"})
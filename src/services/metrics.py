@@ -0,0 +1,107 @@
+"""
+Prometheus metrics of the application, served at /metrics.
+
+With several worker processes set PROMETHEUS_MULTIPROC_DIR to an empty directory before the workers start:
+every worker then writes its samples there and /metrics aggregates the files of all workers.
+"""
+import os
+import time
+from functools import lru_cache
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest)
+from prometheus_client.multiprocess import MultiProcessCollector
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Latency of HTTP requests by route",
+                            ["method", "route", "status"])
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being handled",
+                           multiprocess_mode="livesum")
+DB_POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Time a checkout waited for a pooled connection",
+                         buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+DB_POOL_TIMEOUTS = Counter("db_pool_checkout_timeouts", "Checkouts that gave up waiting for a connection")
+USER_CACHE = Counter("user_cache_lookups", "Lookups of the current user in the Redis cache", ["result"])
+CONTACT_CACHE = Counter("contact_cache_lookups", "Lookups of rendered contact queries in the Redis cache",
+                        ["result"])
+RATE_LIMIT_REJECTIONS = Counter("rate_limit_rejections", "Requests answered 429 by the rate limiter",
+                                ["route", "tier"])
+COALESCED_REQUESTS = Counter("coalesced_requests", "Requests answered with the result of an identical request "
+                             "in flight", ["route"])
+EMAIL_LATENCY = Histogram("email_send_duration_seconds", "Time to hand an email to the mail relay",
+                          ["kind", "result"], buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+USER_CACHE_HIT = USER_CACHE.labels("hit")
+USER_CACHE_MISS = USER_CACHE.labels("miss")
+USER_CACHE_ERROR = USER_CACHE.labels("error")
+CONTACT_CACHE_HIT = CONTACT_CACHE.labels("hit")
+CONTACT_CACHE_MISS = CONTACT_CACHE.labels("miss")
+CONTACT_CACHE_ERROR = CONTACT_CACHE.labels("error")
+
+
+@lru_cache
+def registry() -> CollectorRegistry:
+    """
+    The registry function returns the registry /metrics is generated from: the default one in a single process,
+        a registry collecting the files of every worker when PROMETHEUS_MULTIPROC_DIR is set.
+
+    :return: A CollectorRegistry
+    :doc-author: Trelent
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+        return REGISTRY
+    multiprocess_registry = CollectorRegistry()
+    MultiProcessCollector(multiprocess_registry)
+    return multiprocess_registry
+
+
+def latest() -> bytes:
+    return generate_latest(registry())
+
+
+def route_name(scope: Scope) -> str:
+    """
+    The route_name function labels a request with the path template of its route, e.g. /api/contacts/{contact_id},
+        so the number of series does not grow with ids. Mounted apps are labelled with their mount path.
+
+    :param scope: Scope: Scope of the handled request
+    :return: The label
+    :doc-author: Trelent
+    """
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    if "endpoint" in scope:
+        return scope.get("root_path") or "/"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware observing the latency of every HTTP request by method, route and status
+    and counting the requests in flight.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_LATENCY.labels(scope["method"], route_name(scope), status_code) \
+                .observe(time.perf_counter() - start)
@@ -0,0 +1,351 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+
+from fastapi import HTTPException, status
+
+from src.config.config import config
+from src.services.metrics import RATE_LIMIT_REJECTIONS
+from src.services.tracing import tracer
+
+
+logger = logging.getLogger(__name__)
+
+
+def parse_quota(quota: str) -> tuple[int, float]:
+    """
+    The parse_quota function parses a quota written as "times/seconds", e.g. "1/20".
+
+    :param quota: str: Quota from the settings
+    :return: A tuple of the number of requests and the period in seconds
+    :doc-author: Trelent
+    """
+    times, seconds = quota.split("/")
+    return int(times), float(seconds)
+
+
+def window_key(route: str, key: str, period: float, wall: float) -> str:
+    """
+    The window_key function names the Redis counter of the caller on the route in the current window.
+
+    :param route: str: Route name given to RateLimitedUser
+    :param key: str: Caller key, e.g. user:<email>
+    :param period: float: Period of the quota in seconds
+    :param wall: float: time.time()
+    :return: The Redis key
+    :doc-author: Trelent
+    """
+    return f"rate:{route}:{key}:{int(wall // period)}"
+
+
+def too_many_requests(retry_after: float) -> HTTPException:
+    return HTTPException(status.HTTP_429_TOO_MANY_REQUESTS, "Too Many Requests",
+                         headers={"Retry-After": str(math.ceil(retry_after))})
+
+
+class TokenBucket:
+    """
+    Token bucket of one caller on one route: holds up to capacity tokens and refills capacity tokens per period.
+    pending counts requests taken since the last reconciliation with Redis.
+    """
+    __slots__ = ("capacity", "period", "rate", "tokens", "stamp", "pending")
+
+    def __init__(self, capacity: int, period: float, now: float):
+        self.capacity = capacity
+        self.period = period
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.stamp = now
+        self.pending = 0
+
+    def take(self, now: float) -> float:
+        """
+        The take function takes one token.
+
+        :param self: Represent the instance of the class
+        :param now: float: time.monotonic()
+        :return: 0.0 if the request is allowed, otherwise the seconds until a token is available
+        :doc-author: Trelent
+        """
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            self.pending += 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class SlidingWindowLimiter:
+    """
+    In-memory sliding-window log used while Redis is unhealthy: remembers the time of the last
+    times requests of each caller and route, so the quota holds over any period, not only per window.
+    """
+    def __init__(self):
+        self.windows: dict[tuple[str, str], deque] = {}
+        self.periods: dict[tuple[str, str], float] = {}
+
+    def hit(self, route: str, key: str, times: int, seconds: float, now: float) -> float:
+        """
+        The hit function counts one request of the caller on the route.
+
+        :param self: Represent the instance of the class
+        :param route: str: Route name given to RateLimitedUser
+        :param key: str: Caller key, e.g. user:<email>
+        :param times: int: Requests allowed per period
+        :param seconds: float: Period in seconds
+        :param now: float: time.monotonic()
+        :return: 0.0 if the request is allowed, otherwise the seconds to wait
+        :doc-author: Trelent
+        """
+        window = self.windows.get((route, key))
+        if window is None:
+            window = self.windows[(route, key)] = deque(maxlen=times)
+            self.periods[(route, key)] = seconds
+        if len(window) == times:
+            retry_after = window[0] + seconds - now
+            if retry_after > 0:
+                return retry_after
+        window.append(now)
+        return 0.0
+
+    def seed(self, buckets: dict[tuple[str, str], "TokenBucket"]) -> None:
+        """
+        The seed function carries the token buckets over into the windows on failover, so callers
+            do not get a fresh quota when Redis goes down. Taken tokens count as requests made at the last take.
+
+        :param self: Represent the instance of the class
+        :param buckets: dict: Buckets of LocalRateLimiter
+        :return: None
+        :doc-author: Trelent
+        """
+        for key, bucket in buckets.items():
+            used = int(bucket.capacity - bucket.tokens)
+            if used:
+                self.windows[key] = deque([bucket.stamp] * used, maxlen=bucket.capacity)
+                self.periods[key] = bucket.period
+
+    def buckets(self, now: float) -> dict[tuple[str, str], "TokenBucket"]:
+        """
+        The buckets function carries the windows back over into token buckets on recovery, the reverse of seed,
+            so callers do not get a fresh quota when Redis comes back. Requests within the last period
+            count as taken tokens.
+
+        :param self: Represent the instance of the class
+        :param now: float: time.monotonic()
+        :return: A dict of buckets for LocalRateLimiter
+        :doc-author: Trelent
+        """
+        buckets = {}
+        for key, window in self.windows.items():
+            period = self.periods[key]
+            used = sum(1 for stamp in window if stamp > now - period)
+            if used:
+                bucket = buckets[key] = TokenBucket(window.maxlen, period, now)
+                bucket.tokens = float(bucket.capacity - used)
+        return buckets
+
+    def clear(self) -> None:
+        self.windows.clear()
+        self.periods.clear()
+
+
+class LocalRateLimiter:
+    """
+    Rate limiter that decides in process memory and reconciles with Redis in batches.
+
+    Every sync_seconds the requests taken by this worker are added to per-window counters in Redis
+    with one pipeline, and each local bucket is capped by what is left of the shared quota of the window.
+    Workers therefore agree up to the requests they let through between two reconciliations.
+
+    When a reconciliation fails the limiter turns unhealthy and falls back to a per-worker
+    SlidingWindowLimiter; it pings Redis every sync_seconds and goes back to the buckets once Redis answers.
+    """
+    def __init__(self, sync_seconds: float = config.RATE_LIMIT_SYNC_SECONDS):
+        self.sync_seconds = sync_seconds
+        self.buckets: dict[tuple[str, str], TokenBucket] = {}
+        self.fallback = SlidingWindowLimiter()
+        self.healthy = True
+        self.redis = None
+        self._last_sync = time.monotonic()
+        self._sync_task: asyncio.Task | None = None
+
+    def quota(self, route: str, tier: str) -> tuple[int, float]:
+        """
+        The quota function looks up the quota of a tier on a route: the route override first,
+            then the tier quota, then the default.
+
+        :param self: Represent the instance of the class
+        :param route: str: Route name given to RateLimitedUser
+        :param tier: str: Tier of the caller
+        :return: A tuple of the number of requests and the period in seconds
+        :doc-author: Trelent
+        """
+        quota = config.RATE_LIMIT_ROUTES.get(route, {}).get(tier) or config.RATE_LIMIT_TIERS.get(tier) \
+            or config.RATE_LIMIT_DEFAULT
+        return parse_quota(quota)
+
+    def hit(self, route: str, key: str, tier: str) -> float:
+        """
+        The hit function counts one request of the caller on the route.
+
+        :param self: Represent the instance of the class
+        :param route: str: Route name given to RateLimitedUser
+        :param key: str: Caller key, e.g. user:<email>
+        :param tier: str: Tier of the caller
+        :return: 0.0 if the request is allowed, otherwise the seconds to wait
+        :doc-author: Trelent
+        """
+        now = time.monotonic()
+        if self.healthy:
+            bucket = self.buckets.get((route, key))
+            if bucket is None:
+                times, seconds = self.quota(route, tier)
+                bucket = self.buckets[(route, key)] = TokenBucket(times, seconds, now)
+            retry_after = bucket.take(now)
+        else:
+            times, seconds = self.quota(route, tier)
+            retry_after = self.fallback.hit(route, key, times, seconds, now)
+        self.schedule(now)
+        if retry_after:
+            RATE_LIMIT_REJECTIONS.labels(route, tier).inc()
+        return retry_after
+
+    def schedule(self, now: float) -> None:
+        """
+        The schedule function starts the reconciliation, or the probe while unhealthy, every sync_seconds.
+
+        :param self: Represent the instance of the class
+        :param now: float: time.monotonic()
+        :return: None
+        :doc-author: Trelent
+        """
+        if self.redis is not None and now - self._last_sync >= self.sync_seconds \
+                and (self._sync_task is None or self._sync_task.done()):
+            self._last_sync = now
+            self._sync_task = asyncio.create_task(self.sync() if self.healthy else self.probe())
+
+    async def sync(self) -> None:
+        """
+        The sync function pushes the pending requests of every active bucket to Redis
+            and caps the buckets by the quota left in the current window. Idle full buckets are dropped.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        now = time.monotonic()
+        wall = time.time()
+        active = []
+        for key, bucket in list(self.buckets.items()):
+            if bucket.pending:
+                active.append((key, bucket, bucket.pending))
+                bucket.pending = 0
+            elif now - bucket.stamp > bucket.period:
+                del self.buckets[key]
+        if not active:
+            return
+        try:
+            with tracer.span("redis.pipeline", operation="rate_limit_sync", buckets=len(active)):
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    for (route, key), bucket, pending in active:
+                        redis_key = window_key(route, key, bucket.period, wall)
+                        pipe.incrby(redis_key, pending)
+                        pipe.expire(redis_key, math.ceil(bucket.period))
+                    results = await pipe.execute()
+        except Exception as err:
+            self.fail(err)
+            return
+        for (_, bucket, _), used in zip(active, results[::2]):
+            self.settle(bucket, used)
+
+    def fail(self, err: Exception) -> None:
+        """
+        The fail function turns the limiter unhealthy after a failed Redis call, carrying the buckets
+            over into the in-memory windows. Limiting goes back to the buckets once a probe reaches Redis.
+
+        :param self: Represent the instance of the class
+        :param err: Exception: Error of the Redis call
+        :return: None
+        :doc-author: Trelent
+        """
+        if not self.healthy:
+            return
+        logger.warning("rate limit Redis failed, limiting in memory until Redis recovers: %s", err)
+        self.fallback.seed(self.buckets)
+        self.healthy = False
+
+    def claim(self, route: str, key: str) -> tuple[TokenBucket | None, int]:
+        """
+        The claim function hands the pending requests of one bucket to a caller that reconciles
+            them itself, e.g. RateLimitedUser in the same round trip as the user lookup.
+
+        :param self: Represent the instance of the class
+        :param route: str: Route name given to RateLimitedUser
+        :param key: str: Caller key, e.g. user:<email>
+        :return: A tuple of the bucket and its pending requests, (None, 0) while unhealthy
+        :doc-author: Trelent
+        """
+        bucket = self.buckets.get((route, key)) if self.healthy else None
+        if bucket is None:
+            return None, 0
+        pending, bucket.pending = bucket.pending, 0
+        return bucket, pending
+
+    @staticmethod
+    def settle(bucket: TokenBucket, used: int) -> None:
+        """
+        The settle function caps the bucket by what is left of the shared quota of the window.
+
+        :param bucket: TokenBucket: Reconciled bucket
+        :param used: int: Requests of all workers in the window, from Redis
+        :return: None
+        :doc-author: Trelent
+        """
+        bucket.tokens = max(0.0, min(bucket.tokens, bucket.capacity - used))
+
+    async def probe(self) -> None:
+        """
+        The probe function pings Redis while the limiter is unhealthy and hands limiting back
+            to the token buckets once it answers, rebuilt from the windows of the outage.
+            Requests counted during the outage are not pushed.
+
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        try:
+            await self.redis.ping()
+        except Exception:
+            return
+        logger.info("rate limit Redis recovered")
+        self.buckets = self.fallback.buckets(time.monotonic())
+        self.fallback.clear()
+        self.healthy = True
+
+    async def close(self) -> None:
+        """
+        The close function stops the reconciliation and pushes what is still pending, so a restarting
+            worker does not give its callers a fresh quota on the other workers.
+        
+        :param self: Represent the instance of the class
+        :return: None
+        :doc-author: Trelent
+        """
+        if self._sync_task is not None:
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+        if self.redis is not None and self.healthy:
+            await self.sync()
+        self.redis = None
+
+    def reset(self) -> None:
+        self.buckets.clear()
+        self.fallback.clear()
+        self.healthy = True
+        self._last_sync = time.monotonic()
+
+
+limiter = LocalRateLimiter()
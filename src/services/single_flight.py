@@ -0,0 +1,81 @@
+"""
+Coalescing of identical concurrent reads.
+
+While a call for a key is in flight, further calls with the same key wait for it and get its result
+instead of starting their own, so a burst of identical requests costs one repository call and one
+serialization. Nothing is kept after the call finishes. The calls are only shared inside one worker process.
+"""
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from src.config.config import config
+from src.services.metrics import COALESCED_REQUESTS
+
+
+T = TypeVar("T")
+
+
+def _retrieve(future: asyncio.Future) -> None:
+    # marks the exception as retrieved when no caller was waiting for it
+    if not future.cancelled():
+        future.exception()
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time and shares its result with the callers that arrive meanwhile.
+    """
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._calls: dict[tuple, asyncio.Future] = {}
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: tuple, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        The do function returns the result of call(), or of the call with the same key that is already running.
+            Exceptions of the call are raised in every caller. When the caller running the call is cancelled,
+            the callers waiting for it start the call again.
+
+            body = await single_flight.do(("contacts:birthday", user.id, n), render_birthdays)
+
+        :param self: Represent the instance of the class
+        :param key: tuple: Identity of the call: the name of the route, then e.g. the user and the normalized query
+        :param call: Callable[[], Awaitable[T]]: Produces the result
+        :return: The result of the call
+        :doc-author: Trelent
+        """
+        if not self.enabled:
+            return await call()
+
+        future = self._calls.get(key)
+        if future is not None:
+            COALESCED_REQUESTS.labels(key[0]).inc()
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled() and not asyncio.current_task().cancelling():
+                    return await self.do(key, call)
+                raise
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_retrieve)
+        self._calls[key] = future
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as err:
+            future.set_exception(err)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._calls[key]
+
+
+single_flight = SingleFlight(enabled=config.SINGLE_FLIGHT_ENABLED)
@@ -0,0 +1,296 @@
+"""
+Lightweight tracing of repository and service calls.
+
+Functions decorated with ``traced`` and blocks in ``tracer.span(...)`` record spans while the tracer is enabled;
+the spans of one request share a trace id, so the slow part of a slow request shows up in its waterfall.
+Spans go to an in-memory ring buffer or to a JSON lines file. Tracing starts with TRACING_ENABLED
+and is switched at runtime with ``tracer.enable()`` / ``tracer.disable()``, or SIGUSR2 sent to a worker.
+While it is disabled a traced call costs one attribute check.
+
+    python -m src.services.tracing traces.jsonl             # slowest traces
+    python -m src.services.tracing traces.jsonl <trace id>  # waterfall of one trace
+"""
+import argparse
+import contextlib
+import functools
+import inspect
+import json
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.config.config import config
+
+
+class Span:
+    """
+    One timed operation. start is the wall clock in seconds, duration is measured with perf_counter.
+    """
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "duration", "attributes", "error", "_t0")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str | None, attributes: dict):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error = None
+        self.duration = 0.0
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+
+    def set(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "start": self.start, "duration_ms": round(self.duration * 1000, 3),
+                "attributes": self.attributes, "error": self.error}
+
+
+class InMemoryExporter:
+    """
+    Keeps the last maxlen finished spans.
+    """
+    def __init__(self, maxlen: int = 10000):
+        self.spans: deque[dict] = deque(maxlen=maxlen)
+
+    def export(self, span: Span) -> None:
+        self.spans.append(span.to_dict())
+
+    def trace(self, trace_id: str) -> list[dict]:
+        return [span for span in self.spans if span["trace_id"] == trace_id]
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+    def close(self) -> None:
+        pass
+
+
+class JsonLinesExporter:
+    """
+    Appends every finished span to a file as one JSON line. The file is opened on the first span.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def export(self, span: Span) -> None:
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(span.to_dict(), default=str) + "\n")
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def make_exporter(kind: str) -> InMemoryExporter | JsonLinesExporter:
+    if kind == "jsonl":
+        return JsonLinesExporter(config.TRACING_FILE)
+    if kind == "memory":
+        return InMemoryExporter()
+    raise ValueError(f"Unknown tracing exporter: {kind}")
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+_noop = contextlib.nullcontext()
+
+
+class Tracer:
+    """
+    Creates spans while enabled and hands the finished ones to the exporter.
+    """
+    def __init__(self, exporter, enabled: bool = False):
+        self.exporter = exporter
+        self.enabled = enabled
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def toggle(self) -> None:
+        self.enabled = not self.enabled
+
+    @staticmethod
+    def current_span() -> Span | None:
+        return _current_span.get()
+
+    def span(self, name: str, **attributes):
+        """
+        The span function times the block it wraps as a child of the current span.
+
+            with tracer.span("redis.get", key=email):
+                ...
+
+        :param self: Represent the instance of the class
+        :param name: str: Name of the operation
+        :param **attributes: Attributes of the span
+        :return: A context manager yielding the span, or None while tracing is disabled
+        :doc-author: Trelent
+        """
+        if not self.enabled:
+            return _noop
+        return self._span(name, attributes)
+
+    @contextlib.contextmanager
+    def _span(self, name: str, attributes: dict):
+        parent = _current_span.get()
+        span = Span(name, parent.trace_id if parent else f"{random.getrandbits(128):032x}",
+                    parent.span_id if parent else None, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as err:
+            span.error = type(err).__name__
+            raise
+        finally:
+            span.duration = time.perf_counter() - span._t0
+            _current_span.reset(token)
+            self.exporter.export(span)
+
+    def close(self) -> None:
+        self.exporter.close()
+
+
+tracer = Tracer(make_exporter(config.TRACING_EXPORTER), enabled=config.TRACING_ENABLED)
+
+
+def _attribute_getters(func, names: tuple[str, ...]) -> list:
+    """
+    Precomputes where every attribute is found in the arguments of func: "user.id" is the id of the user argument.
+    """
+    parameters = list(inspect.signature(func).parameters.values())
+    positions = {parameter.name: i for i, parameter in enumerate(parameters)}
+    getters = []
+    for name in names:
+        argument, *path = name.split(".")
+        parameter = parameters[positions[argument]]
+        default = None if parameter.default is inspect.Parameter.empty else parameter.default
+        getters.append((name, argument, positions[argument], path, default))
+    return getters
+
+
+def _attributes(getters: list, args: tuple, kwargs: dict) -> dict:
+    attributes = {}
+    for name, argument, position, path, default in getters:
+        value = kwargs[argument] if argument in kwargs else args[position] if position < len(args) else default
+        for attribute in path:
+            value = getattr(value, attribute, None)
+        attributes[name] = value
+    return attributes
+
+
+def traced(name: str | None = None, attributes: tuple[str, ...] = ()):
+    """
+    The traced decorator records a span for every call of the function while tracing is enabled.
+        Only the arguments named in attributes are recorded, never tokens or passwords.
+
+        @traced(attributes=("contact_id", "user.id"))
+        async def get_contact(contact_id: int, db: AsyncSession, user: User): ...
+
+    :param name: str | None: Name of the span, the module and qualified name of the function by default
+    :param attributes: tuple[str, ...]: Arguments recorded as attributes, dotted names read attributes of an argument
+    :return: The decorator
+    :doc-author: Trelent
+    """
+    def decorator(func):
+        span_name = name or f"{func.__module__.removeprefix('src.')}.{func.__qualname__}"
+        getters = _attribute_getters(func, attributes)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await func(*args, **kwargs)
+                with tracer._span(span_name, _attributes(getters, args, kwargs)):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return func(*args, **kwargs)
+                with tracer._span(span_name, _attributes(getters, args, kwargs)):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware opening the root span of every HTTP request while tracing is enabled
+    and returning its trace id in the X-Trace-Id header.
+    """
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        with tracer._span("http.request", {"method": scope["method"], "path": scope["path"]}) as span:
+            async def send_wrapper(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    span.set("status", message["status"])
+                    MutableHeaders(scope=message).append("X-Trace-Id", span.trace_id)
+                await send(message)
+
+            await self.app(scope, receive, send_wrapper)
+            route = scope.get("route")
+            if route is not None:
+                span.set("route", route.path)
+
+
+def waterfall(spans: list[dict]) -> str:
+    """
+    The waterfall function renders the spans of one trace as an indented timeline.
+
+    :param spans: list[dict]: Spans of one trace
+    :return: One line per span with its offset from the start of the trace and its duration
+    :doc-author: Trelent
+    """
+    spans = sorted(spans, key=lambda span: span["start"])
+    if not spans:
+        return ""
+    depth = {}
+    origin = spans[0]["start"]
+    lines = []
+    for span in spans:
+        depth[span["span_id"]] = depth.get(span["parent_id"], -1) + 1
+        offset = (span["start"] - origin) * 1000
+        error = f" !{span['error']}" if span["error"] else ""
+        lines.append(f"{offset:9.3f} ms {span['duration_ms']:9.3f} ms  {'  ' * depth[span['span_id']]}"
+                     f"{span['name']} {span['attributes']}{error}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show traces recorded by the JSON lines exporter")
+    parser.add_argument("file")
+    parser.add_argument("trace_id", nargs="?")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+    traces: dict[str, list[dict]] = {}
+    with open(args.file, encoding="utf-8") as file:
+        for line in file:
+            span = json.loads(line)
+            traces.setdefault(span["trace_id"], []).append(span)
+    if args.trace_id:
+        print(waterfall(traces.get(args.trace_id, [])))
+        return
+    roots = [span for spans in traces.values() for span in spans if span["parent_id"] is None]
+    for root in sorted(roots, key=lambda span: span["duration_ms"], reverse=True)[:args.top]:
+        print(f"{root['trace_id']} {root['duration_ms']:9.3f} ms  {root['name']} {root['attributes']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 import os
 import asyncio
+from functools import partial
+from types import SimpleNamespace
 
 import pytest
 import pytest_asyncio
+import fakeredis
 
 os.environ['TESTING'] = 'True'
 
@@ -11,13 +14,15 @@ from alembic.config import Config
 
 from fastapi import Depends
 from fastapi.testclient import TestClient
-from sqlalchemy.pool import NullPool
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool, StaticPool
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 
 from main import app
 from src.entity.models import Base, User
-from src.database.db import get_db, DatabaseSessionManager
+from src.database.db import get_db, DatabaseSessionManager, instrument_engine
 from src.services.auth import auth_service
+from src.services.rate_limit import limiter
 from src.config.config import config
 
 
@@ -25,33 +30,106 @@ from src.config.config import config
 SQLALCHEMY_DATABASE_URL = config.TEST_DB_URL
 # SQLALCHEMY_DATABASE_URL = "postgresql+asyncpg:///./test.db"
 
-engine = create_async_engine(
-    SQLALCHEMY_DATABASE_URL, poolclass=NullPool)
+'''On SQLite every test module runs inside one transaction on a single shared connection and every test
+inside a SAVEPOINT of it, both rolled back afterwards; other databases are rebuilt for each module'''
+
+TRANSACTIONAL = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
+
+if TRANSACTIONAL:
+    engine = instrument_engine(create_async_engine(
+        SQLALCHEMY_DATABASE_URL, poolclass=StaticPool, connect_args={"check_same_thread": False}))
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def do_connect(dbapi_connection, connection_record):
+        # pysqlite's own transaction handling breaks SAVEPOINT, let SQLAlchemy emit BEGIN instead
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def do_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+else:
+    engine = instrument_engine(create_async_engine(
+        SQLALCHEMY_DATABASE_URL, poolclass=NullPool))
+
 TestingSessionLocal = async_sessionmaker(autocommit=False, 
                                          autoflush=False, 
                                          expire_on_commit=False,
                                          bind=engine)
 
+redis_server = fakeredis.FakeServer()
+
 test_user = {"username": "user_1", "email": "user1@mail.com.com", "password": "a1d2m3"}
 user_data = {"username": "user_2", "email": "user2@mail.com", "password": "a1d2m3"}
 
 
-@pytest.fixture(scope="module", autouse=True)
+def pytest_configure(config):
+    config.addinivalue_line("markers", 
+                            "module_transaction: share one rolled back transaction between the tests of a module "
+                            "instead of rolling back after each test")
+
+
+async def init_models():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    async with TestingSessionLocal() as session:
+        hash_password = auth_service.get_password_hash(test_user["password"])
+        current_user = User(username=test_user["username"], 
+                            email=test_user["email"], 
+                            password=hash_password,
+                            avatar="https://www.gravatar.com/avatar/",
+                            confirmed=True)
+        session.add(current_user)
+        await session.commit()
+
+
+@pytest.fixture(scope="session", autouse=True)
 def init_models_wrap():
-    async def init_models():
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.drop_all)
-            await conn.run_sync(Base.metadata.create_all)
-        async with TestingSessionLocal() as session:
-            hash_password = auth_service.get_password_hash(test_user["password"])
-            current_user = User(username=test_user["username"], 
-                                email=test_user["email"], 
-                                password=hash_password,
-                                confirmed=True)
-            session.add(current_user)
-            await session.commit()
-
-    asyncio.run(init_models())
+    if TRANSACTIONAL:
+        asyncio.run(init_models())
+
+
+@pytest.fixture(scope="module", autouse=True)
+def module_transaction():
+    if not TRANSACTIONAL:
+        asyncio.run(init_models())
+        yield None
+        return
+
+    connection = asyncio.run(engine.connect().start())
+    transaction = asyncio.run(connection.begin().start())
+    TestingSessionLocal.configure(bind=connection, join_transaction_mode="create_savepoint")
+    yield connection
+    TestingSessionLocal.configure(bind=engine, join_transaction_mode="conservative_savepoint")
+    asyncio.run(transaction.rollback())
+    asyncio.run(connection.close())
+
+
+@pytest.fixture(autouse=True)
+def test_transaction(request, module_transaction):
+    if module_transaction is None or request.node.get_closest_marker("module_transaction"):
+        yield
+        return
+
+    savepoint = asyncio.run(module_transaction.begin_nested().start())
+    yield
+    if savepoint.is_active:
+        asyncio.run(savepoint.rollback())
+
+
+@pytest.fixture(scope="session", autouse=True)
+def fake_redis():
+    # the app's Redis client, shared by the user cache and the rate limiter, is an in-process Redis
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr("main.redis", SimpleNamespace(Redis=partial(fakeredis.aioredis.FakeRedis, server=redis_server)))
+        yield redis_server
+
+
+@pytest.fixture(autouse=True)
+def flush_redis(fake_redis):
+    yield
+    fakeredis.FakeRedis(server=fake_redis).flushall()
+    limiter.reset()
 
 
 @pytest.fixture(scope="module")
@@ -65,12 +143,14 @@ def client():
         except Exception as err:
             print(err)
             await session.rollback()
+            raise
         finally:
             await session.close()
 
     app.dependency_overrides[get_db] = override_get_db
 
-    yield TestClient(app)
+    with TestClient(app) as client:
+        yield client
 
 
 @pytest_asyncio.fixture()
@@ -82,4 +162,10 @@ async def get_token():
 @pytest_asyncio.fixture()
 async def get_email_token():
     token = auth_service.create_email_token(data={"sub": test_user["email"]})
-    return token
\ No newline at end of file
+    return token
+
+
+def assert_route_queries(response, expected: int):
+    """Pin the number of SQL statements a route executed, as reported in the X-DB-Queries header."""
+    assert int(response.headers["X-DB-Queries"]) == expected, \
+        f"Expected {expected} queries, got {response.headers['X-DB-Queries']}"
@@ -5,7 +5,7 @@ from requests import HTTPError
 
 import pytest
 from sqlalchemy import select
-from tests.conftest import TestingSessionLocal, user_data
+from tests.conftest import TestingSessionLocal, user_data, assert_route_queries
 from fastapi import HTTPException
 
 from src.entity.models import User
@@ -13,6 +13,9 @@ from src.schemas.user import UserSchema, RequestEmail
 from src.config import messages
 from fastapi.testclient import TestClient
 
+# the tests below build on each other: signup, confirm, login
+pytestmark = pytest.mark.module_transaction
+
 # user_data = {"username": "test_user_2", "email": "test_mail_2@mail.com", "password": "a1d2m3"}
 
 
@@ -36,15 +39,11 @@ def test_signup(client, monkeypatch):
     # assert mock_send_email.call_count == 1
 
 
-def test_repeat_signup(client, monkeypatch, mock_send_email, capsys):
-    try:
-        monkeypatch.setattr("src.routres.auth.send_email", mock_send_email)
-        with pytest.raises(HTTPException) as exc_info:
-            client.post("api/auth/signup", json=user_data)
-    except Exception as err:
-        captured = capsys.readouterr()
-        stdout_output = captured.out
-        assert f"409: {messages.ACCOUNT_EXIST}" in stdout_output
+def test_repeat_signup(client, monkeypatch, mock_send_email):
+    monkeypatch.setattr("src.routres.auth.send_email", mock_send_email)
+    response = client.post("api/auth/signup", json=user_data)
+    assert response.status_code == 409, response.text
+    assert response.json()["detail"] == messages.ACCOUNT_EXIST
 
 
 @pytest.mark.asyncio
@@ -110,6 +109,13 @@ async def test_confirmed_email(get_email_token, client):
     assert data["message"] == messages.EMAIL_ALREADY_CONFIRMED
 
 
+@pytest.mark.asyncio
+async def test_confirmed_email_queries(get_email_token, client):
+    response = client.get(f"api/auth/confirmed_email/{get_email_token}")
+    assert response.status_code == 200, response.text
+    assert_route_queries(response, 1)
+
+
 @pytest.mark.asyncio  
 async def test_request_email(client, monkeypatch):
     async with TestingSessionLocal() as session:
@@ -0,0 +1,170 @@
+from unittest.mock import MagicMock
+
+import fakeredis
+import pytest
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from main import app
+from tests.conftest import TestingSessionLocal, test_user, redis_server, assert_route_queries
+from src.database.db import get_db
+from src.entity.models import Contact
+from src.services.rate_limit import limiter
+from src.config.config import config
+
+
+contact_data = {"name": "contact_1",
+                "surname": "surname_1",
+                "phone_number": "+380501111111",
+                "email": "contact1@mail.com",
+                "birthday": "1998-06-03",
+                "notes": "note_1"}
+
+# the Redis of the app, holding the cached users
+cache = fakeredis.FakeRedis(server=redis_server)
+
+
+@pytest.fixture
+def headers(get_token):
+    return {"Authorization": f"Bearer {get_token}"}
+
+
+def test_create_contact(client, headers):
+    response = client.post("api/contacts/", json=contact_data, headers=headers)
+    assert response.status_code == 201, response.text
+    data = response.json()
+    assert data["name"] == contact_data["name"]
+    assert data["user"]["email"] == test_user["email"]
+
+
+@pytest.mark.asyncio
+async def test_contacts_rolled_back(client, headers):
+    async with TestingSessionLocal() as session:
+        count = await session.scalar(select(func.count()).select_from(Contact))
+    assert count == 0
+
+    response = client.get("api/contacts/", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json() == []
+
+
+def test_rate_limit(client, headers):
+    response = client.get("api/contacts/", headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.get("api/contacts/", headers=headers)
+    assert response.status_code == 429, response.text
+
+
+def test_current_user_cached(client, headers):
+    response = client.get("api/users/me", headers=headers)
+    assert response.status_code == 200, response.text
+    assert cache.get(test_user["email"]) is not None
+
+
+def test_redis_outage(client, headers, monkeypatch):
+    monkeypatch.setattr(redis_server, "connected", False)
+    response = client.get("api/users/me", headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.get("api/users/me", headers=headers)
+    assert response.status_code == 429, response.text
+
+
+def test_contacts_list_json(client, headers):
+    created = client.post("api/contacts/", json=contact_data, headers=headers).json()
+    limiter.reset()
+    response = client.get("api/contacts/", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"] == "application/json"
+    assert response.json() == [created]
+
+
+def test_contacts_list_compressed(client, headers, monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", False)
+    for i in range(5):
+        response = client.post("api/contacts/", json={**contact_data, "phone_number": f"+38050111111{i}"},
+                               headers=headers)
+        assert response.status_code == 201, response.text
+    response = client.get("api/contacts/", headers={**headers, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200, response.text
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()) == 5
+
+
+def test_contacts_list_cached_until_write(client, headers, monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", False)
+    response = client.get("api/contacts/", headers=headers)
+    assert response.json() == []
+    response = client.get("api/contacts/", headers=headers)
+    assert response.json() == []
+    assert_route_queries(response, 0)
+
+    created = client.post("api/contacts/", json=contact_data, headers=headers).json()
+    response = client.get("api/contacts/", headers=headers)
+    assert response.json() == [created]
+
+    response = client.get("api/contacts/name", params={"contact_name": contact_data["name"]}, headers=headers)
+    assert response.json() == [created]
+    client.put(f"api/contacts/{created['id']}", json={**contact_data, "notes": "note_2"}, headers=headers)
+    response = client.get("api/contacts/name", params={"contact_name": contact_data["name"]}, headers=headers)
+    assert [contact["notes"] for contact in response.json()] == ["note_2"]
+    response = client.get("api/contacts/name", params={"contact_name": contact_data["name"]}, headers=headers)
+    assert_route_queries(response, 0)
+
+    client.delete(f"api/contacts/{created['id']}", headers=headers)
+    response = client.get("api/contacts/", headers=headers)
+    assert response.json() == []
+
+
+@pytest.fixture
+def expiring_sessions(monkeypatch):
+    # like the application's session factory: committing expires the loaded user
+    sessions = async_sessionmaker(**{**TestingSessionLocal.kw, "expire_on_commit": True})
+
+    async def override_get_db():
+        async with sessions() as session:
+            yield session
+
+    monkeypatch.setitem(app.dependency_overrides, get_db, override_get_db)
+    monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", False)
+    return sessions
+
+
+def test_writes_with_expire_on_commit(client, headers, expiring_sessions):
+    response = client.get("api/contacts/", headers=headers)
+    assert response.json() == []
+
+    # every write loads the user from the database instead of the cache
+    cache.delete(test_user["email"])
+    response = client.post("api/contacts/", json=contact_data, headers=headers)
+    assert response.status_code == 201, response.text
+    created = response.json()
+    response = client.get("api/contacts/", headers=headers)
+    assert response.json() == [created]
+
+    cache.delete(test_user["email"])
+    response = client.put(f"api/contacts/{created['id']}", json={**contact_data, "notes": "note_2"}, headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.get("api/contacts/", headers=headers)
+    assert [contact["notes"] for contact in response.json()] == ["note_2"]
+
+    cache.delete(test_user["email"])
+    response = client.delete(f"api/contacts/{created['id']}", headers=headers)
+    assert response.status_code == 204, response.text
+    response = client.get("api/contacts/", headers=headers)
+    assert response.json() == []
+
+
+def test_update_avatar_with_expire_on_commit(client, headers, expiring_sessions, monkeypatch):
+    cloudinary = MagicMock()
+    cloudinary.uploader.upload.return_value = {"version": 1}
+    cloudinary.CloudinaryImage.return_value.build_url.return_value = "https://example.com/avatar.png"
+    monkeypatch.setattr("src.routres.users.cloudinary_client", lambda: cloudinary)
+    client.post("api/contacts/", json=contact_data, headers=headers)
+    response = client.get("api/contacts/", headers=headers)
+    assert response.json()[0]["user"]["avatar"] != "https://example.com/avatar.png"
+
+    cache.delete(test_user["email"])
+    response = client.patch("api/users/avatar", files={"file": ("avatar.png", b"png")}, headers=headers)
+    assert response.status_code == 200, response.text
+    response = client.get("api/contacts/", headers=headers)
+    assert response.json()[0]["user"]["avatar"] == "https://example.com/avatar.png"
@@ -0,0 +1,27 @@
+import pytest
+
+from tests.conftest import TestingSessionLocal
+from src.config.config import config
+from src.jobs.generate_data import generate_chunk, insert_chunk, user_email
+from src.services.auth import auth_service
+
+
+@pytest.mark.asyncio
+async def test_generated_users_use_the_api(client, monkeypatch):
+    monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", False)
+    user_rows, contact_rows = generate_chunk(0, 10, 3, 5, seed=0, password=auth_service.get_password_hash("datagen"))
+    async with TestingSessionLocal() as session:
+        await insert_chunk(await session.connection(), user_rows, contact_rows, batch_size=100)
+        await session.commit()
+
+    response = client.post("api/auth/login", data={"username": user_email(0), "password": "datagen"})
+    assert response.status_code == 200, response.text
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    response = client.get("api/users/me", headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["email"] == user_email(0)
+
+    response = client.get("api/contacts/", params={"limit": 100}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert len(response.json()) == min(len(contact_rows[0]), 100)
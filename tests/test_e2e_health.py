@@ -0,0 +1,45 @@
+from unittest.mock import AsyncMock
+
+import pytest
+
+from src.services.health import readiness
+
+
+@pytest.fixture
+def probe(monkeypatch):
+    monkeypatch.setattr(readiness, "_report", None)
+    monkeypatch.setitem(readiness.checks, "database", AsyncMock(return_value={"pool": {}}))
+    monkeypatch.setitem(readiness.checks, "mail", AsyncMock(side_effect=OSError("unreachable")))
+    return readiness
+
+
+def test_livez(client):
+    response = client.get("livez")
+    assert response.status_code == 200, response.text
+    assert response.json() == {"status": "ok"}
+
+
+def test_readyz(client, probe):
+    response = client.get("readyz")
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["status"] == "degraded"
+    assert data["checks"]["redis"]["status"] == "ok"
+    assert data["checks"]["mail"]["status"] == "fail"
+    assert client.get("readyz").json()["cached"]
+
+
+def test_readyz_database_down(client, probe, monkeypatch):
+    monkeypatch.setitem(readiness.checks, "database", AsyncMock(side_effect=ConnectionError("refused")))
+    response = client.get("readyz")
+    assert response.status_code == 503, response.text
+    assert response.json()["status"] == "fail"
+
+
+def test_readyz_redis_down(client, probe, monkeypatch):
+    monkeypatch.setitem(readiness.checks, "redis", AsyncMock(side_effect=ConnectionError("refused")))
+    response = client.get("readyz")
+    assert response.status_code == 200, response.text
+    data = response.json()
+    assert data["status"] == "degraded"
+    assert data["checks"]["redis"]["status"] == "fail"
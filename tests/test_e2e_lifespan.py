@@ -0,0 +1,11 @@
+from fastapi.testclient import TestClient
+
+from main import app
+from src.services.rate_limit import limiter
+
+
+def test_lifespan():
+    with TestClient(app) as client:
+        assert limiter.redis is app.state.redis
+        assert client.get("livez").status_code == 200
+    assert limiter.redis is None
@@ -0,0 +1,25 @@
+from prometheus_client import REGISTRY
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_metrics(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    client.get("api/contacts/", headers=headers)
+    client.get("api/contacts/", headers=headers)
+    response = client.get("metrics")
+    assert response.status_code == 200, response.text
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/contacts/",status="200"}' in response.text
+    assert sample("rate_limit_rejections_total", route="contacts:list", tier="user") >= 1
+
+
+def test_user_cache_metrics(client, get_token):
+    headers = {"Authorization": f"Bearer {get_token}"}
+    hits = sample("user_cache_lookups_total", result="hit")
+    misses = sample("user_cache_lookups_total", result="miss")
+    client.get("api/users/me", headers=headers)
+    assert sample("user_cache_lookups_total", result="hit") + sample("user_cache_lookups_total", result="miss") \
+        == hits + misses + 1
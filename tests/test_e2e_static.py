@@ -0,0 +1,45 @@
+import pytest
+
+from main import static_files, BASE_DIR
+from src.jobs.build_static import build
+
+
+SOURCE = BASE_DIR.joinpath("src").joinpath("static")
+
+
+@pytest.fixture
+def built_static(tmp_path, monkeypatch):
+    # serve a fresh build, as main.py does once python -m src.jobs.build_static has run
+    manifest = build(SOURCE, tmp_path)
+    monkeypatch.setattr(static_files, "directory", tmp_path)
+    monkeypatch.setattr(static_files, "all_directories", static_files.get_directories(tmp_path))
+    monkeypatch.setattr(static_files, "manifest", manifest)
+    monkeypatch.setattr(static_files, "hashed", frozenset(manifest.values()))
+    return manifest
+
+
+def test_index_links_assets(client):
+    response = client.get("/")
+    assert response.status_code == 200, response.text
+    assert f"/static/{static_files.asset('product.css')}" in response.text
+
+
+@pytest.mark.parametrize("encoding", ["br", "gzip"])
+def test_static_cache_control(client, built_static, encoding):
+    css = SOURCE.joinpath("product.css").read_bytes()
+    response = client.get(f"/static/{built_static['product.css']}", headers={"Accept-Encoding": encoding})
+    assert response.status_code == 200, response.text
+    assert response.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert response.headers["content-encoding"] == encoding
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.headers["content-type"].startswith("text/css")
+    assert response.content == css
+    # the sibling written by the build, not compressed on the fly
+    suffix = ".br" if encoding == "br" else ".gz"
+    sibling = static_files.directory / (built_static["product.css"] + suffix)
+    assert int(response.headers["content-length"]) == sibling.stat().st_size
+
+    response = client.get("/static/product.css", headers={"Accept-Encoding": encoding})
+    assert response.status_code == 200, response.text
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.headers["content-encoding"] == encoding
@@ -0,0 +1,23 @@
+import pytest
+
+from src.services.tracing import InMemoryExporter, tracer
+
+
+@pytest.fixture
+def spans(monkeypatch):
+    exporter = InMemoryExporter()
+    monkeypatch.setattr(tracer, "exporter", exporter)
+    monkeypatch.setattr(tracer, "enabled", True)
+    return exporter
+
+
+def test_request_waterfall(client, get_token, spans):
+    response = client.get("api/contacts/", headers={"Authorization": f"Bearer {get_token}"})
+    assert response.status_code == 200, response.text
+    trace = spans.trace(response.headers["x-trace-id"])
+    names = [span["name"] for span in trace]
+    assert "services.auth.RateLimitedUser.resolve" in names
+    assert "redis.evalsha" in names
+    assert "repository.contacts.get_contacts" in names
+    root = next(span for span in trace if span["parent_id"] is None)
+    assert root["attributes"]["route"] == "/api/contacts/"
@@ -0,0 +1,97 @@
+import gzip
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from src.jobs.build_static import build, fingerprint
+from src.services.assets import IMMUTABLE, MANIFEST, PrecompressedStaticFiles, load_manifest
+
+CSS = b".product { color: red; }\n" * 100
+PNG = b"\x89PNG\r\n" * 100
+
+
+class TestBuildStatic(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = Path(self.tmp.name, "static")
+        self.target = Path(self.tmp.name, "build")
+        self.source.joinpath("assets").mkdir(parents=True)
+        self.source.joinpath("assets", "product.css").write_bytes(CSS)
+        self.source.joinpath("open_check.png").write_bytes(PNG)
+        self.manifest = build(self.source, self.target)
+
+    def test_fingerprint(self):
+        hashed = fingerprint(Path("assets/product.css"), CSS)
+        self.assertRegex(hashed.as_posix(), r"^assets/product\.[0-9a-f]{10}\.css$")
+        self.assertNotEqual(hashed, fingerprint(Path("assets/product.css"), CSS + b" "))
+
+    def test_manifest(self):
+        self.assertEqual(set(self.manifest), {"assets/product.css", "open_check.png"})
+        self.assertEqual(json.loads(self.target.joinpath(MANIFEST).read_text()), self.manifest)
+        self.assertEqual(load_manifest(self.target), self.manifest)
+        self.assertEqual(load_manifest(self.source), {})
+
+    def test_files(self):
+        hashed = self.target / self.manifest["assets/product.css"]
+        self.assertEqual(hashed.read_bytes(), CSS)
+        self.assertEqual(self.target.joinpath("assets", "product.css").read_bytes(), CSS)
+        self.assertEqual(gzip.decompress(Path(f"{hashed}.gz").read_bytes()), CSS)
+
+    def test_binary_not_precompressed(self):
+        self.assertFalse(self.target.joinpath(self.manifest["open_check.png"] + ".gz").exists())
+
+
+class TestPrecompressedStaticFiles(TestBuildStatic):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.static_files = PrecompressedStaticFiles(directory=self.target)
+        self.client = TestClient(Starlette(routes=[Mount("/static", self.static_files, name="static")]))
+        self.css = self.manifest["assets/product.css"]
+
+    def get(self, path, **headers):
+        with self.client.stream("GET", f"/static/{path}", headers=headers) as response:
+            response.raw = b"".join(response.iter_raw())
+        return response
+
+    def test_asset(self):
+        self.assertEqual(self.static_files.asset("assets/product.css"), self.css)
+        self.assertEqual(self.static_files.asset("missing.js"), "missing.js")
+
+    def test_precompressed(self):
+        response = self.get(self.css, **{"Accept-Encoding": "gzip"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertTrue(response.headers["content-type"].startswith("text/css"))
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+        self.assertEqual(response.headers["cache-control"], IMMUTABLE)
+        self.assertEqual(gzip.decompress(response.raw), CSS)
+
+    def test_identity(self):
+        response = self.get(self.css, **{"Accept-Encoding": "identity"})
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(response.raw, CSS)
+
+    def test_unhashed_revalidated(self):
+        response = self.get("assets/product.css")
+        self.assertEqual(response.headers["cache-control"], "no-cache")
+
+    def test_not_modified(self):
+        etag = self.get(self.css, **{"Accept-Encoding": "gzip"}).headers["etag"]
+        response = self.get(self.css, **{"Accept-Encoding": "gzip", "If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["cache-control"], IMMUTABLE)
+
+    def test_missing(self):
+        self.assertEqual(self.get("missing.js").status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
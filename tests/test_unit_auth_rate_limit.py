@@ -0,0 +1,125 @@
+import asyncio
+import pickle
+import time
+import unittest
+from unittest.mock import patch, AsyncMock
+
+import fakeredis
+import redis.asyncio as aioredis
+from fastapi import HTTPException
+
+from src.config.config import config
+from src.entity.models import User
+from src.services.auth import auth_service, RateLimitedUser, LIMITED_USER_SCRIPT
+from src.services.rate_limit import LocalRateLimiter
+
+
+class TestAsyncRateLimitedUser(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self) -> None:
+        self.user = User(id=1, username="test_user", email="user@mail.com", password="a1d2m3", confirmed=True)
+        self.token = await auth_service.create_access_token(data={"sub": self.user.email})
+        self.redis = fakeredis.aioredis.FakeRedis()
+        self.limiter = LocalRateLimiter(sync_seconds=3600)
+        self.limiter.redis = self.redis
+        self.db = AsyncMock()
+        await self.redis.script_load(LIMITED_USER_SCRIPT)
+        self.commands = []
+        execute_command = self.redis.execute_command
+
+        async def count(*args, **kwargs):
+            self.commands.append(args[0])
+            return await execute_command(*args, **kwargs)
+
+        self.redis.execute_command = count
+        patcher = patch("src.services.auth.limiter", self.limiter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_cached_user_in_one_round_trip(self):
+        await self.redis.set(self.user.email, pickle.dumps(self.user))
+        self.commands.clear()
+        user = await RateLimitedUser("contacts:list").resolve(self.token, self.db)
+        self.assertEqual(user.email, self.user.email)
+        self.assertEqual(len(self.commands), 1)
+
+    async def test_cache_miss(self):
+        with patch("src.services.auth.repository_users.get_user_by_email", AsyncMock(return_value=self.user)):
+            user = await RateLimitedUser("contacts:list").resolve(self.token, self.db)
+        self.assertIs(user, self.user)
+        self.assertEqual(len(self.commands), 2)
+        self.assertIsNotNone(await self.redis.get(self.user.email))
+        self.assertGreater(await self.redis.ttl(self.user.email), 0)
+
+    async def test_reconciles_bucket(self):
+        await self.redis.set(self.user.email, pickle.dumps(self.user))
+        with patch("src.services.rate_limit.config.RATE_LIMIT_TIERS", {"user": "3/60"}):
+            dependency = RateLimitedUser("contacts:list")
+            await dependency.resolve(self.token, self.db)
+            keys = await self.redis.keys("rate:contacts:list:*")
+            self.assertEqual(len(keys), 1)
+            self.assertEqual(await self.redis.get(keys[0]), b"1")
+            await self.redis.set(keys[0], 3)
+            await dependency.resolve(self.token, self.db)
+            with self.assertRaises(HTTPException) as err:
+                await dependency.resolve(self.token, self.db)
+        self.assertEqual(err.exception.status_code, 429)
+
+    async def test_recovery_is_probed_without_rate_limiting(self):
+        self.limiter.healthy = False
+        self.limiter.sync_seconds = 0
+        with patch("src.services.auth.config.RATE_LIMIT_ENABLED", False), \
+                patch("src.services.auth.repository_users.get_user_by_email", AsyncMock(return_value=self.user)):
+            await RateLimitedUser("contacts:list").resolve(self.token, self.db)
+        await self.limiter._sync_task
+        self.assertTrue(self.limiter.healthy)
+
+    async def test_invalid_token(self):
+        with self.assertRaises(HTTPException) as err:
+            await RateLimitedUser("contacts:list").resolve("garbage", self.db)
+        self.assertEqual(err.exception.status_code, 401)
+        self.assertEqual(self.limiter.buckets, {})
+
+
+class TestAsyncBlackholedRedis(unittest.IsolatedAsyncioTestCase):
+    """Redis accepts connections but never answers, e.g. behind a dropped route."""
+
+    async def asyncSetUp(self) -> None:
+        self.connections = []
+
+        async def blackhole(reader, writer):
+            self.connections.append(writer)
+            await reader.read()
+
+        self.server = await asyncio.start_server(blackhole, "127.0.0.1", 0)
+        port = self.server.sockets[0].getsockname()[1]
+        options = dict(host="127.0.0.1", port=port, socket_timeout=config.REDIS_SOCKET_TIMEOUT,
+                       socket_connect_timeout=config.REDIS_CONNECT_TIMEOUT)
+        self.limiter = LocalRateLimiter(sync_seconds=3600)
+        self.limiter.redis = aioredis.Redis(**options)
+        self.user = User(id=1, username="test_user", email="user@mail.com", password="a1d2m3", confirmed=True)
+        self.token = await auth_service.create_access_token(data={"sub": self.user.email})
+        for patcher in (patch("src.services.auth.limiter", self.limiter),
+                        patch("src.services.rate_limit.config.RATE_LIMIT_TIERS", {"user": "10/60"}),
+                        patch("src.services.auth.repository_users.get_user_by_email",
+                              AsyncMock(return_value=self.user))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def asyncTearDown(self) -> None:
+        await self.limiter.redis.aclose()
+        for writer in self.connections:
+            writer.close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def resolve(self) -> float:
+        start = time.perf_counter()
+        user = await RateLimitedUser("contacts:list").resolve(self.token, AsyncMock())
+        self.assertIs(user, self.user)
+        return time.perf_counter() - start
+
+    async def test_times_out_then_skips_redis(self):
+        self.assertLess(await self.resolve(), config.REDIS_SOCKET_TIMEOUT + 1)
+        self.assertFalse(self.limiter.healthy)
+        self.assertLess(await self.resolve(), 0.1)
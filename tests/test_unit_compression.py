@@ -0,0 +1,161 @@
+import gzip
+import threading
+import unittest
+from unittest.mock import patch
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from starlette.testclient import TestClient
+
+from src.services import compression
+from src.services.compression import CompressionMiddleware, negotiate
+
+BODY = '{"name": "contact"}' * 200
+
+
+def json_page(request):
+    return Response(BODY, media_type="application/json")
+
+
+def small_page(request):
+    return Response('{"name": "contact"}', media_type="application/json")
+
+
+def image(request):
+    return Response(b"\x89PNG" * 1000, media_type="image/png")
+
+
+def encoded(request):
+    return Response(gzip.compress(BODY.encode()), media_type="application/json",
+                    headers={"Content-Encoding": "gzip"})
+
+
+def stream(request):
+    async def chunks():
+        for _ in range(10):
+            yield BODY
+    return StreamingResponse(chunks(), media_type="text/plain")
+
+
+def no_content(request):
+    return PlainTextResponse("", status_code=204)
+
+
+async def debug_info(scope, receive, send):
+    await send({"type": "http.response.debug", "info": {"template": None, "context": {}}})
+    await Response(BODY, media_type="text/html")(scope, receive, send)
+
+
+app = Starlette(routes=[Route("/json", json_page), Route("/small", small_page), Route("/image", image),
+                        Route("/encoded", encoded), Route("/stream", stream), Route("/empty", no_content),
+                        Mount("/debug", debug_info)])
+
+
+class TestNegotiate(unittest.TestCase):
+
+    def test_gzip(self):
+        self.assertEqual(negotiate("gzip, deflate"), "gzip")
+
+    def test_none(self):
+        self.assertIsNone(negotiate(""))
+        self.assertIsNone(negotiate("identity"))
+
+    def test_refused(self):
+        self.assertIsNone(negotiate("gzip;q=0"))
+        self.assertIsNone(negotiate("*;q=0"))
+
+    def test_wildcard(self):
+        self.assertIsNotNone(negotiate("*"))
+
+    def test_brotli_preferred(self):
+        with patch.object(compression, "brotli", object()):
+            negotiate.cache_clear()
+            try:
+                self.assertEqual(negotiate("gzip, br"), "br")
+                self.assertEqual(negotiate("gzip, br;q=0"), "gzip")
+            finally:
+                negotiate.cache_clear()
+
+    def test_brotli_not_installed(self):
+        with patch.object(compression, "brotli", None):
+            negotiate.cache_clear()
+            try:
+                self.assertIsNone(negotiate("br"))
+            finally:
+                negotiate.cache_clear()
+
+
+class TestCompressionMiddleware(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.client = TestClient(CompressionMiddleware(app, minimum_size=1024, thread_size=1024 * 1024))
+
+    def get(self, path, accept_encoding="gzip"):
+        # httpx decodes the body, so the raw stream is read to see what went over the wire
+        with self.client.stream("GET", path, headers={"Accept-Encoding": accept_encoding}) as response:
+            response.raw = b"".join(response.iter_raw())
+        return response
+
+    def test_compressed(self):
+        response = self.get("/json")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(response.headers["vary"], "Accept-Encoding")
+        self.assertEqual(int(response.headers["content-length"]), len(response.raw))
+        self.assertEqual(gzip.decompress(response.raw).decode(), BODY)
+
+    def test_below_minimum_size(self):
+        response = self.get("/small")
+        self.assertNotIn("content-encoding", response.headers)
+
+    def test_not_accepted(self):
+        response = self.get("/json", accept_encoding="identity")
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(response.raw.decode(), BODY)
+
+    def test_content_type_not_allowed(self):
+        response = self.get("/image")
+        self.assertNotIn("content-encoding", response.headers)
+
+    def test_already_encoded(self):
+        response = self.get("/encoded")
+        self.assertEqual(gzip.decompress(response.raw).decode(), BODY)
+
+    def test_no_content(self):
+        response = self.get("/empty")
+        self.assertEqual(response.status_code, 204)
+        self.assertNotIn("content-encoding", response.headers)
+
+    def test_stream(self):
+        response = self.get("/stream")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertNotIn("content-length", response.headers)
+        self.assertEqual(gzip.decompress(response.raw).decode(), BODY * 10)
+
+    def test_debug_before_start(self):
+        response = self.get("/debug")
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.raw).decode(), BODY)
+
+    def compress_threads(self, thread_size):
+        threads = []
+
+        def compress(body, encoding):
+            threads.append(threading.current_thread().name)
+            return gzip.compress(body)
+
+        self.client = TestClient(CompressionMiddleware(app, minimum_size=1024, thread_size=thread_size))
+        with patch.object(compression, "compress", compress):
+            response = self.get("/json")
+        self.assertEqual(gzip.decompress(response.raw).decode(), BODY)
+        return threads
+
+    def test_large_body_on_worker_thread(self):
+        self.assertEqual(self.compress_threads(1024), ["AnyIO worker thread"])
+
+    def test_small_body_inline(self):
+        self.assertNotEqual(self.compress_threads(1024 * 1024), ["AnyIO worker thread"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+
+import fakeredis
+
+from src.services.contact_cache import ContactCache, query_key, user_prefix
+
+
+class TestContactCache(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.server = fakeredis.FakeServer()
+        self.cache = ContactCache(ttl=300)
+        self.cache.redis = fakeredis.aioredis.FakeRedis(server=self.server)
+        self.renders = 0
+
+    async def render(self) -> bytes:
+        self.renders += 1
+        return f"[{self.renders}]".encode()
+
+    async def test_miss_then_hit(self):
+        self.assertEqual(await self.cache.fetch(1, ("contacts:list", 10, 0), self.render), b"[1]")
+        self.assertEqual(await self.cache.fetch(1, ("contacts:list", 10, 0), self.render), b"[1]")
+        self.assertEqual(self.renders, 1)
+
+    async def test_queries_and_users_are_separate(self):
+        await self.cache.fetch(1, ("contacts:list", 10, 0), self.render)
+        await self.cache.fetch(1, ("contacts:list", 20, 0), self.render)
+        await self.cache.fetch(2, ("contacts:list", 10, 0), self.render)
+        self.assertEqual(self.renders, 3)
+
+    async def test_invalidate_drops_all_queries_of_the_user(self):
+        await self.cache.fetch(1, ("contacts:list", 10, 0), self.render)
+        await self.cache.fetch(1, ("contacts:name", "Olena"), self.render)
+        await self.cache.fetch(2, ("contacts:list", 10, 0), self.render)
+        await self.cache.invalidate(1)
+        self.assertEqual(await self.cache.fetch(1, ("contacts:list", 10, 0), self.render), b"[4]")
+        self.assertEqual(await self.cache.fetch(1, ("contacts:name", "Olena"), self.render), b"[5]")
+        self.assertEqual(await self.cache.fetch(2, ("contacts:list", 10, 0), self.render), b"[3]")
+        self.assertEqual(await self.cache.redis.get(user_prefix(1) + "version"), b"1")
+
+    async def test_write_during_render_is_not_hidden(self):
+        async def render_and_write() -> bytes:
+            await self.cache.invalidate(1)
+            return b"[stale]"
+
+        await self.cache.fetch(1, ("contacts:list", 10, 0), render_and_write)
+        self.assertEqual(await self.cache.fetch(1, ("contacts:list", 10, 0), self.render), b"[1]")
+
+    async def test_replica_reads_are_not_stored(self):
+        self.assertEqual(await self.cache.fetch(1, ("contacts:list", 10, 0), self.render, store=False), b"[1]")
+        self.assertEqual(await self.cache.redis.keys(), [])
+        self.assertEqual(await self.cache.fetch(1, ("contacts:list", 10, 0), self.render), b"[2]")
+        self.assertEqual(await self.cache.fetch(1, ("contacts:list", 10, 0), self.render, store=False), b"[2]")
+
+    async def test_version_outlives_entries(self):
+        await self.cache.invalidate(1)
+        await self.cache.fetch(1, ("contacts:list", 10, 0), self.render)
+        version_ttl = await self.cache.redis.ttl(user_prefix(1) + "version")
+        entry_ttl = await self.cache.redis.ttl(f"{user_prefix(1)}1:{query_key(('contacts:list', 10, 0))}")
+        self.assertGreaterEqual(version_ttl, entry_ttl)
+        self.assertGreater(entry_ttl, 0)
+
+    async def test_redis_outage_falls_back_to_render(self):
+        self.server.connected = False
+        self.assertEqual(await self.cache.fetch(1, ("contacts:list", 10, 0), self.render), b"[1]")
+        self.assertEqual(await self.cache.fetch(1, ("contacts:list", 10, 0), self.render), b"[2]")
+        await self.cache.invalidate(1)
+
+    async def test_disabled(self):
+        self.cache.enabled = False
+        await self.cache.fetch(1, ("contacts:list", 10, 0), self.render)
+        await self.cache.fetch(1, ("contacts:list", 10, 0), self.render)
+        self.assertEqual(self.renders, 2)
+        self.assertEqual(await self.cache.redis.keys(), [])
+
+    def test_query_key(self):
+        self.assertRegex(query_key(("contacts:name", "x" * 1000)), r"^contacts:name:[0-9a-f]{24}$")
+        self.assertNotEqual(query_key(("contacts:list", 10, 0)), query_key(("contacts:list", 0, 10)))
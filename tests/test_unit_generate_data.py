@@ -0,0 +1,69 @@
+import asyncio
+import os
+import random
+import sqlite3
+import tempfile
+import unittest
+from datetime import datetime
+
+from src.jobs.generate_data import (CONTACT_COLUMNS, USER_COLUMNS, contacts_per_user, create_tables, generate_chunk,
+                                    load_chunks, skip_existing, user_email)
+
+NOW = datetime(2024, 3, 1, 12)
+
+
+class TestGenerateData(unittest.TestCase):
+
+    def test_generate_chunk_is_deterministic(self):
+        first = generate_chunk(1, 10, 25, 20, seed=7, password="hash", now=NOW)
+        self.assertEqual(first, generate_chunk(1, 10, 25, 20, seed=7, password="hash", now=NOW))
+        self.assertNotEqual(first, generate_chunk(1, 10, 25, 20, seed=8, password="hash", now=NOW))
+
+    def test_generate_chunk_rows(self):
+        user_rows, contact_rows = generate_chunk(2, 10, 25, 20, seed=0, password="hash", now=NOW)
+        self.assertEqual([row[1] for row in user_rows], [user_email(i) for i in range(20, 25)])
+        self.assertEqual(len(user_rows[0]), len(USER_COLUMNS))
+        self.assertEqual(len(contact_rows), 5)
+        for row in (row for rows in contact_rows for row in rows):
+            self.assertEqual(len(row), len(CONTACT_COLUMNS) - 1)
+            self.assertRegex(row[2], r"^\+380\d{9}$")
+            self.assertIn("@", row[3])
+
+    def test_smaller_run_is_a_prefix_of_a_larger_one(self):
+        small = generate_chunk(0, 10, 4, 20, seed=0, password="hash", now=NOW)
+        large = generate_chunk(0, 10, 10, 20, seed=0, password="hash", now=NOW)
+        self.assertEqual(small[0], large[0][:4])
+        self.assertEqual(small[1], large[1][:4])
+
+    def test_skip_existing(self):
+        user_rows, contact_rows = generate_chunk(0, 10, 3, 5, seed=0, password="hash", now=NOW)
+        rows = skip_existing({user_email(0), user_email(2)}, user_rows, contact_rows)
+        self.assertEqual(rows, ([user_rows[1]], [contact_rows[1]]))
+
+    def test_contacts_per_user_is_skewed(self):
+        rng = random.Random(0)
+        sizes = sorted(contacts_per_user(rng, 100) for _ in range(10000))
+        self.assertAlmostEqual(sum(sizes) / len(sizes), 100, delta=10)
+        self.assertLess(sizes[len(sizes) // 2], 100)
+        self.assertLessEqual(sizes[-1], 5000)
+        self.assertEqual(contacts_per_user(rng, 0), 0)
+
+    def test_load_chunks_resumes(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "datagen.db")
+            url = f"sqlite+aiosqlite:///{path}"
+            asyncio.run(create_tables(url))
+
+            users, contacts = asyncio.run(load_chunks(url, [0, 1], 10, 15, 5, 0, "hash", 7))
+            self.assertEqual(users, 15)
+            self.assertEqual(asyncio.run(load_chunks(url, [0, 1], 10, 15, 5, 0, "hash", 7)), (0, 0))
+            self.assertEqual(asyncio.run(load_chunks(url, [1, 2], 10, 25, 5, 0, "hash", 7))[0], 10)
+
+            with sqlite3.connect(path) as connection:
+                self.assertEqual(connection.execute("SELECT count(*), count(DISTINCT email) FROM users").fetchone(),
+                                 (25, 25))
+                counts = dict(connection.execute(
+                    "SELECT users.email, count(contacts.id) FROM users "
+                    "LEFT JOIN contacts ON contacts.user_id = users.id GROUP BY users.email"))
+            self.assertEqual(counts[user_email(3)], len(generate_chunk(0, 10, 15, 5, 0, "hash", NOW)[1][3]))
+            self.assertGreaterEqual(sum(counts.values()), contacts)
@@ -0,0 +1,56 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+from src.services.health import ReadinessProbe
+
+
+class TestAsyncReadinessProbe(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.app = object()
+        self.database = AsyncMock(return_value={"pool": {}})
+        self.redis = AsyncMock(return_value={})
+        self.mail = AsyncMock(return_value={})
+        self.probe = ReadinessProbe({"database": self.database, "redis": self.redis, "mail": self.mail},
+                                    critical={"database"}, cache_seconds=60, timeout=0.1)
+
+    async def test_ok(self):
+        report = await self.probe(self.app)
+        self.assertEqual(report["status"], "ok")
+        self.assertFalse(report["cached"])
+        self.assertEqual(report["checks"]["database"]["status"], "ok")
+        self.assertIn("latency_ms", report["checks"]["database"])
+        self.database.assert_awaited_once_with(self.app)
+
+    async def test_cached(self):
+        await self.probe(self.app)
+        report = await self.probe(self.app)
+        self.assertTrue(report["cached"])
+        self.assertEqual(self.database.await_count, 1)
+
+    async def test_concurrent_probes_share_one_check(self):
+        reports = await asyncio.gather(*(self.probe(self.app) for _ in range(10)))
+        self.assertEqual(self.redis.await_count, 1)
+        self.assertEqual(sum(not report["cached"] for report in reports), 1)
+
+    async def test_critical_failure(self):
+        self.database.side_effect = ConnectionError("refused")
+        report = await self.probe(self.app)
+        self.assertEqual(report["status"], "fail")
+        self.assertEqual(report["checks"]["database"]["error"], "ConnectionError: refused")
+
+    async def test_optional_failure(self):
+        self.redis.side_effect = ConnectionError("refused")
+        self.mail.side_effect = OSError("unreachable")
+        report = await self.probe(self.app)
+        self.assertEqual(report["status"], "degraded")
+        self.assertEqual(report["checks"]["redis"]["error"], "ConnectionError: refused")
+
+    async def test_timeout(self):
+        async def hang(app):
+            await asyncio.sleep(1)
+        self.probe.checks["database"] = hang
+        report = await self.probe(self.app)
+        self.assertEqual(report["status"], "fail")
+        self.assertEqual(report["checks"]["database"]["status"], "fail")
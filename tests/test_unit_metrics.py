@@ -0,0 +1,94 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from prometheus_client import REGISTRY
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Mount, Route
+from starlette.testclient import TestClient
+
+from src.services import metrics
+from src.services.metrics import MetricsMiddleware, route_name
+
+
+def contact(request):
+    return PlainTextResponse("contact")
+
+
+def fail(request):
+    raise RuntimeError("boom")
+
+
+app = Starlette(routes=[Route("/contacts/{contact_id}", contact), Route("/fail", fail),
+                        Mount("/static", PlainTextResponse("static"))])
+
+
+def latency_count(method, route, status):
+    return REGISTRY.get_sample_value("http_request_duration_seconds_count",
+                                     {"method": method, "route": route, "status": str(status)}) or 0
+
+
+class TestRouteName(unittest.TestCase):
+
+    def test_route(self):
+        self.assertEqual(route_name({"route": SimpleNamespace(path="/api/contacts/{contact_id}")}),
+                         "/api/contacts/{contact_id}")
+
+    def test_mount(self):
+        self.assertEqual(route_name({"endpoint": object(), "root_path": "/static"}), "/static")
+
+    def test_unmatched(self):
+        self.assertEqual(route_name({}), "unmatched")
+
+
+class TestMetricsMiddleware(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.client = TestClient(MetricsMiddleware(app), raise_server_exceptions=False)
+
+    def test_latency_by_route(self):
+        # starlette routes do not set scope["route"], they are labelled like mounts with the root path
+        before = latency_count("GET", "/", 200)
+        self.client.get("/contacts/1")
+        self.client.get("/contacts/2")
+        self.assertEqual(latency_count("GET", "/", 200), before + 2)
+
+    def test_not_found(self):
+        before = latency_count("GET", "unmatched", 404)
+        self.client.get("/missing")
+        self.assertEqual(latency_count("GET", "unmatched", 404), before + 1)
+
+    def test_error(self):
+        before = latency_count("GET", "/", 500)
+        self.client.get("/fail")
+        self.assertEqual(latency_count("GET", "/", 500), before + 1)
+
+    def test_in_flight(self):
+        self.client.get("/contacts/1")
+        self.assertEqual(REGISTRY.get_sample_value("http_requests_in_flight"), 0)
+
+
+class TestMultiprocess(unittest.TestCase):
+
+    def test_workers_aggregated(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": directory}
+            worker = "from src.services.metrics import USER_CACHE_HIT; USER_CACHE_HIT.inc(3)"
+            for _ in range(2):
+                subprocess.run([sys.executable, "-c", worker], env=env, check=True)
+            with patch.dict(os.environ, {"PROMETHEUS_MULTIPROC_DIR": directory}):
+                metrics.registry.cache_clear()
+                try:
+                    value = metrics.registry().get_sample_value("user_cache_lookups_total", {"result": "hit"})
+                finally:
+                    metrics.registry.cache_clear()
+        self.assertEqual(value, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
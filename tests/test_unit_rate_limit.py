@@ -0,0 +1,120 @@
+import unittest
+from unittest.mock import patch, AsyncMock, MagicMock
+
+import fakeredis
+
+from src.services.rate_limit import TokenBucket, SlidingWindowLimiter, LocalRateLimiter, parse_quota
+
+
+class TestTokenBucket(unittest.TestCase):
+
+    def test_parse_quota(self):
+        self.assertEqual(parse_quota("5/60"), (5, 60.0))
+
+    def test_take_and_refill(self):
+        bucket = TokenBucket(2, 10, now=0.0)
+        self.assertEqual(bucket.take(0.0), 0.0)
+        self.assertEqual(bucket.take(0.0), 0.0)
+        self.assertAlmostEqual(bucket.take(0.0), 5.0)
+        self.assertEqual(bucket.take(5.0), 0.0)
+        self.assertEqual(bucket.pending, 3)
+
+
+class TestAsyncLocalRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.limiter = LocalRateLimiter(sync_seconds=3600)
+
+    def test_quota_lookup(self):
+        with patch("src.services.rate_limit.config.RATE_LIMIT_ROUTES", {"contacts:list": {"premium": "100/60"}}), \
+                patch("src.services.rate_limit.config.RATE_LIMIT_TIERS", {"user": "10/60"}):
+            self.assertEqual(self.limiter.quota("contacts:list", "premium"), (100, 60.0))
+            self.assertEqual(self.limiter.quota("contacts:get", "user"), (10, 60.0))
+            self.assertEqual(self.limiter.quota("contacts:get", "premium"), (1, 20.0))
+
+    def test_hit(self):
+        self.assertEqual(self.limiter.hit("contacts:list", "user:a", "user"), 0.0)
+        self.assertGreater(self.limiter.hit("contacts:list", "user:a", "user"), 0.0)
+        self.assertEqual(self.limiter.hit("contacts:list", "user:b", "user"), 0.0)
+        self.assertEqual(self.limiter.hit("contacts:get", "user:a", "user"), 0.0)
+
+    async def test_sync_caps_buckets_by_shared_quota(self):
+        self.limiter.redis = fakeredis.aioredis.FakeRedis()
+        other = LocalRateLimiter()
+        other.redis = self.limiter.redis
+        with patch("src.services.rate_limit.config.RATE_LIMIT_TIERS", {"user": "3/60"}):
+            self.limiter.hit("contacts:list", "user:a", "user")
+            for _ in range(2):
+                other.hit("contacts:list", "user:a", "user")
+        await other.sync()
+        await self.limiter.sync()
+        bucket = self.limiter.buckets[("contacts:list", "user:a")]
+        self.assertEqual(bucket.pending, 0)
+        self.assertEqual(bucket.tokens, 0.0)
+        self.assertGreater(self.limiter.hit("contacts:list", "user:a", "user"), 0.0)
+
+    async def test_sync_failure_falls_back_to_memory(self):
+        self.limiter.redis = MagicMock()
+        self.limiter.redis.pipeline.return_value.__aenter__ = AsyncMock(side_effect=ConnectionError("refused"))
+        self.limiter.hit("contacts:list", "user:a", "user")
+        await self.limiter.sync()
+        self.assertFalse(self.limiter.healthy)
+        self.assertGreater(self.limiter.hit("contacts:list", "user:a", "user"), 0.0)
+
+
+class TestSlidingWindowLimiter(unittest.TestCase):
+
+    def test_hit(self):
+        window = SlidingWindowLimiter()
+        self.assertEqual(window.hit("contacts:list", "user:a", 2, 10, now=0.0), 0.0)
+        self.assertEqual(window.hit("contacts:list", "user:a", 2, 10, now=4.0), 0.0)
+        self.assertAlmostEqual(window.hit("contacts:list", "user:a", 2, 10, now=5.0), 5.0)
+        self.assertEqual(window.hit("contacts:list", "user:a", 2, 10, now=10.0), 0.0)
+        self.assertAlmostEqual(window.hit("contacts:list", "user:a", 2, 10, now=11.0), 3.0)
+
+    def test_buckets_reverse_seed(self):
+        window = SlidingWindowLimiter()
+        window.hit("contacts:list", "user:a", 3, 10, now=0.0)
+        window.hit("contacts:list", "user:a", 3, 10, now=6.0)
+        window.hit("contacts:list", "user:b", 3, 10, now=1.0)
+        buckets = window.buckets(now=8.0)
+        self.assertEqual(set(buckets), {("contacts:list", "user:a"), ("contacts:list", "user:b")})
+        self.assertEqual(buckets[("contacts:list", "user:a")].tokens, 1.0)
+        self.assertEqual(buckets[("contacts:list", "user:b")].tokens, 2.0)
+        self.assertEqual(set(window.buckets(now=20.0)), set())
+
+        window = SlidingWindowLimiter()
+        window.seed(buckets)
+        self.assertEqual(len(window.windows[("contacts:list", "user:a")]), 2)
+        self.assertEqual(window.buckets(now=8.0)[("contacts:list", "user:a")].tokens, 1.0)
+
+
+class TestAsyncRedisOutage(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.server = fakeredis.FakeServer()
+        self.limiter = LocalRateLimiter(sync_seconds=0)
+        self.limiter.redis = fakeredis.aioredis.FakeRedis(server=self.server)
+
+    async def settle(self):
+        await self.limiter._sync_task
+
+    async def test_outage_and_recovery(self):
+        self.server.connected = False
+        self.assertEqual(self.limiter.hit("contacts:list", "user:a", "user"), 0.0)
+        await self.settle()
+        self.assertFalse(self.limiter.healthy)
+
+        self.assertGreater(self.limiter.hit("contacts:list", "user:a", "user"), 0.0)
+        await self.settle()
+        self.assertFalse(self.limiter.healthy)
+        self.assertIn(("contacts:list", "user:a"), self.limiter.fallback.windows)
+
+        self.server.connected = True
+        self.limiter.hit("contacts:list", "user:b", "user")
+        await self.settle()
+        self.assertTrue(self.limiter.healthy)
+        self.assertEqual(self.limiter.fallback.windows, {})
+        self.assertGreater(self.limiter.hit("contacts:list", "user:a", "user"), 0.0)
+        self.assertGreater(self.limiter.hit("contacts:list", "user:b", "user"), 0.0)
+        self.assertEqual(self.limiter.hit("contacts:list", "user:c", "user"), 0.0)
@@ -0,0 +1,101 @@
+import unittest
+from collections import namedtuple
+from unittest.mock import MagicMock, AsyncMock
+from datetime import date
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.jobs.birthday_reminders import lock_key
+from src.repository.birthdays import (birthday_keys, next_birthday, claim_digests, mark_digests_sent,
+                                      iter_upcoming_birthdays, shard_range, upcoming_birthdays_stmt)
+
+Row = namedtuple("Row", "id email username name surname phone_number birthday")
+
+
+class TestBirthdayKeys(unittest.TestCase):
+
+    def test_birthday_keys(self):
+        self.assertEqual(birthday_keys(3, date(2024, 3, 1)), [301, 302, 303, 304])
+
+    def test_birthday_keys_year_wrap(self):
+        self.assertEqual(birthday_keys(2, date(2024, 12, 31)), [101, 102, 1231])
+
+    def test_birthday_keys_leap_day_in_common_year(self):
+        self.assertIn(229, birthday_keys(1, date(2025, 2, 27)))
+        self.assertNotIn(229, birthday_keys(1, date(2024, 2, 27)))
+
+    def test_next_birthday(self):
+        self.assertEqual(next_birthday(date(1990, 5, 10), date(2024, 5, 10)), date(2024, 5, 10))
+        self.assertEqual(next_birthday(date(1990, 1, 2), date(2024, 12, 31)), date(2025, 1, 2))
+        self.assertEqual(next_birthday(date(1992, 2, 29), date(2025, 2, 1)), date(2025, 2, 28))
+
+
+class TestShards(unittest.TestCase):
+
+    def test_shard_ranges_cover_all_users(self):
+        ranges = [shard_range(shard, 4, 10) for shard in range(4)]
+        self.assertEqual(ranges, [(0, 3), (3, 6), (6, 9), (9, None)])
+        self.assertEqual(shard_range(0, 1, 0), (0, None))
+
+    def test_shard_query_reads_a_user_id_range(self):
+        sql = str(upcoming_birthdays_stmt(7, (3, 6), date(2024, 3, 1)).compile(dialect=postgresql.dialect()))
+        self.assertIn("contacts.user_id >= ", sql)
+        self.assertIn("contacts.user_id < ", sql)
+        self.assertNotIn("contacts.user_id %", sql)
+        sql = str(upcoming_birthdays_stmt(7, (9, None), date(2024, 3, 1)).compile(dialect=postgresql.dialect()))
+        self.assertNotIn("contacts.user_id < ", sql)
+
+    def test_lock_key_includes_shard_count(self):
+        day = date(2024, 3, 1)
+        self.assertNotEqual(lock_key(day, 1, 4), lock_key(day, 1, 8))
+        self.assertNotEqual(lock_key(day, 1, 4), lock_key(date(2024, 3, 2), 1, 4))
+        self.assertLess(lock_key(date(9999, 12, 31), 998, 999), 2 ** 63)
+        with self.assertRaises(ValueError):
+            lock_key(day, 4, 4)
+
+
+class TestAsyncBirthdayDigests(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.session = AsyncMock(spec=AsyncSession)
+        self.session.bind = MagicMock()
+        self.session.bind.dialect.name = 'postgresql'
+
+    async def test_claim_digests_returns_pending(self):
+        pending = MagicMock()
+        pending.all.return_value = [(1, 10)]
+        self.session.execute.side_effect = [MagicMock(), pending]
+        digests = [{"user_id": 1, "contacts": [{}]}, {"user_id": 2, "contacts": [{}, {}]}]
+        result = await claim_digests(digests, date(2024, 3, 1), self.session)
+        self.assertEqual(result, {1: 10})
+        insert_stmt = self.session.execute.call_args_list[0].args[0]
+        self.assertIn("ON CONFLICT", str(insert_stmt.compile(dialect=postgresql.dialect())))
+        self.session.commit.assert_called_once()
+
+    async def test_claim_digests_empty(self):
+        result = await claim_digests([], date(2024, 3, 1), self.session)
+        self.assertEqual(result, {})
+        self.session.execute.assert_not_called()
+
+    async def test_mark_digests_sent(self):
+        await mark_digests_sent([10, 11], self.session)
+        self.session.execute.assert_called_once()
+        self.session.commit.assert_called_once()
+
+    async def test_iter_upcoming_birthdays_across_partitions(self):
+        rows = [Row(1, "a@mail.com", "a", f"contact_{i}", "surname", "+380501111111", date(1990, 3, 3 - i))
+                for i in range(3)]
+        rows.append(Row(2, "b@mail.com", "b", "contact_3", "surname", "+380501111111", date(1990, 3, 2)))
+
+        async def partitions():
+            for i in range(0, len(rows), 2):
+                yield rows[i:i + 2]
+
+        self.session.stream.return_value.partitions = partitions
+        digests = [digest async for digest in
+                   iter_upcoming_birthdays(7, (0, None), self.session, date(2024, 3, 1), yield_per=2)]
+        self.assertEqual([digest["user_id"] for digest in digests], [1, 2])
+        self.assertEqual([contact["name"] for contact in digests[0]["contacts"]],
+                         ["contact_2", "contact_1", "contact_0"])
+        self.assertEqual(digests[1]["email"], "b@mail.com")
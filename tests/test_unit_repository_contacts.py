@@ -116,8 +116,27 @@ class TestAsyncContacts(unittest.IsolatedAsyncioTestCase):
         mocked_contact = MagicMock()
         mocked_contact.scalars.return_value.all.return_value = contacts
         self.session.execute.return_value = mocked_contact
-        result = await get_contact_by_birthday(n=7, db=self.session, user=self.user)
+        with patch('src.repository.contacts.datetime', wraps=datetime) as mocked_datetime:
+            mocked_datetime.now.return_value = datetime(2024, 3, 14)
+            result = await get_contact_by_birthday(n=7, db=self.session, user=self.user)
         self.assertEqual(result, contacts)
+
+
+    async def test_get_contact_by_birthday_leap_day_in_common_year(self):
+        contact = Contact(id=1,
+                          name='test_name_1',
+                          surname='test_surname_1',
+                          phone_number='+380501111111',
+                          email='testmail1@mail.com',
+                          birthday=date(1992, 2, 29),
+                          notes='note_1')
+        mocked_contact = MagicMock()
+        mocked_contact.scalars.return_value.all.return_value = [contact]
+        self.session.execute.return_value = mocked_contact
+        with patch('src.repository.contacts.datetime', wraps=datetime) as mocked_datetime:
+            mocked_datetime.now.return_value = datetime(2025, 2, 25)
+            result = await get_contact_by_birthday(n=7, db=self.session, user=self.user)
+        self.assertEqual(result, [contact])
             
 
     async def test_get_contact(self):
@@ -0,0 +1,33 @@
+import unittest
+
+from gunicorn.config import Config
+from gunicorn.util import load_class
+
+from src.config.config import config
+from src.config.workers import UvloopWorker
+
+
+class TestGunicornConfig(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cfg = Config()
+        namespace = {"__file__": "gunicorn.conf.py", "__name__": "__config__"}
+        with open("gunicorn.conf.py") as file:
+            exec(compile(file.read(), "gunicorn.conf.py", "exec"), namespace)
+        for name, value in namespace.items():
+            if name in self.cfg.settings:
+                self.cfg.set(name, value)
+
+    def test_settings(self):
+        self.assertTrue(self.cfg.preload_app)
+        self.assertEqual(self.cfg.max_requests, config.SERVER_MAX_REQUESTS)
+        self.assertEqual(self.cfg.graceful_timeout, config.SERVER_GRACEFUL_TIMEOUT)
+        self.assertGreaterEqual(self.cfg.workers, 1)
+
+    def test_worker_class(self):
+        self.assertIs(load_class(self.cfg.worker_class_str), UvloopWorker)
+        self.assertEqual(UvloopWorker.CONFIG_KWARGS, {"loop": "uvloop", "http": "httptools"})
+
+
+if __name__ == '__main__':
+    unittest.main()
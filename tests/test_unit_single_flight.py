@@ -0,0 +1,91 @@
+import asyncio
+import unittest
+
+from prometheus_client import REGISTRY
+
+from src.services.single_flight import SingleFlight
+
+
+def coalesced(route: str) -> float:
+    return REGISTRY.get_sample_value("coalesced_requests_total", {"route": route}) or 0
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.flight = SingleFlight()
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def call(self):
+        self.calls += 1
+        await self.release.wait()
+        return b"[]"
+
+    async def test_identical_calls_are_shared(self):
+        shared = coalesced("contacts:birthday")
+        tasks = [asyncio.create_task(self.flight.do(("contacts:birthday", 1, 7), self.call)) for _ in range(5)]
+        await asyncio.sleep(0)
+        self.assertEqual(self.flight.in_flight(), 1)
+        self.release.set()
+        self.assertEqual(await asyncio.gather(*tasks), [b"[]"] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.flight.in_flight(), 0)
+        self.assertEqual(coalesced("contacts:birthday") - shared, 4)
+
+    async def test_different_keys_are_not_shared(self):
+        tasks = [asyncio.create_task(self.flight.do(("contacts:birthday", user, 7), self.call)) for user in (1, 2)]
+        await asyncio.sleep(0)
+        self.release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.calls, 2)
+
+    async def test_nothing_is_kept_after_the_call(self):
+        self.release.set()
+        await self.flight.do(("contacts:list", 1, 10, 0), self.call)
+        await self.flight.do(("contacts:list", 1, 10, 0), self.call)
+        self.assertEqual(self.calls, 2)
+
+    async def test_exception_is_raised_in_every_caller(self):
+        async def fail():
+            await self.release.wait()
+            raise LookupError("Not Found")
+
+        tasks = [asyncio.create_task(self.flight.do(("contacts:get", 1, 5), fail)) for _ in range(3)]
+        await asyncio.sleep(0)
+        self.release.set()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        self.assertTrue(all(isinstance(result, LookupError) for result in results))
+        self.assertEqual(self.flight.in_flight(), 0)
+
+    async def test_waiters_retry_when_the_running_caller_is_cancelled(self):
+        leader = asyncio.create_task(self.flight.do(("contacts:list", 1, 10, 0), self.call))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(self.flight.do(("contacts:list", 1, 10, 0), self.call))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        self.release.set()
+        self.assertEqual(await follower, b"[]")
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(self.calls, 2)
+
+    async def test_cancelled_waiter_does_not_cancel_the_call(self):
+        leader = asyncio.create_task(self.flight.do(("contacts:list", 1, 10, 0), self.call))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(self.flight.do(("contacts:list", 1, 10, 0), self.call))
+        await asyncio.sleep(0)
+        follower.cancel()
+        await asyncio.sleep(0)
+        self.release.set()
+        self.assertEqual(await leader, b"[]")
+        self.assertTrue(follower.cancelled())
+
+    async def test_disabled(self):
+        self.flight.enabled = False
+        tasks = [asyncio.create_task(self.flight.do(("contacts:birthday", 1, 7), self.call)) for _ in range(3)]
+        await asyncio.sleep(0)
+        self.assertEqual(self.flight.in_flight(), 0)
+        self.release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(self.calls, 3)
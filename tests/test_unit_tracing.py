@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from src.services.tracing import (InMemoryExporter, JsonLinesExporter, Tracer, TracingMiddleware, traced, tracer,
+                                  waterfall)
+
+
+@traced(attributes=("contact_id", "user.id", "limit"))
+async def get_contact(contact_id: int, db, user, limit: int = 10):
+    return await child()
+
+
+@traced()
+async def child():
+    with tracer.span("redis.get", key="k"):
+        return "contact"
+
+
+@traced()
+def hash_password(password: str):
+    raise ValueError("weak")
+
+
+def endpoint(request):
+    return PlainTextResponse("ok")
+
+
+class TestTracing(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self) -> None:
+        self.exporter = InMemoryExporter()
+        self.previous = tracer.exporter, tracer.enabled
+        tracer.exporter = self.exporter
+        tracer.enable()
+
+    def tearDown(self) -> None:
+        tracer.exporter, tracer.enabled = self.previous
+
+    async def test_disabled(self):
+        tracer.disable()
+        self.assertEqual(await get_contact(1, None, SimpleNamespace(id=7)), "contact")
+        self.assertEqual(list(self.exporter.spans), [])
+
+    async def test_nested_spans(self):
+        await get_contact(1, None, SimpleNamespace(id=7))
+        redis, inner, outer = self.exporter.spans
+        self.assertEqual(outer["name"], "tests.test_unit_tracing.get_contact")
+        self.assertEqual(outer["attributes"], {"contact_id": 1, "user.id": 7, "limit": 10})
+        self.assertIsNone(outer["parent_id"])
+        self.assertEqual(inner["parent_id"], outer["span_id"])
+        self.assertEqual(redis["parent_id"], inner["span_id"])
+        self.assertEqual(redis["attributes"], {"key": "k"})
+        self.assertEqual({span["trace_id"] for span in self.exporter.spans}, {outer["trace_id"]})
+        self.assertEqual(len(self.exporter.trace(outer["trace_id"])), 3)
+
+    async def test_keyword_arguments(self):
+        await get_contact(contact_id=2, db=None, user=SimpleNamespace(id=8), limit=5)
+        self.assertEqual(self.exporter.spans[-1]["attributes"], {"contact_id": 2, "user.id": 8, "limit": 5})
+
+    async def test_separate_traces(self):
+        await child()
+        await child()
+        self.assertEqual(len({span["trace_id"] for span in self.exporter.spans}), 2)
+
+    def test_error(self):
+        with self.assertRaises(ValueError):
+            hash_password("secret")
+        span = self.exporter.spans[-1]
+        self.assertEqual(span["error"], "ValueError")
+        self.assertEqual(span["attributes"], {})
+
+    def test_toggle(self):
+        tracer.toggle()
+        self.assertFalse(tracer.enabled)
+        tracer.toggle()
+        self.assertTrue(tracer.enabled)
+
+    async def test_waterfall(self):
+        await get_contact(1, None, SimpleNamespace(id=7))
+        lines = waterfall(list(self.exporter.spans)).splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertIn("    redis.get", lines[2])
+
+    def test_json_lines_exporter(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "traces.jsonl")
+            local = Tracer(JsonLinesExporter(path), enabled=True)
+            with local.span("outer"):
+                with local.span("inner", rows=3):
+                    pass
+            local.close()
+            with open(path) as file:
+                spans = [json.loads(line) for line in file]
+        self.assertEqual([span["name"] for span in spans], ["inner", "outer"])
+        self.assertEqual(spans[0]["attributes"], {"rows": 3})
+
+    def test_middleware(self):
+        client = TestClient(TracingMiddleware(Starlette(routes=[Route("/contacts", endpoint)])))
+        response = client.get("/contacts")
+        root = self.exporter.spans[-1]
+        self.assertEqual(response.headers["x-trace-id"], root["trace_id"])
+        self.assertEqual(root["name"], "http.request")
+        self.assertEqual(root["attributes"], {"method": "GET", "path": "/contacts", "status": 200})
+
+    def test_middleware_disabled(self):
+        tracer.disable()
+        client = TestClient(TracingMiddleware(Starlette(routes=[Route("/contacts", endpoint)])))
+        self.assertNotIn("x-trace-id", client.get("/contacts").headers)
+
+
+if __name__ == '__main__':
+    unittest.main()